@@ -0,0 +1,134 @@
+# 组提交性能测试
+# 多个线程模拟并发收银（每笔结算：扣库存 + 写销售记录），比较：
+#   direct       每次调用自开连接、单独提交（组提交之前的写法）
+#   batch=1      单写线程，每个任务单独提交
+#   batch=N      单写线程，合并已到达的任务（当前默认）
+#   batch=N/Xms  单写线程，组提交窗口 X 毫秒
+# 输出吞吐量、延迟分位数与平均批量。数据库建在临时目录中，不影响正式数据。
+# 用法：python benchmarks/group_commit.py [--threads 16] [--writes 200] [--configs direct,1,64,64/2,64/5]
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from store_core import db_writer  # noqa: E402
+from store_core.data_access import DatabaseManager, SalesDAO  # noqa: E402
+
+
+class DirectWriter:
+    """对照组：每次写入自开连接、单独提交"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.batches = self.tasks = 0
+        self._lock = threading.Lock()
+
+    def submit(self, work):
+        """在调用线程上直接执行，返回已完成的 Future（与 DatabaseWriter.submit 接口一致）"""
+        future = Future()
+        try:
+            future.set_result(self.execute(work))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def execute(self, work, timeout=None):
+        conn = sqlite3.connect(self.db_path, isolation_level=None, timeout=30)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(conn)
+            except db_writer.RollbackWork as e:
+                conn.execute("ROLLBACK")
+                return e.result
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        with self._lock:
+            self.batches += 1
+            self.tasks += 1
+        return result
+
+    def close(self):
+        pass
+
+
+def make_writer(db_path, config):
+    if config == "direct":
+        return DirectWriter(db_path)
+    max_batch, _, window_ms = config.partition("/")
+    return db_writer.DatabaseWriter(db_path, max_batch=int(max_batch), window=float(window_ms or 0) / 1000)
+
+
+def run(db_manager, config, threads, writes):
+    writer = make_writer(db_manager.db_name, config)
+    db_manager.writer = writer  # DAO 的写入经由 db_manager.write 交给被测写入方式
+    sales_dao = SalesDAO(db_manager)
+    latencies = [[] for _ in range(threads)]
+    start = threading.Barrier(threads + 1)
+
+    def cashier(index):
+        start.wait()
+        for i in range(writes):
+            product_id = f"bench{(index * writes + i) % 100:03d}"
+            started = time.perf_counter()
+            success, message = sales_dao.checkout([(product_id, "测试商品", 1, 9.9)])
+            latencies[index].append(time.perf_counter() - started)
+            if not success:
+                raise RuntimeError(message)
+
+    workers = [threading.Thread(target=cashier, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    start.wait()
+    started = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    writer.close()
+    samples = sorted(latency for per_thread in latencies for latency in per_thread)
+
+    def percentile(p):
+        return samples[min(len(samples) - 1, int(len(samples) * p))] * 1000
+
+    return {"config": config, "writes_per_second": round(len(samples) / elapsed, 1),
+            "p50_ms": round(percentile(0.50), 2), "p95_ms": round(percentile(0.95), 2),
+            "p99_ms": round(percentile(0.99), 2), "avg_batch": round(writer.tasks / max(writer.batches, 1), 1)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="组提交吞吐量与延迟测试")
+    parser.add_argument("--threads", type=int, default=16, help="并发收银线程数")
+    parser.add_argument("--writes", type=int, default=200, help="每个线程的结算笔数")
+    parser.add_argument("--configs", default="direct,1,64,64/2,64/5",
+                        help="逗号分隔：direct 或 批量[/窗口毫秒]")
+    parser.add_argument("--dir", help="临时数据库所在目录（应与正式数据库位于同类磁盘，fsync 开销才有可比性）")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="group-commit-", dir=args.dir)
+    try:
+        db_manager = DatabaseManager(os.path.join(workdir, "bench.db"), os.path.join(workdir, "photos"))
+        db_manager.write(lambda conn: conn.executemany(
+            "INSERT INTO products (product_id, name, price, quantity, category, staff_id) VALUES (?, ?, 9.9, ?, ?, ?)",
+            [(f"bench{i:03d}", "测试商品", 10 ** 9, "测试", "staff001") for i in range(100)]))
+        print(f"{'写入方式':<12}{'笔/秒':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'平均批量':>10}")
+        for config in args.configs.split(","):
+            result = run(db_manager, config.strip(), args.threads, args.writes)
+            print(f"{result['config']:<14}{result['writes_per_second']:>10}{result['p50_ms']:>10}"
+                  f"{result['p95_ms']:>10}{result['p99_ms']:>10}{result['avg_batch']:>10}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
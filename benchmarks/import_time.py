@@ -0,0 +1,74 @@
+# 启动导入耗时测试
+# 用 python -X importtime 在全新进程中测量各入口的导入开销（取多次运行的中位数），并列出最重的顶层依赖。
+# 对界面脚本只执行其模块顶层的 import 语句（不运行 Streamlit 页面），即每个会话进程冷启动时必须支付的导入成本。
+# 用法：python benchmarks/import_time.py [入口 ...] [--runs 5] [--top 8] [--json]
+#   入口可以是脚本文件（如 1.py）或模块名（如 store_core.data_access），默认测量界面脚本、数据层与 POS 接口。
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_TARGETS = ["小商店进销存管理系统.py", "store_core.data_access", "pos_api"]
+
+
+def import_code(target):
+    """入口对应的导入代码：脚本取其模块顶层的 import 语句，模块名直接导入"""
+    if not target.endswith(".py"):
+        return f"import {target}"
+    with open(os.path.join(ROOT, target), encoding="utf-8") as f:
+        tree = ast.parse(f.read(), target)
+    imports = [node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+    return "\n".join(ast.unparse(node) for node in imports) or "pass"
+
+
+def measure(code):
+    """在新进程中执行 code，返回 ({顶层模块: 累计微秒}, 总微秒)"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    top_level = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # 缩进一级（两个空格）以内的是直接导入的模块
+        if len(name) - len(name.lstrip()) <= 1:
+            module = name.strip()
+            top_level[module] = top_level.get(module, 0) + int(cumulative)
+    return top_level, sum(top_level.values())
+
+
+def benchmark(target, runs):
+    code = import_code(target)
+    samples = [measure(code) for _ in range(runs)]
+    totals = [total for _, total in samples]
+    median_run = sorted(samples, key=lambda sample: sample[1])[len(samples) // 2][0]
+    return {"target": target, "median_ms": round(statistics.median(totals) / 1000, 1),
+            "min_ms": round(min(totals) / 1000, 1),
+            "modules_ms": {name: round(us / 1000, 1)
+                           for name, us in sorted(median_run.items(), key=lambda item: -item[1])}}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="入口导入耗时（python -X importtime）")
+    parser.add_argument("targets", nargs="*", default=DEFAULT_TARGETS, help="脚本文件或模块名")
+    parser.add_argument("--runs", type=int, default=5, help="每个入口测量的次数")
+    parser.add_argument("--top", type=int, default=8, help="列出最重的顶层依赖数")
+    parser.add_argument("--json", action="store_true", help="输出 JSON")
+    args = parser.parse_args(argv)
+
+    results = [benchmark(target, args.runs) for target in args.targets]
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+    for result in results:
+        print(f"{result['target']}: 中位数 {result['median_ms']} ms（最快 {result['min_ms']} ms）")
+        for name, ms in list(result["modules_ms"].items())[:args.top]:
+            print(f"    {ms:>8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
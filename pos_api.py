@@ -0,0 +1,236 @@
+# 收银终端 HTTP 接口
+# 基于 tornado 的轻量 JSON 接口，供扫码枪、自助收银机等终端查询商品、结算与出入库；直接复用数据访问层，不加载 Streamlit。
+# 查询交给与只读连接池同样大小的线程池（连接池暂时耗尽时只有查询排队，IOLoop 照常处理其他终端）；结算与出入库交给写线程池，
+# 并发的写请求由单写线程合并提交；数据库暂不可用时结算记入本机收银日志（--journal-first 时总是先记日志）。HTTP/1.1 长连接默认保持，/api/products/lookup 一次请求可查询多件商品。
+# 用法：python pos_api.py [--port 8600] [--store 门店编号] [--token 访问密钥] [--terminal 终端编号] [--journal-first]
+import json
+import logging
+import socket
+from concurrent.futures import ThreadPoolExecutor
+
+import tornado.httpserver
+import tornado.ioloop
+import tornado.web
+
+from store_core import read_pool, sales_journal, store_registry
+from store_core.data_access import DatabaseManager, InventoryDAO, ProductDAO, SalesDAO
+
+DEFAULT_PORT = 8600
+WRITE_THREADS = 16          # 同时等待提交的写请求数（越多，单写线程每批合并的任务越多）
+MAX_LOOKUP = 500            # 单次批量查询最多的商品数
+PRODUCT_FIELDS = ("product_id", "name", "price", "quantity", "category", "staff_id", "staff_name", "photo_path", "barcode")
+
+
+def product_json(row):
+    return dict(zip(PRODUCT_FIELDS, row)) if row else None
+
+
+class ApiError(tornado.web.HTTPError):
+    """返回 {"error": message} 的接口错误（中文信息放在响应体中，状态行只用标准原因短语）"""
+
+    def __init__(self, status_code, message):
+        super().__init__(status_code)
+        self.message = message
+
+
+class BaseHandler(tornado.web.RequestHandler):
+    def initialize(self, context):
+        self.context = context
+
+    def prepare(self):
+        token = self.context["token"]
+        if token and self.request.headers.get("Authorization") != f"Bearer {token}":
+            raise ApiError(401, "访问密钥无效")
+
+    def json_body(self):
+        try:
+            body = json.loads(self.request.body or b"{}")
+        except ValueError:
+            raise ApiError(400, "请求体不是合法的 JSON")
+        if not isinstance(body, dict):
+            raise ApiError(400, "请求体应为 JSON 对象")
+        return body
+
+    def write_error(self, status_code, **kwargs):
+        error = kwargs.get("exc_info", (None, None))[1]
+        message = error.message if isinstance(error, ApiError) else self._reason
+        self.finish({"error": message})
+
+    async def run_read(self, func, *args):
+        """查询在读线程池中执行，等待空闲只读连接时不阻塞 IOLoop"""
+        return await tornado.ioloop.IOLoop.current().run_in_executor(self.context["read_executor"], func, *args)
+
+    async def run_write(self, func, *args):
+        """写操作在线程池中执行，等待其所在批次提交，不阻塞 IOLoop"""
+        return await tornado.ioloop.IOLoop.current().run_in_executor(self.context["executor"], func, *args)
+
+
+def positive_int(value, name):
+    if isinstance(value, bool) or not isinstance(value, int) or value <= 0:
+        raise ApiError(400, f"{name} 必须为正整数")
+    return value
+
+
+class HealthHandler(BaseHandler):
+    def get(self):
+        self.write({"status": "ok", "store": self.context["store"].store_id})
+
+
+class ProductHandler(BaseHandler):
+    async def get(self, product_id):
+        product = await self.run_read(self.context["product_dao"].get_product, product_id)
+        if product is None:
+            raise ApiError(404, "商品不存在")
+        self.write(product_json(product))
+
+
+class BarcodeHandler(BaseHandler):
+    async def get(self, barcode):
+        product = await self.run_read(self.context["product_dao"].get_product_by_barcode, barcode)
+        if product is None:
+            raise ApiError(404, "条码未登记")
+        self.write(product_json(product))
+
+
+class SearchHandler(BaseHandler):
+    async def get(self):
+        keyword = self.get_query_argument("q", "")
+        try:
+            limit = max(1, min(int(self.get_query_argument("limit", "20")), 100))
+        except ValueError:
+            raise ApiError(400, "limit 必须为整数")
+        found = await self.run_read(self.context["product_dao"].search, keyword, limit)
+        self.write({"products": [product_json(p) for p in found]})
+
+
+class LookupHandler(BaseHandler):
+    """批量查询：{"product_ids": [...], "barcodes": [...]} -> {"products": {键: 商品}, "missing": [...]}"""
+
+    async def post(self):
+        body = self.json_body()
+        if not all(isinstance(body.get(key, []), list) for key in ("product_ids", "barcodes")):
+            raise ApiError(400, "product_ids 与 barcodes 应为数组")
+        product_ids = [str(p) for p in body.get("product_ids", [])]
+        barcodes = [str(b) for b in body.get("barcodes", [])]
+        if len(product_ids) + len(barcodes) > MAX_LOOKUP:
+            raise ApiError(400, f"单次最多查询 {MAX_LOOKUP} 件商品")
+        products = await self.run_read(self._lookup, product_ids, barcodes)
+        missing = [key for key in product_ids + barcodes if key not in products]
+        self.write({"products": products, "missing": missing})
+
+    def _lookup(self, product_ids, barcodes):
+        product_dao = self.context["product_dao"]
+        found = product_dao.get_products(product_ids) if product_ids else {}
+        products = {product_id: product_json(row) for product_id, row in found.items()}
+        for barcode in barcodes:
+            row = product_dao.get_product_by_barcode(barcode)
+            if row:
+                products[barcode] = product_json(row)
+        return products
+
+
+class CheckoutHandler(BaseHandler):
+    """结算：{"items": [{"product_id": ..., "quantity": ...}, ...]}，价格与名称以数据库为准"""
+
+    async def post(self):
+        items = self.json_body().get("items")
+        if not items or not isinstance(items, list):
+            raise ApiError(400, "items 不能为空")
+        quantities = {}
+        for item in items:
+            if not isinstance(item, dict):
+                raise ApiError(400, "items 中的每一项应为 JSON 对象")
+            product_id = str(item.get("product_id", ""))
+            quantities[product_id] = quantities.get(product_id, 0) + positive_int(item.get("quantity"), "quantity")
+        products = await self.run_read(self.context["product_dao"].get_products, list(quantities))
+        missing = [product_id for product_id in quantities if product_id not in products]
+        if missing:
+            raise ApiError(404, f"商品不存在：{', '.join(missing)}")
+        basket = [(product_id, products[product_id][1], quantity, products[product_id][2])
+                  for product_id, quantity in quantities.items()]
+        success, message = await self.run_write(self.context["sales_dao"].checkout_or_journal, basket,
+                                                self.context["terminal"], self.context["journal_first"])
+        if not success:
+            raise ApiError(409, message)
+        self.write({"ok": True, "message": message,
+                    "total": round(sum(round(price * quantity, 2) for _, _, quantity, price in basket), 2)})
+
+
+class InventoryHandler(BaseHandler):
+    """出入库：{"product_id", "operation_type": "in"/"out", "quantity", "staff_id", "notes"}"""
+
+    async def post(self):
+        body = self.json_body()
+        operation_type = body.get("operation_type")
+        if operation_type not in ("in", "out"):
+            raise ApiError(400, "operation_type 只能为 in 或 out")
+        product_id = str(body.get("product_id", ""))
+        staff_id = str(body.get("staff_id", ""))
+        if not product_id or not staff_id:
+            raise ApiError(400, "product_id 与 staff_id 不能为空")
+        quantity = positive_int(body.get("quantity"), "quantity")
+        success, message = await self.run_write(self.context["inventory_dao"].execute_operation, product_id,
+                                                operation_type, quantity, staff_id, str(body.get("notes", "")))
+        if not success:
+            raise ApiError(409, message)
+        self.write({"ok": True, "message": message})
+
+
+def make_app(store, token=None, terminal=None, journal_first=None):
+    db_manager = DatabaseManager(store.db_path, store.photo_dir)
+    context = {
+        "store": store,
+        "token": token,
+        "terminal": terminal or f"api-{socket.gethostname()}",
+        "journal_first": journal_first,
+        "executor": ThreadPoolExecutor(max_workers=WRITE_THREADS, thread_name_prefix="pos-api-write"),
+        "read_executor": ThreadPoolExecutor(max_workers=read_pool.POOL_SIZE, thread_name_prefix="pos-api-read"),
+        "product_dao": ProductDAO(db_manager),
+        "sales_dao": SalesDAO(db_manager),
+        "inventory_dao": InventoryDAO(db_manager),
+    }
+    routes = [
+        (r"/api/health", HealthHandler),
+        (r"/api/products", SearchHandler),
+        (r"/api/products/lookup", LookupHandler),
+        (r"/api/products/([^/]+)", ProductHandler),
+        (r"/api/barcodes/([^/]+)", BarcodeHandler),
+        (r"/api/checkout", CheckoutHandler),
+        (r"/api/inventory", InventoryHandler),
+    ]
+    return tornado.web.Application([(pattern, handler, {"context": context}) for pattern, handler in routes])
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="收银终端 HTTP 接口")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--address", default="0.0.0.0")
+    parser.add_argument("--store", help="门店编号（见 stores.json），默认第一家门店")
+    parser.add_argument("--token", help="访问密钥，设置后请求需带 Authorization: Bearer <密钥>")
+    parser.add_argument("--terminal", help="收银日志使用的终端编号，默认为 api-<本机名>")
+    parser.add_argument("--journal-first", action="store_true", help="结算先记入收银日志，由后台线程补录进数据库")
+    parser.add_argument("--access-log", action="store_true", help="记录每个请求（压测时会明显降低吞吐）")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    logging.getLogger("tornado.access").setLevel(logging.INFO if args.access_log else logging.WARNING)
+    try:
+        store = store_registry.get_store(args.store)
+    except ValueError as e:
+        parser.error(str(e))
+    terminal = args.terminal or f"api-{socket.gethostname()}"
+    try:
+        # 启动时即打开本终端的收银日志：终端编号不合法时直接退出，而不是等到第一笔记日志的结算才返回 500
+        sales_journal.get_journal(terminal, sales_journal.journal_dir_for(store.db_path))
+    except ValueError as e:
+        parser.error(str(e))
+    server = tornado.httpserver.HTTPServer(make_app(store, args.token, terminal, args.journal_first or None), idle_connection_timeout=300)
+    server.listen(args.port, args.address)
+    logging.info("收银接口已启动：%s（%s），端口 %d", store.name, store.db_path, args.port)
+    tornado.ioloop.IOLoop.current().start()
+
+
+if __name__ == "__main__":
+    main()
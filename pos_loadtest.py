@@ -0,0 +1,107 @@
+# 收银接口本地压测
+# 以若干条 HTTP/1.1 长连接并发请求 pos_api.py，统计吞吐量与延迟分位数。
+# 用法：先启动 python pos_api.py，再运行 python pos_loadtest.py [--mode lookup|batch|search|checkout]
+import argparse
+import asyncio
+import json
+import sqlite3
+import time
+
+from store_core import store_registry
+
+
+async def _request(reader, writer, host, method, path, body, token):
+    payload = json.dumps(body).encode() if body is not None else b""
+    headers = [f"{method} {path} HTTP/1.1", f"Host: {host}", f"Content-Length: {len(payload)}"]
+    if body is not None:
+        headers.append("Content-Type: application/json")
+    if token:
+        headers.append(f"Authorization: Bearer {token}")
+    writer.write(("\r\n".join(headers) + "\r\n\r\n").encode() + payload)
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+def _make_request(mode, product_ids, i, batch):
+    product_id = product_ids[i % len(product_ids)]
+    if mode == "lookup":
+        return "GET", f"/api/products/{product_id}", None
+    if mode == "batch":
+        ids = [product_ids[(i * batch + j) % len(product_ids)] for j in range(batch)]
+        return "POST", "/api/products/lookup", {"product_ids": ids}
+    if mode == "search":
+        return "GET", f"/api/products?q={product_id[:2]}&limit=10", None
+    return "POST", "/api/checkout", {"items": [{"product_id": product_id, "quantity": 1}]}
+
+
+async def _worker(host, port, mode, product_ids, counter, total, batch, token, latencies, statuses):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while counter[0] < total:
+            i = counter[0]
+            counter[0] += 1
+            method, path, body = _make_request(mode, product_ids, i, batch)
+            started = time.perf_counter()
+            status = await _request(reader, writer, host, method, path, body, token)
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+    finally:
+        writer.close()
+
+
+async def run(host, port, mode, product_ids, connections, total, batch, token):
+    latencies = []
+    statuses = {}
+    counter = [0]
+    started = time.perf_counter()
+    await asyncio.gather(*(_worker(host, port, mode, product_ids, counter, total, batch, token, latencies, statuses)
+                           for _ in range(connections)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    return {"requests": len(latencies), "seconds": round(elapsed, 3),
+            "requests_per_second": round(len(latencies) / elapsed, 1),
+            "products_per_second": round(len(latencies) * (batch if mode == "batch" else 1) / elapsed, 1),
+            "p50_ms": round(percentile(0.50), 3), "p95_ms": round(percentile(0.95), 3),
+            "p99_ms": round(percentile(0.99), 3), "statuses": statuses}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="收银接口压测（HTTP/1.1 长连接）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--mode", choices=["lookup", "batch", "search", "checkout"], default="lookup")
+    parser.add_argument("--connections", type=int, default=32, help="并发长连接数")
+    parser.add_argument("--requests", type=int, default=20000, help="请求总数")
+    parser.add_argument("--batch", type=int, default=20, help="batch 模式每个请求查询的商品数")
+    parser.add_argument("--db", default=store_registry.get_store().db_path, help="读取商品ID用的数据库文件（只读）")
+    parser.add_argument("--token", help="访问密钥")
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+    try:
+        condition = "WHERE quantity > 0" if args.mode == "checkout" else ""
+        product_ids = [row[0] for row in conn.execute(f"SELECT product_id FROM products {condition} LIMIT 1000")]
+    finally:
+        conn.close()
+    if not product_ids:
+        parser.error("数据库中没有可用的商品")
+    result = asyncio.run(run(args.host, args.port, args.mode, product_ids, args.connections, args.requests,
+                             args.batch, args.token))
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
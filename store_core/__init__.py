@@ -0,0 +1,5 @@
+# 进销存核心包
+# 数据访问层与后台任务（单写线程、只读连接池、备份、维护、收银日志、连锁汇总等），不依赖 Streamlit，
+# Streamlit 界面、POS 接口服务与批处理脚本共用。本文件不导入任何子模块，按需导入即可：
+#   from store_core.data_access import DatabaseManager, ProductDAO
+# 命令行：python -m store_core <命令> ...（导入导出、维护、备份、性能测试等，见 python -m store_core -h）
@@ -0,0 +1,184 @@
+# 命令行入口：python -m store_core <命令> [参数]
+# 每个命令只导入自己用到的模块（不加载 Streamlit / pandas / Matplotlib），适合计划任务与夜间批处理调用。
+import csv
+import json
+import sqlite3
+import sys
+import time
+
+# 由各模块自带命令行处理的命令：命令 -> (模块, 说明)
+MODULE_COMMANDS = {
+    "backup": ("db_backup", "在线备份、列出、校验与恢复"),
+    "maintenance": ("db_maintenance", "数据库维护（统计信息、增量回收、WAL 检查点）"),
+    "sync-journal": ("sales_journal", "把收银日志补录进数据库"),
+    "chain-report": ("consolidated_report", "连锁汇总报表"),
+    "migrate-storage": ("storage_format", "迁移为紧凑存储格式"),
+}
+
+# 导出的数据集：名称 -> (DAO 类名, 逐批读取的方法名, 表头)；边读边写，内存占用与表大小无关
+EXPORTS = {
+    "products": ("ProductDAO", "iter_products",
+                 ["商品ID", "商品名称", "单价", "库存数量", "类别", "负责员工ID", "负责员工", "照片路径", "条码",
+                  "补货阈值", "预警线"]),
+    "sales": ("SalesDAO", "iter_sales", ["销售ID", "商品ID", "商品名称", "数量", "单价", "总价", "销售时间"]),
+    "operations": ("InventoryDAO", "iter_operations",
+                   ["操作ID", "商品ID", "商品名称", "操作类型", "数量", "操作时间", "操作员工", "备注", "结存",
+                    "补货阈值", "预警线"]),
+    "staff": ("StaffDAO", "iter_staff", ["员工ID", "姓名", "职位"]),
+}
+
+# 导入商品的 CSV 列（表头行必须包含前五列，其余可省略）
+IMPORT_COLUMNS = ["商品ID", "商品名称", "单价", "库存数量", "类别", "负责员工ID", "条码", "补货阈值"]
+DEFAULT_IMPORT_STAFF = "staff001"
+
+
+def _open_database(args):
+    from . import data_access, store_registry
+
+    db_path = args.db or store_registry.get_store(args.store).db_path
+    return data_access, data_access.DatabaseManager(db_path)
+
+
+def _close_database(db_manager):
+    # 等待写线程提交完毕再退出，避免计划任务结束时丢失最后一批写入
+    db_manager.writer.close()
+
+
+def export_command(args):
+    data_access, db_manager = _open_database(args)
+    dao_name, method, header = EXPORTS[args.dataset]
+    batches = getattr(getattr(data_access, dao_name)(db_manager), method)(
+        batch_size=args.batch_size or data_access.ITER_BATCH_SIZE, batches=True)
+    output = open(args.output, "w", newline="", encoding="utf-8-sig") if args.output else sys.stdout
+    count = 0
+    try:
+        writer = csv.writer(output)
+        writer.writerow(header)
+        for rows in batches:
+            writer.writerows(rows)
+            count += len(rows)
+    finally:
+        batches.close()
+        if args.output:
+            output.close()
+    _close_database(db_manager)
+    print(f"已导出 {count} 行", file=sys.stderr)
+    return 0
+
+
+def import_command(args):
+    rows = []
+    with open(args.file, newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        missing = [column for column in IMPORT_COLUMNS[:5] if column not in (reader.fieldnames or [])]
+        if missing:
+            print(f"缺少列：{', '.join(missing)}", file=sys.stderr)
+            return 1
+        for line_number, record in enumerate(reader, start=2):
+            try:
+                reorder_point = record.get("补货阈值") or None
+                rows.append((record["商品ID"].strip(), record["商品名称"].strip(), float(record["单价"]),
+                             int(record["库存数量"]), record["类别"].strip(),
+                             record.get("负责员工ID") or args.staff, (record.get("条码") or "").strip(),
+                             int(reorder_point) if reorder_point else None))
+            except ValueError as e:
+                print(f"第 {line_number} 行格式错误：{e}", file=sys.stderr)
+                return 1
+    data_access, db_manager = _open_database(args)
+    try:
+        inserted, updated = data_access.ProductDAO(db_manager).import_products(rows)
+    except sqlite3.IntegrityError as e:
+        print(f"导入失败，未做任何修改：{e}", file=sys.stderr)
+        return 1
+    finally:
+        _close_database(db_manager)
+    print(f"新增 {inserted} 件商品，更新 {updated} 件商品")
+    return 0
+
+
+def _timed(func, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return round((time.perf_counter() - started) / repeat * 1000, 3), result
+
+
+def bench_command(args):
+    """常用查询的耗时（毫秒，取 repeat 次平均），包括导入数据层与打开数据库的启动开销"""
+    started = time.perf_counter()
+    from . import data_access, store_registry
+
+    import_ms = round((time.perf_counter() - started) * 1000, 3)
+    db_path = args.db or store_registry.get_store(args.store).db_path
+    open_ms, db_manager = _timed(lambda: data_access.DatabaseManager(db_path), 1)
+    product_dao = data_access.ProductDAO(db_manager)
+    products = product_dao.get_all_products()
+    sample = [p[0] for p in products[:100]] or ["p001"]
+    result = {"import_ms": import_ms, "open_database_ms": open_ms, "products": len(products)}
+    cases = {
+        "get_product": lambda: [product_dao.get_product(product_id) for product_id in sample],
+        "get_products_batch": lambda: product_dao.get_products(sample),
+        "search": lambda: product_dao.search(sample[0][:2], 20),
+        "get_all_products": product_dao.get_all_products,
+        "get_all_sales": data_access.SalesDAO(db_manager).get_all_sales,
+        "get_all_operations": data_access.InventoryDAO(db_manager).get_all_operations,
+    }
+    for name, func in cases.items():
+        elapsed, rows = _timed(func, args.repeat)
+        result[f"{name}_ms"] = round(elapsed / len(sample), 4) if name == "get_product" else elapsed
+    _close_database(db_manager)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0
+
+
+def _add_database_options(parser):
+    parser.add_argument("--store", help="门店编号（见 stores.json），默认第一家门店")
+    parser.add_argument("--db", help="数据库文件路径（优先于 --store）")
+
+
+def main(argv=None):
+    import argparse
+
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in MODULE_COMMANDS:
+        import importlib
+
+        module = importlib.import_module(f".{MODULE_COMMANDS[argv[0]][0]}", __package__)
+        return module.main(argv[1:])
+
+    parser = argparse.ArgumentParser(prog="python -m store_core", description="小商店进销存命令行工具",
+                                     epilog="其他命令：" + "；".join(f"{name}（{help_text}）" for name, (_, help_text)
+                                                                in MODULE_COMMANDS.items()))
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="导出数据为 CSV")
+    export_parser.add_argument("dataset", choices=list(EXPORTS))
+    export_parser.add_argument("-o", "--output", help="输出文件，默认输出到标准输出")
+    export_parser.add_argument("--batch-size", type=int, help="每次从数据库读取的行数（默认 1000）")
+    _add_database_options(export_parser)
+    export_parser.set_defaults(func=export_command)
+
+    import_parser = commands.add_parser("import-products", help="从 CSV 批量导入商品（已存在的商品覆盖更新）")
+    import_parser.add_argument("file", help=f"CSV 文件，列：{', '.join(IMPORT_COLUMNS)}")
+    import_parser.add_argument("--staff", default=DEFAULT_IMPORT_STAFF, help="未填写负责员工时使用的员工ID")
+    _add_database_options(import_parser)
+    import_parser.set_defaults(func=import_command)
+
+    bench_parser = commands.add_parser("bench", help="常用查询耗时测试")
+    bench_parser.add_argument("--repeat", type=int, default=5, help="每项重复次数")
+    _add_database_options(bench_parser)
+    bench_parser.set_defaults(func=bench_command)
+
+    args = parser.parse_args(argv)
+    if not args.db:
+        from . import store_registry
+
+        try:
+            store_registry.get_store(args.store)
+        except ValueError as e:
+            parser.error(str(e))
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+# 商品目录列式快照
+# 进程内共享一份商品目录的 NumPy 列式副本：价格 float32、库存 int32，类别与录入人员编码为整数，
+# 供库存估值、TOP-N 排行与类别汇总直接做向量运算。快照依据 change_log 表（由商品表触发器写入）
+# 只重新读取变化过的商品，不必每次全表加载。
+# 刷新在调用方的只读快照上进行（DatabaseManager.read_snapshot），报表的图表与导出数据来自同一时刻。
+import threading
+
+import numpy as np
+
+INITIAL_CAPACITY = 1024
+FULL_RELOAD_RATIO = 0.25    # 变化商品超过快照规模的该比例时，直接全量重载
+IN_CHUNK = 500              # 按ID批量读取商品时每条 IN 查询的参数个数
+
+
+class CatalogSnapshot:
+    def __init__(self, db_path, conn):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self.last_seq = 0
+        self._loaded = False
+        self._reset(0)
+        self.refresh(conn)
+
+    def _reset(self, capacity):
+        capacity = max(capacity, INITIAL_CAPACITY)
+        self._ids = np.empty(capacity, dtype=object)
+        self._names = np.empty(capacity, dtype=object)
+        self._price = np.zeros(capacity, dtype=np.float32)
+        self._quantity = np.zeros(capacity, dtype=np.int32)
+        self._category = np.zeros(capacity, dtype=np.int32)
+        self._staff = np.zeros(capacity, dtype=np.int32)
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._size = 0
+        self._index = {}
+        self.categories = []
+        self.staff = []
+        self._category_codes = {}
+        self._staff_codes = {}
+
+    def __len__(self):
+        return len(self._index)
+
+    # ---------- 刷新 ----------
+    def refresh(self, conn):
+        """在 conn 的读事务（快照）中读取上次刷新以来的变化并合并进快照，返回重新读取的商品数；
+        快照已合并了比 conn 更新的变化（无法回退到 conn 的时刻）时返回 None"""
+        first_seq, last_seq = conn.execute("SELECT MIN(seq), MAX(seq) FROM change_log").fetchone()
+        last_seq = last_seq or 0
+        with self._lock:
+            if self._loaded and last_seq <= self.last_seq:
+                return 0 if last_seq == self.last_seq else None
+            # 首次加载，或日志已被裁剪到上次刷新位置之后：全量重载
+            if not self._loaded or (first_seq or 0) > self.last_seq + 1:
+                count = self._load_all(conn)
+            else:
+                changed = [row[0] for row in conn.execute(
+                    "SELECT DISTINCT row_key FROM change_log WHERE table_name = 'products' AND seq > ? AND seq <= ?",
+                    (self.last_seq, last_seq))]
+                if len(changed) > max(len(self._index), INITIAL_CAPACITY) * FULL_RELOAD_RATIO:
+                    count = self._load_all(conn)
+                else:
+                    count = self._load_changed(conn, changed)
+            self.last_seq = last_seq
+            self._loaded = True
+        return count
+
+    def _load_all(self, conn):
+        rows = conn.execute("SELECT product_id, name, price, quantity, category, staff_id FROM products").fetchall()
+        self._reset(len(rows) * 2)
+        if not rows:
+            return 0
+        ids, names, prices, quantities, categories, staff = zip(*rows)
+        n = len(rows)
+        self._ids[:n] = ids
+        self._names[:n] = names
+        self._price[:n] = prices
+        self._quantity[:n] = quantities
+        self._category[:n] = self._encode(categories, self.categories, self._category_codes)
+        self._staff[:n] = self._encode(staff, self.staff, self._staff_codes)
+        self._alive[:n] = True
+        self._size = n
+        self._index = {product_id: i for i, product_id in enumerate(ids)}
+        return n
+
+    def _load_changed(self, conn, product_ids):
+        found = set()
+        for start in range(0, len(product_ids), IN_CHUNK):
+            chunk = product_ids[start:start + IN_CHUNK]
+            rows = conn.execute(
+                f"SELECT product_id, name, price, quantity, category, staff_id FROM products "
+                f"WHERE product_id IN ({','.join('?' * len(chunk))})", chunk).fetchall()
+            for product_id, name, price, quantity, category, staff_id in rows:
+                found.add(product_id)
+                i = self._index.get(product_id)
+                if i is None:
+                    i = self._append_slot()
+                    self._index[product_id] = i
+                    self._ids[i] = product_id
+                    self._alive[i] = True
+                self._names[i] = name
+                self._price[i] = price
+                self._quantity[i] = quantity
+                self._category[i] = self._code(category, self.categories, self._category_codes)
+                self._staff[i] = self._code(staff_id, self.staff, self._staff_codes)
+        for product_id in product_ids:
+            if product_id not in found:
+                i = self._index.pop(product_id, None)
+                if i is not None:
+                    self._alive[i] = False
+                    self._ids[i] = self._names[i] = None
+        if self._size > 2 * max(len(self._index), INITIAL_CAPACITY):
+            self._compact()
+        return len(product_ids)
+
+    def _append_slot(self):
+        if self._size == len(self._alive):
+            capacity = len(self._alive) * 2
+            for name in ("_ids", "_names", "_price", "_quantity", "_category", "_staff", "_alive"):
+                old = getattr(self, name)
+                new = np.zeros(capacity, dtype=old.dtype) if old.dtype != object else np.empty(capacity, dtype=object)
+                new[:len(old)] = old
+                setattr(self, name, new)
+        self._size += 1
+        return self._size - 1
+
+    def _compact(self):
+        # 删除较多时去掉空位，保持数组紧凑
+        keep = np.flatnonzero(self._alive[:self._size])
+        for name in ("_ids", "_names", "_price", "_quantity", "_category", "_staff", "_alive"):
+            old = getattr(self, name)
+            new = np.zeros(max(len(keep) * 2, INITIAL_CAPACITY), dtype=old.dtype) if old.dtype != object \
+                else np.empty(max(len(keep) * 2, INITIAL_CAPACITY), dtype=object)
+            new[:len(keep)] = old[keep]
+            setattr(self, name, new)
+        self._size = len(keep)
+        self._index = {product_id: i for i, product_id in enumerate(self._ids[:self._size])}
+
+    @staticmethod
+    def _code(value, labels, codes):
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(labels)
+            labels.append(value)
+        return code
+
+    @classmethod
+    def _encode(cls, values, labels, codes):
+        return np.fromiter((cls._code(v, labels, codes) for v in values), dtype=np.int32, count=len(values))
+
+    # ---------- 查询 ----------
+    def _columns(self):
+        # 价格按分取整还原为 float64，避免 float32 误差累积到估值中；没有空位时直接使用切片视图
+        n = self._size
+        price = np.round(self._price[:n].astype(np.float64), 2)
+        if len(self._index) == n:
+            return price, self._quantity[:n], self._category[:n], np.arange(n)
+        alive = self._alive[:n]
+        return price[alive], self._quantity[:n][alive], self._category[:n][alive], np.flatnonzero(alive)
+
+    def valuation(self):
+        """库存总价值（价格 × 数量之和）"""
+        with self._lock:
+            price, quantity, _, _ = self._columns()
+            return float(np.dot(price, quantity))
+
+    def category_totals(self, by="quantity"):
+        """按类别汇总库存数量（by="quantity"）或库存价值（by="value"），返回 {类别: 合计}，不含合计为0的类别"""
+        with self._lock:
+            price, quantity, category, _ = self._columns()
+            weights = quantity.astype(np.float64)
+            if by == "value":
+                weights *= price
+            totals = np.bincount(category, weights=weights, minlength=len(self.categories))
+            return {self.categories[code]: float(totals[code]) for code in np.flatnonzero(totals)}
+
+    def top_n(self, n, by="value"):
+        """库存价值（by="value"）或数量（by="quantity"）最高的 n 个商品：[(商品ID, 名称, 数值), ...]"""
+        with self._lock:
+            price, quantity, _, rows = self._columns()
+            values = price * quantity if by == "value" else quantity
+            n = min(n, len(values))
+            if n == 0:
+                return []
+            top = np.argpartition(values, len(values) - n)[len(values) - n:]
+            top = top[np.argsort(values[top], kind="stable")[::-1]]
+            return [(self._ids[rows[i]], self._names[rows[i]], values[i].item()) for i in top]
+
+    def prices(self):
+        """全部商品的单价数组（副本）"""
+        with self._lock:
+            return self._columns()[0].copy()
+
+    def memory_bytes(self):
+        """数值列与编码列占用的字节数（不含商品ID/名称字符串本身）"""
+        with self._lock:
+            return sum(getattr(self, name).nbytes for name in
+                       ("_ids", "_names", "_price", "_quantity", "_category", "_staff", "_alive"))
+
+
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+
+def get_snapshot(db_path, conn):
+    """返回该数据库的进程级共享快照，并合并到 conn 所在读事务（只读快照或报表副本）的时刻。
+    共享快照已被其他会话刷新到更晚的时刻时，为本次读取单独加载一份，保证与 conn 上的其他查询一致"""
+    with _snapshots_lock:
+        snapshot = _snapshots.get(db_path)
+        if snapshot is None:
+            snapshot = _snapshots[db_path] = CatalogSnapshot(db_path, conn)
+            return snapshot
+    if snapshot.refresh(conn) is None:
+        return CatalogSnapshot(db_path, conn)
+    return snapshot
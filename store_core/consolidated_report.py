@@ -0,0 +1,177 @@
+# 连锁汇总报表
+# 各门店的销售 / 库存部分汇总在进程池中并行计算（每个进程只读打开一家门店的数据库），
+# 主进程合并各店的部分汇总得到全连锁合计，总耗时约等于最慢一家门店的耗时。
+# 本模块只依赖标准库与数据访问层（补货阈值默认值取自 data_access），工作进程启动时不会导入 Streamlit / pandas。
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from .data_access import DEFAULT_REORDER_POINT
+
+UNCATEGORIZED = "未分类"
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _pool():
+    """进程级共享的进程池；使用 spawn 启动，避免在多线程的服务进程里 fork"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=os.cpu_count() or 2,
+                                            mp_context=multiprocessing.get_context("spawn"))
+        return _executor
+
+
+def _connect(db_path):
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"数据库不存在：{db_path}")
+    return sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+
+
+def _epoch(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.strptime(value, "%Y-%m-%d")
+    return int(value.timestamp())
+
+
+def store_sales_summary(db_path, since=None, until=None):
+    """单店销售部分汇总（在工作进程中执行）；since / until 为 datetime 或 "YYYY-MM-DD"，until 不含"""
+    started = time.perf_counter()
+    conditions, params = [], []
+    if since is not None:
+        conditions.append("sold_at >= ?")
+        params.append(_epoch(since))
+    if until is not None:
+        conditions.append("sold_at < ?")
+        params.append(_epoch(until))
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    conn = _connect(db_path)
+    try:
+        cursor = conn.cursor()
+        # 先在明细表上按商品键聚合（一次顺序扫描、不做关联），再把少量聚合结果与商品维表关联
+        cursor.execute(f'''
+            SELECT k.product_id, COALESCE(p.name, k.name), COALESCE(p.category, ?), a.orders, a.quantity, a.revenue
+            FROM (SELECT product_key, COUNT(*) AS orders, SUM(quantity) AS quantity, SUM(total_price) AS revenue
+                  FROM sales_data {where} GROUP BY product_key) a
+            JOIN product_keys k ON k.product_key = a.product_key
+            LEFT JOIN products p ON p.product_id = k.product_id
+        ''', [UNCATEGORIZED] + params)
+        by_product = {}
+        by_category = {}
+        for product_id, name, category, orders, quantity, revenue in cursor.fetchall():
+            by_product[product_id] = {"name": name, "orders": orders, "quantity": quantity, "revenue": revenue}
+            totals = by_category.setdefault(category, {"quantity": 0, "revenue": 0.0})
+            totals["quantity"] += quantity
+            totals["revenue"] += revenue
+        # 按整点小时聚合（整数运算），再在 Python 中换算为本地日期
+        cursor.execute(f"SELECT sold_at / 3600, SUM(total_price) FROM sales_data {where} GROUP BY 1", params)
+        by_day = {}
+        for hour, revenue in cursor.fetchall():
+            day = datetime.fromtimestamp(hour * 3600).strftime("%Y-%m-%d")
+            by_day.setdefault(day, {"revenue": 0.0})["revenue"] += revenue
+    finally:
+        conn.close()
+    return {"orders": sum(p["orders"] for p in by_product.values()),
+            "quantity": sum(p["quantity"] for p in by_product.values()),
+            "revenue": sum(p["revenue"] for p in by_product.values()),
+            "by_day": by_day, "by_product": by_product, "by_category": by_category,
+            "seconds": round(time.perf_counter() - started, 3)}
+
+
+def store_inventory_summary(db_path, reorder_default=DEFAULT_REORDER_POINT):
+    """单店库存部分汇总（在工作进程中执行）"""
+    started = time.perf_counter()
+    conn = _connect(db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT COALESCE(p.category, ?), COUNT(*), SUM(p.quantity), SUM(p.price * p.quantity),
+                   SUM(p.quantity <= COALESCE(p.reorder_point, c.reorder_point, ?))
+            FROM products p
+            LEFT JOIN category_thresholds c ON c.category = p.category
+            GROUP BY 1
+        ''', (UNCATEGORIZED, reorder_default))
+        by_category = {}
+        for category, products, quantity, value, low in cursor.fetchall():
+            by_category[category] = {"products": products, "quantity": quantity, "value": value, "low_stock": low}
+    finally:
+        conn.close()
+    summary = {key: sum(c[key] for c in by_category.values())
+               for key in ("products", "quantity", "value", "low_stock")}
+    summary["by_category"] = by_category
+    summary["seconds"] = round(time.perf_counter() - started, 3)
+    return summary
+
+
+def merge(parts):
+    """合并多家门店的部分汇总：数值相加，嵌套字典按键合并，文本取第一个值"""
+    total = {}
+    for part in parts:
+        _merge_into(total, part)
+    total.pop("seconds", None)
+    return total
+
+
+def _merge_into(total, part):
+    for key, value in part.items():
+        if isinstance(value, dict):
+            _merge_into(total.setdefault(key, {}), value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            total[key] = total.get(key, 0) + value
+        else:
+            total.setdefault(key, value)
+
+
+def consolidate(stores, kind="sales", **options):
+    """在进程池中并行计算各门店的部分汇总并合并：
+    返回 {"kind", "stores": {门店编号: 部分汇总}, "errors": {门店编号: 错误}, "total": 全连锁合计, "seconds"}"""
+    started = time.perf_counter()
+    func = {"sales": store_sales_summary, "inventory": store_inventory_summary}[kind]
+    executor = _pool()
+    futures = {store.store_id: executor.submit(func, store.db_path, **options) for store in stores}
+    per_store = {}
+    errors = {}
+    for store_id, future in futures.items():
+        try:
+            per_store[store_id] = future.result()
+        except Exception as e:
+            errors[store_id] = str(e)
+    return {"kind": kind, "stores": per_store, "errors": errors, "total": merge(per_store.values()),
+            "seconds": round(time.perf_counter() - started, 3)}
+
+
+def main(argv=None):
+    import argparse
+
+    from . import store_registry
+
+    parser = argparse.ArgumentParser(description="连锁汇总报表（各门店并行计算）")
+    parser.add_argument("kind", choices=["sales", "inventory"])
+    parser.add_argument("--registry", default=store_registry.REGISTRY_FILE, help="门店登记文件")
+    parser.add_argument("--since", help="销售起始日期 YYYY-MM-DD")
+    parser.add_argument("--until", help="销售截止日期 YYYY-MM-DD（不含）")
+    args = parser.parse_args(argv)
+
+    stores = store_registry.load_stores(args.registry)
+    options = {"since": args.since, "until": args.until} if args.kind == "sales" else {}
+    result = consolidate(stores, args.kind, **options)
+    value_key = "revenue" if args.kind == "sales" else "value"
+    for store in stores:
+        part = result["stores"].get(store.store_id)
+        if part is None:
+            print(f"{store.store_id}\t{store.name}\t失败：{result['errors'][store.store_id]}")
+        else:
+            print(f"{store.store_id}\t{store.name}\t{part[value_key]:.2f}\t{part['seconds']}s")
+    print(f"合计\t\t{result['total'].get(value_key, 0):.2f}\t{result['seconds']}s")
+
+
+if __name__ == "__main__":
+    main()
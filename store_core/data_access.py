@@ -0,0 +1,969 @@
+# 数据访问层
+# 数据库管理（建表、迁移、触发器）与各数据访问对象（DAO），不依赖 Streamlit / pandas / Matplotlib，
+# 供 Streamlit 界面、POS 接口服务与命令行脚本共用；依赖 numpy 的模块在用到时才导入，批处理脚本启动不受影响。
+import os
+import sqlite3
+from collections import namedtuple
+from datetime import datetime
+
+from . import db_maintenance, db_writer, read_pool, sales_journal, storage_format
+
+# 程序目录（store_core 包的上一级）
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PHOTO_DIR = os.path.join(BASE_DIR, "product_photos")
+DB_FILE = os.path.join(BASE_DIR, "store_management.db")
+
+# 库存阈值默认值（商品与类别均未设置时使用）
+DEFAULT_REORDER_POINT = 5    # 库存 ≤ 补货阈值：需补货（红色）
+DEFAULT_WARNING_LEVEL = 30   # 库存 ≤ 预警线：偏低（黄色）
+
+# 报表统计读取的副本文件（定期从主库复制，多门店时文件名后附门店编号）；为 None 时报表直接在主库的只读快照上查询
+REPORT_REPLICA_FILE = None
+
+# 结算先写入本机收银日志再由后台线程批量补录进数据库（收银不等待数据库）；为 False 时直接写库，
+# 仅在数据库不可用时改写收银日志
+JOURNAL_FIRST = False
+# 直接写库的结算最多等待写线程的时间（秒）：数据库被锁、写线程积压或已停止时，超时后改写收银日志
+CHECKOUT_TIMEOUT = 2.0
+
+# 组提交：写线程收到一批的第一个写任务后最多再等待 GROUP_COMMIT_WINDOW 秒收集并发写入，每批最多 GROUP_COMMIT_BATCH 个任务；
+# 窗口为 0 时只合并已到达的任务。仅当提交（fsync）明显慢于窗口时（如网络盘、机械盘）才值得设为 0.002～0.005，
+# 可先用 benchmarks/group_commit.py 在目标磁盘上测量
+GROUP_COMMIT_WINDOW = 0.0
+GROUP_COMMIT_BATCH = 64
+
+# 商品更新结果（乐观并发控制）
+UPDATE_OK = "ok"
+UPDATE_CONFLICT = "conflict"     # 版本号已变化（他人先保存了修改），重新加载后可重试
+UPDATE_NOT_FOUND = "not_found"
+UPDATE_DUPLICATE = "duplicate"   # 条码已被其他商品使用
+
+# 逐批读取（iter_* 方法）时每次 fetchmany 的行数
+ITER_BATCH_SIZE = 1000
+
+# 商品变更（get_product_changes 的结果）：seq 为已读到的变更日志序号；full=True 时 frame 为全部商品（需整体替换），
+# 否则 frame 只含 seq 之后新增或修改的商品，deleted 为其间删除的商品ID
+ProductChanges = namedtuple("ProductChanges", ["seq", "frame", "deleted", "full"])
+
+# 本地时间的秒数（把本地时间当作 UTC 计算的 Unix 秒），转为 datetime64 后即为本地时间，不必逐行生成时间字符串
+LOCAL_SECONDS = "CAST(strftime('%s', {}, 'unixepoch', 'localtime') AS INTEGER)"
+
+def _frame(cursor, columns, datetime_columns=()):
+    """把查询结果按列构造为 pandas DataFrame（数值列保持数值类型，datetime_columns 中的本地时间秒数转为 datetime64）；
+    pandas 在此时才导入，数据层的其余部分不依赖它"""
+    import pandas as pd
+    frame = pd.DataFrame.from_records(cursor.fetchall(), columns=columns)
+    for column in datetime_columns:
+        frame[column] = pd.to_datetime(frame[column], unit="s")
+    return frame
+
+
+def _iter_rows(db_manager, select, batch_size=ITER_BATCH_SIZE, batches=False):
+    """在独占的只读快照中执行 select(conn) 得到游标，用 fetchmany 每次取 batch_size 行，逐行（batches=True 时逐批）产出，
+    内存占用与表大小无关。第一次取值时才占用连接，读完、生成器被 close() 或回收时归还；
+    中途放弃时应调用 close()（或用 contextlib.closing 包装），以免连接长时间占用"""
+    with db_manager.reads.stream() as conn:
+        cursor = select(conn)
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                if batches:
+                    yield rows
+                else:
+                    yield from rows
+        finally:
+            cursor.close()
+
+# ===================== 数据库管理类 =====================
+class DatabaseManager:
+    def __init__(self, db_name=DB_FILE, photo_dir=PHOTO_DIR, replica_path=REPORT_REPLICA_FILE):
+        self.db_name = db_name
+        self.photo_dir = photo_dir
+        if not os.path.exists(self.photo_dir):
+            os.makedirs(self.photo_dir)
+        self.init_database()
+        self.writer = db_writer.get_writer(self.db_name, max_batch=GROUP_COMMIT_BATCH, window=GROUP_COMMIT_WINDOW)
+        # 写线程空闲时自动执行 ANALYZE / 增量回收 / WAL 检查点等维护
+        self.maintenance = db_maintenance.start_scheduler(self.db_name)
+        # 报表与大列表查询使用的只读连接池
+        self.reads = read_pool.get_pool(self.db_name, replica_path=replica_path)
+        # 收银日志补录线程（数据库不可用期间记入日志的销售，恢复后自动入账）
+        self.journal_dir = sales_journal.journal_dir_for(self.db_name)
+        self.journal_sync = sales_journal.start_sync(self.db_name)
+    
+    def get_connection(self):
+        return sqlite3.connect(self.db_name)
+    
+    def read_snapshot(self, replica=False):
+        """只读连接上的一致性快照（with 语句使用，得到连接）；同一线程内嵌套调用复用外层快照。
+        replica=True 且配置了副本文件时读取副本"""
+        return self.reads.snapshot(replica)
+    
+    def write(self, work, timeout=None):
+        """把写任务 work(conn) 交给单写线程执行，等待其所在批次提交后返回 work 的返回值。
+        给出 timeout 时，超时仍未开始执行的任务被取消并抛出 TimeoutError（保证不会稍后再执行）；
+        已开始执行的任务继续等待其结果"""
+        future = self.writer.submit(work)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            if future.cancel():
+                raise
+            return future.result()
+    
+    def init_database(self):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        # 增量回收空闲页（只对新建的数据库生效，旧库需通过 db_maintenance 命令行切换一次）
+        cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        # WAL 模式：读连接与单写线程互不阻塞（该设置持久保存在数据库文件中）
+        cursor.execute("PRAGMA journal_mode=WAL")
+        
+        # 员工表
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS staff (
+                staff_id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                position TEXT NOT NULL
+            )
+        ''')
+        
+        # 仅当表为空时插入初始数据（避免重复插入）
+        cursor.execute("SELECT COUNT(*) FROM staff")
+        if cursor.fetchone()[0] == 0:
+            staff_members = [
+                ("staff001", "张三", "管理员"),
+                ("staff002", "李四", "收银员"),
+                ("staff003", "王五", "仓库管理员"),
+                ("staff004", "赵六", "采购员")
+            ]
+            cursor.executemany('INSERT INTO staff VALUES (?, ?, ?)', staff_members)
+        
+        # 用户表
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                username TEXT PRIMARY KEY,
+                password TEXT NOT NULL,
+                staff_id TEXT,
+                role TEXT DEFAULT 'user',
+                FOREIGN KEY (staff_id) REFERENCES staff(staff_id)
+            )
+        ''')
+        
+        # 仅当表为空时插入初始数据（避免重复插入）
+        cursor.execute("SELECT COUNT(*) FROM users")
+        if cursor.fetchone()[0] == 0:
+            cursor.execute('INSERT INTO users VALUES (?, ?, ?, ?)', ("user", "123456", "staff001", "admin"))
+            cursor.execute('INSERT INTO users VALUES (?, ?, ?, ?)', ("test", "123456", "staff002", "user"))
+        
+        # 商品表
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS products (
+                product_id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                price REAL NOT NULL,
+                quantity INTEGER NOT NULL,
+                category TEXT NOT NULL,
+                staff_id TEXT NOT NULL,
+                photo_path TEXT,
+                FOREIGN KEY (staff_id) REFERENCES staff(staff_id)
+            )
+        ''')
+        
+        # 仅当表为空时插入初始数据（避免重复插入）
+        cursor.execute("SELECT COUNT(*) FROM products")
+        if cursor.fetchone()[0] == 0:
+            product_list = [
+                ("p001", "土豆", 2.5, 100, "蔬菜", "staff001", ""),
+                ("p002", "鸡肉", 15.8, 50, "肉类", "staff001", ""),
+                ("p003", "牛肉", 38.6, 30, "肉类", "staff001", ""),
+                ("p004", "辣椒", 3.2, 80, "蔬菜", "staff001", ""),
+                ("p005", "面包", 4.5, 60, "食品", "staff001", ""),
+                ("p006", "胡萝卜", 2.8, 70, "蔬菜", "staff001", ""),
+                ("p007", "快餐面", 5.0, 120, "食品", "staff001", ""),
+                ("p008", "牙膏", 9.9, 90, "日用品", "staff001", ""),
+                ("p009", "洗发水", 25.8, 40, "日用品", "staff001", ""),
+                ("p010", "笔记本", 8.5, 75, "文具", "staff001", "")
+            ]
+            cursor.executemany('INSERT INTO products VALUES (?, ?, ?, ?, ?, ?, ?)', product_list)
+        
+        # 销售表与库存操作表：整数代理键 + Unix 秒的紧凑存储，sales / inventory_operations 为兼容视图
+        # （旧库中的同名表在此自动迁移）
+        storage_format.ensure(conn)
+        
+        # 补货建议表（由 demand_forecast 批量计算后整体覆盖）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS reorder_suggestions (
+                product_id TEXT PRIMARY KEY,
+                forecast_daily REAL NOT NULL,
+                moving_average REAL NOT NULL,
+                days_of_cover REAL,
+                suggested_quantity INTEGER NOT NULL,
+                generated_at TEXT NOT NULL
+            )
+        ''')
+        
+        self._update_table_structure(cursor, "users")
+        self._update_table_structure(cursor, "products")
+        self._init_stock_alerts(cursor)
+        self._init_product_search(cursor)
+        self._init_change_log(cursor)
+        self._init_stock_ledger(cursor)
+        sales_journal.ensure_tables(cursor)
+        conn.commit()  # 确保初始数据提交
+        conn.close()
+    
+    def _update_table_structure(self, cursor, table_name):
+        if table_name == "users":
+            cursor.execute(f"PRAGMA table_info({table_name})")
+            columns = [col[1] for col in cursor.fetchall()]
+            if "staff_id" not in columns:
+                cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN staff_id TEXT")
+            if "role" not in columns:
+                cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN role TEXT DEFAULT 'user'")
+        elif table_name == "products":
+            cursor.execute(f"PRAGMA table_info({table_name})")
+            columns = [col[1] for col in cursor.fetchall()]
+            if "barcode" not in columns:
+                cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN barcode TEXT")
+            # 商品级补货阈值，NULL 表示沿用类别默认值
+            if "reorder_point" not in columns:
+                cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN reorder_point INTEGER")
+            # 版本号：每次维护表单保存时加一，用于检测并发修改
+            if "version" not in columns:
+                cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            # 条码唯一索引（未设置条码的商品存为NULL，不参与唯一性约束）
+            cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_products_barcode ON products(barcode)")
+    
+    def _init_stock_alerts(self, cursor):
+        """类别阈值表与库存预警表；预警表由触发器在库存越过阈值时维护，预警面板只读这张小表"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS category_thresholds (
+                category TEXT PRIMARY KEY,
+                reorder_point INTEGER NOT NULL,
+                warning_level INTEGER NOT NULL
+            )
+        ''')
+        exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'stock_alerts'").fetchone()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stock_alerts (
+                product_id TEXT PRIMARY KEY,
+                quantity INTEGER NOT NULL,
+                reorder_point INTEGER NOT NULL,
+                alert_time TEXT NOT NULL
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_products_category ON products(category)")
+        
+        # 生效阈值：商品阈值 > 类别阈值 > 默认值
+        def reorder_point_of(row):
+            return (f"COALESCE({row}.reorder_point, (SELECT reorder_point FROM category_thresholds "
+                    f"WHERE category = {row}.category), {DEFAULT_REORDER_POINT})")
+        
+        def refresh_category(category):
+            return f'''
+                DELETE FROM stock_alerts WHERE product_id IN (SELECT product_id FROM products WHERE category = {category});
+                INSERT INTO stock_alerts (product_id, quantity, reorder_point, alert_time)
+                SELECT p.product_id, p.quantity, {reorder_point_of("p")}, datetime('now', 'localtime')
+                FROM products p WHERE p.category = {category} AND p.quantity <= {reorder_point_of("p")};
+            '''
+        
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS stock_alerts_ai AFTER INSERT ON products
+            WHEN new.quantity <= {reorder_point_of("new")} BEGIN
+                INSERT OR REPLACE INTO stock_alerts (product_id, quantity, reorder_point, alert_time)
+                VALUES (new.product_id, new.quantity, {reorder_point_of("new")}, datetime('now', 'localtime'));
+            END
+        ''')
+        # 仍低于阈值时只更新数量，保留首次预警时间
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS stock_alerts_au AFTER UPDATE OF product_id, quantity, category, reorder_point ON products BEGIN
+                DELETE FROM stock_alerts WHERE product_id = old.product_id
+                    AND (old.product_id != new.product_id OR new.quantity > {reorder_point_of("new")});
+                INSERT INTO stock_alerts (product_id, quantity, reorder_point, alert_time)
+                SELECT new.product_id, new.quantity, {reorder_point_of("new")}, datetime('now', 'localtime')
+                WHERE new.quantity <= {reorder_point_of("new")}
+                ON CONFLICT(product_id) DO UPDATE SET quantity = excluded.quantity, reorder_point = excluded.reorder_point;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS stock_alerts_ad AFTER DELETE ON products BEGIN
+                DELETE FROM stock_alerts WHERE product_id = old.product_id;
+            END
+        ''')
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS category_thresholds_ai AFTER INSERT ON category_thresholds BEGIN {refresh_category('new.category')} END")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS category_thresholds_au AFTER UPDATE ON category_thresholds BEGIN {refresh_category('old.category')} {refresh_category('new.category')} END")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS category_thresholds_ad AFTER DELETE ON category_thresholds BEGIN {refresh_category('old.category')} END")
+        
+        if not exists:
+            cursor.execute(f'''
+                INSERT INTO stock_alerts (product_id, quantity, reorder_point, alert_time)
+                SELECT p.product_id, p.quantity, {reorder_point_of("p")}, datetime('now', 'localtime')
+                FROM products p WHERE p.quantity <= {reorder_point_of("p")}
+            ''')
+    
+    def _init_product_search(self, cursor):
+        """商品全文索引（ID/名称/类别），由触发器与商品表保持同步；SQLite 未编译 FTS5 时回退为 LIKE 查询"""
+        try:
+            exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'products_fts'").fetchone()
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+                    product_id, name, category,
+                    content='products', content_rowid='rowid',
+                    tokenize='unicode61', prefix='1 2 3'
+                )
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+                    INSERT INTO products_fts(rowid, product_id, name, category)
+                    VALUES (new.rowid, new.product_id, new.name, new.category);
+                END
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+                    INSERT INTO products_fts(products_fts, rowid, product_id, name, category)
+                    VALUES ('delete', old.rowid, old.product_id, old.name, old.category);
+                END
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF product_id, name, category ON products BEGIN
+                    INSERT INTO products_fts(products_fts, rowid, product_id, name, category)
+                    VALUES ('delete', old.rowid, old.product_id, old.name, old.category);
+                    INSERT INTO products_fts(rowid, product_id, name, category)
+                    VALUES (new.rowid, new.product_id, new.name, new.category);
+                END
+            ''')
+            if not exists:
+                cursor.execute("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+            self.fts_enabled = True
+        except sqlite3.OperationalError:
+            self.fts_enabled = False
+
+    def _init_change_log(self, cursor):
+        """变更日志：触发器记录每次被修改的商品ID，商品目录快照与各会话的商品列表据此只重新读取变化的行；
+        类别阈值的修改也记入日志（影响所有商品的阈值列，读取方整体重新加载）"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS change_log (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                table_name TEXT NOT NULL,
+                row_key TEXT NOT NULL,
+                op TEXT NOT NULL,
+                changed_at TEXT NOT NULL DEFAULT (datetime('now', 'localtime'))
+            )
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS change_log_products_ai AFTER INSERT ON products BEGIN
+                INSERT INTO change_log (table_name, row_key, op) VALUES ('products', new.product_id, 'insert');
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS change_log_products_au AFTER UPDATE ON products BEGIN
+                INSERT INTO change_log (table_name, row_key, op)
+                SELECT 'products', old.product_id, 'delete' WHERE old.product_id IS NOT new.product_id;
+                INSERT INTO change_log (table_name, row_key, op) VALUES ('products', new.product_id, 'update');
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS change_log_products_ad AFTER DELETE ON products BEGIN
+                INSERT INTO change_log (table_name, row_key, op) VALUES ('products', old.product_id, 'delete');
+            END
+        ''')
+        for event, row in (("INSERT", "new"), ("UPDATE", "new"), ("DELETE", "old")):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS change_log_category_thresholds_a{event[0].lower()}
+                AFTER {event} ON category_thresholds BEGIN
+                    INSERT INTO change_log (table_name, row_key, op)
+                    VALUES ('category_thresholds', {row}.category, '{event.lower()}');
+                END
+            ''')
+
+    def _init_stock_ledger(self, cursor):
+        """库存流水与库存快照：商品数量的每次变化（含销售扣减）都由触发器记入流水并附带变化后余额；
+        快照由 db_maintenance 在空闲时按天或按流水条数保存全部商品的余额，历史库存查询只需一次快照查找加一小段流水"""
+        exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'stock_ledger'").fetchone()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stock_ledger (
+                ledger_id INTEGER PRIMARY KEY,
+                product_id TEXT NOT NULL,
+                delta INTEGER NOT NULL,
+                balance_after INTEGER NOT NULL,
+                changed_at TEXT NOT NULL DEFAULT (datetime('now', 'localtime'))
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_stock_ledger_product ON stock_ledger(product_id, ledger_id)")
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stock_snapshot_runs (
+                run_id INTEGER PRIMARY KEY,
+                taken_at TEXT NOT NULL,
+                ledger_id INTEGER NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stock_snapshots (
+                run_id INTEGER NOT NULL,
+                product_id TEXT NOT NULL,
+                balance INTEGER NOT NULL,
+                PRIMARY KEY (run_id, product_id)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_stock_snapshot_runs_time ON stock_snapshot_runs(taken_at)")
+        
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS stock_ledger_ai AFTER INSERT ON products BEGIN
+                INSERT INTO stock_ledger (product_id, delta, balance_after) VALUES (new.product_id, new.quantity, new.quantity);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS stock_ledger_au AFTER UPDATE OF product_id, quantity ON products
+            WHEN old.product_id IS NOT new.product_id OR old.quantity IS NOT new.quantity BEGIN
+                INSERT INTO stock_ledger (product_id, delta, balance_after)
+                SELECT old.product_id, -old.quantity, 0 WHERE old.product_id IS NOT new.product_id;
+                INSERT INTO stock_ledger (product_id, delta, balance_after)
+                VALUES (new.product_id,
+                        CASE WHEN old.product_id IS new.product_id THEN new.quantity - old.quantity ELSE new.quantity END,
+                        new.quantity);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS stock_ledger_ad AFTER DELETE ON products BEGIN
+                INSERT INTO stock_ledger (product_id, delta, balance_after) VALUES (old.product_id, -old.quantity, 0);
+            END
+        ''')
+        # 旧版本在流水触发器中保存快照（复制全部商品，会拖住同批的收银写入），现改由维护任务保存
+        cursor.execute("DROP TRIGGER IF EXISTS stock_snapshots_take")
+        if not exists:
+            # 首次启用时以当前库存作为期初快照
+            cursor.execute("INSERT INTO stock_snapshot_runs (taken_at, ledger_id) VALUES (datetime('now', 'localtime'), 0)")
+            cursor.execute("INSERT INTO stock_snapshots (run_id, product_id, balance) SELECT ?, product_id, quantity FROM products",
+                           (cursor.lastrowid,))
+
+# ===================== 数据访问对象 =====================
+class UserDAO:
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+    
+    def get_user(self, username):
+        with self.db_manager.read_snapshot() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT u.username, u.password, u.role, u.staff_id, s.name, s.position 
+                FROM users u 
+                LEFT JOIN staff s ON u.staff_id = s.staff_id 
+                WHERE u.username = ?
+            ''', (username,))
+            return cursor.fetchone()
+    
+    def add_user_with_staff(self, username, password, staff_id, role="user"):
+        def work(conn):
+            if not conn.execute("SELECT staff_id FROM staff WHERE staff_id = ?", (staff_id,)).fetchone():
+                return False, "员工ID不存在"
+            conn.execute('INSERT INTO users (username, password, staff_id, role) VALUES (?, ?, ?, ?)',
+                         (username, password, staff_id, role))
+            return True, "注册成功"
+        try:
+            return self.db_manager.write(work)
+        except sqlite3.IntegrityError:
+            return False, "用户名已存在"
+
+class ProductDAO:
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+    
+    PRODUCT_COLUMNS = ["product_id", "name", "price", "quantity", "category", "staff_id", "staff_name", "photo_path",
+                       "barcode", "reorder_point", "warning_level"]
+    
+    def _select_all(self, conn, where="", params=()):
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT p.product_id, p.name, p.price, p.quantity, p.category, 
+                   p.staff_id, s.name, p.photo_path, p.barcode,
+                   COALESCE(p.reorder_point, c.reorder_point, {DEFAULT_REORDER_POINT}),
+                   COALESCE(c.warning_level, {DEFAULT_WARNING_LEVEL})
+            FROM products p
+            LEFT JOIN staff s ON p.staff_id = s.staff_id
+            LEFT JOIN category_thresholds c ON p.category = c.category
+            {where}
+        ''', params)
+        return cursor
+    
+    def get_all_products(self):
+        with self.db_manager.read_snapshot() as conn:
+            return self._select_all(conn).fetchall()
+    
+    def iter_products(self, batch_size=ITER_BATCH_SIZE, batches=False):
+        """逐行（batches=True 时逐批）产出全部商品，列同 get_all_products"""
+        return _iter_rows(self.db_manager, self._select_all, batch_size, batches)
+    
+    def get_products_frame(self):
+        """全部商品的列式结果（DataFrame，列名见 PRODUCT_COLUMNS），供表格与报表直接使用"""
+        with self.db_manager.read_snapshot() as conn:
+            return _frame(self._select_all(conn), self.PRODUCT_COLUMNS)
+    
+    # 变更日志中 (since_seq, last_seq] 范围内改动过的商品ID
+    CHANGED_PRODUCTS = "SELECT row_key FROM change_log WHERE table_name = 'products' AND seq > ? AND seq <= ?"
+    
+    def _change_range(self, conn, since_seq):
+        """since_seq 之后的变更范围：返回 (最新序号, 是否需要整体重新读取)，最新序号等于 since_seq 表示没有变化。
+        since_seq 为 None、变更日志已被裁剪到 since_seq 之后，或其间修改过类别阈值时需要整体重新读取"""
+        first_seq, last_seq = conn.execute("SELECT MIN(seq), MAX(seq) FROM change_log").fetchone()
+        last_seq = last_seq or 0
+        if since_seq is not None and last_seq <= since_seq:
+            return since_seq, False
+        full = (since_seq is None or first_seq is None or first_seq > since_seq + 1
+                or conn.execute("SELECT 1 FROM change_log WHERE seq > ? AND table_name = 'category_thresholds' "
+                                "LIMIT 1", (since_seq,)).fetchone() is not None)
+        return last_seq, full
+    
+    def _deleted_products(self, conn, since_seq, last_seq):
+        return [row[0] for row in conn.execute(
+            f"SELECT DISTINCT row_key FROM ({self.CHANGED_PRODUCTS}) WHERE row_key NOT IN (SELECT product_id FROM products)",
+            (since_seq, last_seq))]
+    
+    def get_product_changes(self, since_seq=None):
+        """增量读取商品列表：返回 seq（变更日志序号）之后新增、修改与删除的商品（ProductChanges）。
+        需要整体重新读取时（见 _change_range）返回全部商品（full=True）。
+        没有变化时 frame 为 None，调用方保留原数据即可；各会话定时调用，只有变化的行才会重新读取"""
+        with self.db_manager.read_snapshot() as conn:
+            last_seq, full = self._change_range(conn, since_seq)
+            if full:
+                return ProductChanges(last_seq, _frame(self._select_all(conn), self.PRODUCT_COLUMNS), [], True)
+            if last_seq == since_seq:
+                return ProductChanges(since_seq, None, [], False)
+            frame = _frame(self._select_all(conn, f"WHERE p.product_id IN ({self.CHANGED_PRODUCTS})",
+                                            (since_seq, last_seq)), self.PRODUCT_COLUMNS)
+            deleted = self._deleted_products(conn, since_seq, last_seq)
+        return ProductChanges(last_seq, frame, deleted, False)
+    
+    def get_product(self, product_id):
+        # 高频的单商品查询复用只读连接池中的连接，省去每次建立连接、解析表结构的开销
+        with self.db_manager.read_snapshot() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT p.product_id, p.name, p.price, p.quantity, p.category, 
+                       p.staff_id, s.name, p.photo_path, p.barcode
+                FROM products p
+                LEFT JOIN staff s ON p.staff_id = s.staff_id
+                WHERE p.product_id = ?
+            ''', (product_id,))
+            return cursor.fetchone()
+    
+    def get_products(self, product_ids):
+        """批量查询商品，返回 {商品ID: 商品}（不存在的ID不在结果中）"""
+        products = {}
+        product_ids = list(dict.fromkeys(product_ids))
+        with self.db_manager.read_snapshot() as conn:
+            cursor = conn.cursor()
+            for start in range(0, len(product_ids), 500):
+                chunk = product_ids[start:start + 500]
+                cursor.execute(f'''
+                    SELECT p.product_id, p.name, p.price, p.quantity, p.category, 
+                           p.staff_id, s.name, p.photo_path, p.barcode
+                    FROM products p
+                    LEFT JOIN staff s ON p.staff_id = s.staff_id
+                    WHERE p.product_id IN ({",".join("?" * len(chunk))})
+                ''', chunk)
+                products.update((row[0], row) for row in cursor.fetchall())
+        return products
+    
+    def get_product_by_barcode(self, barcode):
+        with self.db_manager.read_snapshot() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT p.product_id, p.name, p.price, p.quantity, p.category, 
+                       p.staff_id, s.name, p.photo_path, p.barcode
+                FROM products p
+                LEFT JOIN staff s ON p.staff_id = s.staff_id
+                WHERE p.barcode = ?
+            ''', (barcode,))
+            return cursor.fetchone()
+    
+    def get_product_snapshot(self, product_id):
+        """读取商品可编辑字段与版本号（字典），作为维护表单乐观并发更新的基准"""
+        with self.db_manager.read_snapshot() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row  # 只设在游标上，不影响连接池中的连接
+            cursor.execute('''
+                SELECT product_id, name, price, quantity, category, staff_id, photo_path, barcode, reorder_point, version
+                FROM products WHERE product_id = ?
+            ''', (product_id,))
+            row = cursor.fetchone()
+        return dict(row) if row else None
+    
+    def search(self, prefix, limit=20):
+        """按名称/类别/ID前缀搜索商品，按相关度排序（中文名称以连续汉字为词，“牛”可匹配“牛肉”）"""
+        terms = prefix.split()
+        if not terms:
+            return []
+        with self.db_manager.read_snapshot() as conn:
+            cursor = conn.cursor()
+            if self.db_manager.fts_enabled:
+                match = " ".join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+                sql = '''
+                    SELECT p.product_id, p.name, p.price, p.quantity, p.category, 
+                           p.staff_id, s.name, p.photo_path, p.barcode
+                    FROM products_fts f
+                    JOIN products p ON p.rowid = f.rowid
+                    LEFT JOIN staff s ON p.staff_id = s.staff_id
+                    WHERE products_fts MATCH ?
+                '''
+                # 先按ID/名称相关度排序；类别命中面太广，排序代价高，只按索引顺序补足剩余名额
+                products = cursor.execute(sql + " ORDER BY bm25(products_fts, 5.0, 10.0, 2.0) LIMIT ?",
+                                          (f"{{product_id name}} : ({match})", limit)).fetchall()
+                if len(products) < limit:
+                    found = {p[0] for p in products}
+                    extra = cursor.execute(sql + " LIMIT ?", (f"category : ({match})", limit)).fetchall()
+                    products += [p for p in extra if p[0] not in found][:limit - len(products)]
+            else:
+                pattern = prefix.strip().replace("%", "").replace("_", "") + "%"
+                cursor.execute('''
+                    SELECT p.product_id, p.name, p.price, p.quantity, p.category, 
+                           p.staff_id, s.name, p.photo_path, p.barcode
+                    FROM products p
+                    LEFT JOIN staff s ON p.staff_id = s.staff_id
+                    WHERE p.product_id LIKE ? OR p.name LIKE ? OR p.category LIKE ?
+                    LIMIT ?
+                ''', (pattern, pattern, pattern, limit))
+                products = cursor.fetchall()
+        return products
+    
+    def get_barcode_changes(self, since_seq=None):
+        """条码索引的增量更新：返回 (seq, rows, deleted, full)，rows 为 [(商品ID, 条码, 名称, 单价), ...]。
+        full=True 时 rows 为全部有条码的商品（整体替换）；否则为 since_seq 之后改动过的商品（条码可能已清空），
+        deleted 为其间删除的商品ID。不依赖 pandas，收银台每次扫码前调用，内存中的索引随其他进程的改动保持最新"""
+        with self.db_manager.read_snapshot() as conn:
+            last_seq, full = self._change_range(conn, since_seq)
+            if full:
+                rows = conn.execute(
+                    "SELECT product_id, barcode, name, price FROM products WHERE barcode IS NOT NULL").fetchall()
+                return last_seq, rows, [], True
+            if last_seq == since_seq:
+                return since_seq, [], [], False
+            rows = conn.execute(f"SELECT product_id, barcode, name, price FROM products "
+                                f"WHERE product_id IN ({self.CHANGED_PRODUCTS})", (since_seq, last_seq)).fetchall()
+            return last_seq, rows, self._deleted_products(conn, since_seq, last_seq), False
+    
+    def add_product(self, product_id, name, price, quantity, category, staff_id, photo_path="", barcode="", reorder_point=None):
+        def work(conn):
+            conn.execute('''
+                INSERT INTO products (product_id, name, price, quantity, category, staff_id, photo_path, barcode, reorder_point)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (product_id, name, price, quantity, category, staff_id, photo_path, barcode or None, reorder_point))
+            return True
+        try:
+            return self.db_manager.write(work)
+        except sqlite3.IntegrityError:
+            return False
+    
+    def import_products(self, rows):
+        """批量导入商品（一个写事务）：rows 为 (商品ID, 名称, 单价, 库存, 类别, 员工ID, 条码, 补货阈值) 序列，
+        已存在的商品覆盖这些字段并递增版本号。返回 (新增数, 更新数)"""
+        rows = [(product_id, name, price, quantity, category, staff_id, barcode or None, reorder_point)
+                for product_id, name, price, quantity, category, staff_id, barcode, reorder_point in rows]
+        def work(conn):
+            existing = 0
+            for row in rows:
+                existing += conn.execute("SELECT 1 FROM products WHERE product_id = ?", (row[0],)).fetchone() is not None
+                conn.execute('''
+                    INSERT INTO products (product_id, name, price, quantity, category, staff_id, photo_path, barcode, reorder_point)
+                    VALUES (?, ?, ?, ?, ?, ?, '', ?, ?)
+                    ON CONFLICT (product_id) DO UPDATE SET
+                        name = excluded.name, price = excluded.price, quantity = excluded.quantity,
+                        category = excluded.category, staff_id = excluded.staff_id, barcode = excluded.barcode,
+                        reorder_point = excluded.reorder_point, version = version + 1
+                ''', row)
+            return len(rows) - existing, existing
+        return self.db_manager.write(work)
+    
+    EDITABLE_FIELDS = ("name", "price", "category", "staff_id", "photo_path", "barcode", "reorder_point")
+    
+    def update_product(self, product_id, expected_version, changes, quantity_change=0):
+        """乐观并发更新：只写入 changes 中的字段，库存按增量调整（不覆盖期间的销售扣减）；
+        版本号与 expected_version 不符时不做任何修改。返回 (更新结果, 当前版本号)"""
+        fields = {k: v for k, v in changes.items() if k in self.EDITABLE_FIELDS}
+        if "barcode" in fields:
+            fields["barcode"] = fields["barcode"] or None
+        assignments = [f"{k} = ?" for k in fields] + ["quantity = quantity + ?", "version = version + 1"]
+        params = list(fields.values()) + [quantity_change, product_id, expected_version, quantity_change]
+        def work(conn):
+            cursor = conn.execute(f'''
+                UPDATE products SET {", ".join(assignments)}
+                WHERE product_id = ? AND version = ? AND quantity + ? >= 0
+            ''', params)
+            if cursor.rowcount:
+                return UPDATE_OK, expected_version + 1
+            row = conn.execute("SELECT version FROM products WHERE product_id = ?", (product_id,)).fetchone()
+            return (UPDATE_CONFLICT, row[0]) if row else (UPDATE_NOT_FOUND, None)
+        try:
+            return self.db_manager.write(work)
+        except sqlite3.IntegrityError:
+            return UPDATE_DUPLICATE, expected_version
+    
+    def delete_product(self, product_id):
+        def work(conn):
+            return conn.execute("DELETE FROM products WHERE product_id = ?", (product_id,)).rowcount > 0
+        return self.db_manager.write(work)
+    
+    def update_product_quantity(self, product_id, quantity_change):
+        def work(conn):
+            cursor = conn.execute("UPDATE products SET quantity = quantity + ? WHERE product_id = ?", 
+                                  (quantity_change, product_id))
+            return cursor.rowcount > 0
+        return self.db_manager.write(work)
+    
+    def get_catalog_snapshot(self):
+        """进程内共享的商品目录列式快照，用于估值、排行与类别汇总；在当前只读快照上刷新
+        （在 read_snapshot 内调用时与其中的其他查询看到同一时刻的数据）"""
+        from . import catalog_snapshot  # 依赖 numpy，用到时才导入
+        with self.db_manager.read_snapshot() as conn:
+            return catalog_snapshot.get_snapshot(self.db_manager.db_name, conn)
+    
+    def get_stock_alerts(self):
+        """读取触发器维护的库存预警表（只包含低于补货阈值的商品）"""
+        with self.db_manager.read_snapshot() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT a.product_id, p.name, a.quantity, a.reorder_point, a.alert_time
+                FROM stock_alerts a
+                JOIN products p ON a.product_id = p.product_id
+                ORDER BY a.quantity - a.reorder_point, a.product_id
+            ''')
+            return cursor.fetchall()
+
+class SalesDAO:
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+    
+    SALE_COLUMNS = ["sale_id", "product_id", "product_name", "quantity", "unit_price", "total_price", "sale_date"]
+    
+    def _select_all(self, conn, sale_date="datetime(s.sold_at, 'unixepoch', 'localtime')"):
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT s.sale_id, k.product_id, COALESCE(s.product_name, k.name), s.quantity,
+                   s.unit_price, s.total_price, {sale_date}
+            FROM sales_data s
+            JOIN product_keys k ON k.product_key = s.product_key
+            ORDER BY s.sold_at DESC, s.sale_id DESC
+        ''')
+        return cursor
+    
+    def get_all_sales(self):
+        with self.db_manager.read_snapshot() as conn:
+            return self._select_all(conn).fetchall()
+    
+    def iter_sales(self, batch_size=ITER_BATCH_SIZE, batches=False):
+        """逐行（batches=True 时逐批）产出全部销售记录（按时间倒序），列同 get_all_sales"""
+        return _iter_rows(self.db_manager, self._select_all, batch_size, batches)
+    
+    def get_sales_frame(self):
+        """全部销售记录的列式结果（DataFrame，列名见 SALE_COLUMNS，sale_date 为本地时间 datetime64）"""
+        with self.db_manager.read_snapshot() as conn:
+            return _frame(self._select_all(conn, LOCAL_SECONDS.format("s.sold_at")), self.SALE_COLUMNS, ["sale_date"])
+    
+    def add_sale(self, product_id, product_name, quantity, unit_price, total_price):
+        sale_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        def work(conn):
+            conn.execute('''
+                INSERT INTO sales (product_id, product_name, quantity, unit_price, total_price, sale_date)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (product_id, product_name, quantity, unit_price, total_price, sale_date))
+            return True
+        return self.db_manager.write(work)
+    
+    def checkout(self, items, timeout=None):
+        """结算：items 为 [(商品ID, 商品名称, 数量, 单价), ...]，扣减库存与写入销售记录在同一事务中完成；
+        timeout 见 DatabaseManager.write"""
+        sale_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        def work(conn):
+            for product_id, product_name, quantity, unit_price in items:
+                cursor = conn.execute("UPDATE products SET quantity = quantity - ? WHERE product_id = ? AND quantity >= ?",
+                                      (quantity, product_id, quantity))
+                if cursor.rowcount == 0:
+                    raise db_writer.RollbackWork((False, f"{product_name} 库存不足或商品已下架！"))
+                conn.execute('''
+                    INSERT INTO sales (product_id, product_name, quantity, unit_price, total_price, sale_date)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (product_id, product_name, quantity, unit_price, round(unit_price * quantity, 2), sale_date))
+            return True, "结算成功"
+        return self.db_manager.write(work, timeout)
+    
+    def checkout_or_journal(self, items, terminal_id, journal_first=None):
+        """结算；journal_first=True 或数据库暂不可用时记入本终端的收银日志（落盘后返回），由补录线程稍后入账。
+        journal_first 为 None 时取调用时的 JOURNAL_FIRST 设置。记入日志的销售不做库存校验，补录时扣成负数的商品记入日志供核对。
+        写库超过 CHECKOUT_TIMEOUT 秒仍未开始（数据库被锁、写线程积压或已停止）也视为不可用"""
+        if journal_first is None:
+            journal_first = JOURNAL_FIRST
+        if not journal_first:
+            try:
+                return self.checkout(items, CHECKOUT_TIMEOUT)
+            except (sqlite3.Error, TimeoutError):
+                pass
+        sales_journal.get_journal(terminal_id, self.db_manager.journal_dir).append(items)
+        self.db_manager.journal_sync.trigger()
+        if journal_first:
+            return True, "结算成功"
+        return True, "数据库暂不可用，已记入收银日志，恢复后自动入账"
+
+class InventoryDAO:
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+    
+    def add_operation(self, product_id, operation_type, quantity, staff_id, notes=""):
+        operation_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        def work(conn):
+            # 使用列名插入：旧数据库中该表的列顺序与建表语句不同
+            conn.execute('''
+                INSERT INTO inventory_operations (product_id, operation_type, quantity, operation_date, staff_id, notes)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (product_id, operation_type, quantity, operation_date, staff_id, notes))
+            return True
+        return self.db_manager.write(work)
+    
+    def execute_operation(self, product_id, operation_type, quantity, staff_id, notes=""):
+        """执行入库/出库：库存变更与操作记录在同一事务中完成，出库时库存不足则整体回滚"""
+        operation_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        change = quantity if operation_type == "in" else -quantity
+        def work(conn):
+            cursor = conn.execute("UPDATE products SET quantity = quantity + ? WHERE product_id = ? AND quantity + ? >= 0",
+                                  (change, product_id, change))
+            if cursor.rowcount == 0:
+                raise db_writer.RollbackWork((False, "库存不足或商品已下架！"))
+            conn.execute('''
+                INSERT INTO inventory_operations (product_id, operation_type, quantity, operation_date, staff_id, notes)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (product_id, operation_type, quantity, operation_date, staff_id, notes))
+            return True, "操作成功"
+        return self.db_manager.write(work)
+    
+    OPERATION_COLUMNS = ["operation_id", "product_id", "product_name", "operation_type", "quantity", "operation_date",
+                         "staff_name", "notes", "balance", "reorder_point", "warning_level"]
+    
+    def _select_all(self, conn, operation_date="datetime(io.operated_at, 'unixepoch', 'localtime')"):
+        cursor = conn.cursor()
+        # 累计结存用窗口函数一次扫描算出（同一时刻的多条操作一并计入，与逐行子查询结果一致）
+        cursor.execute(f'''
+            SELECT 
+                io.operation_id, 
+                k.product_id, 
+                COALESCE(p.name, k.name), 
+                io.operation_type, 
+                io.quantity,
+                {operation_date}, 
+                s.name, 
+                io.notes,
+                SUM(CASE WHEN io.operation_type = 'in' THEN io.quantity ELSE -io.quantity END)
+                    OVER (PARTITION BY io.product_key ORDER BY io.operated_at),
+                COALESCE(p.reorder_point, c.reorder_point, {DEFAULT_REORDER_POINT}),
+                COALESCE(c.warning_level, {DEFAULT_WARNING_LEVEL})
+            FROM inventory_operations_data io
+            JOIN product_keys k ON k.product_key = io.product_key
+            LEFT JOIN products p ON k.product_id = p.product_id
+            LEFT JOIN staff s ON io.staff_id = s.staff_id
+            LEFT JOIN category_thresholds c ON p.category = c.category
+            ORDER BY io.operated_at DESC
+        ''')
+        return cursor
+    
+    def get_all_operations(self):
+        with self.db_manager.read_snapshot() as conn:
+            return self._select_all(conn).fetchall()
+    
+    def iter_operations(self, batch_size=ITER_BATCH_SIZE, batches=False):
+        """逐行（batches=True 时逐批）产出全部库存操作（按时间倒序），列同 get_all_operations"""
+        return _iter_rows(self.db_manager, self._select_all, batch_size, batches)
+    
+    def get_operations_frame(self):
+        """全部库存操作的列式结果（DataFrame，列名见 OPERATION_COLUMNS，operation_date 为本地时间 datetime64）"""
+        with self.db_manager.read_snapshot() as conn:
+            return _frame(self._select_all(conn, LOCAL_SECONDS.format("io.operated_at")), self.OPERATION_COLUMNS,
+                          ["operation_date"])
+    
+    def run_demand_forecast(self, **options):
+        """根据销售历史重新计算所有商品的需求预测与补货建议"""
+        from . import demand_forecast  # 依赖 numpy，用到时才导入
+        # 计算耗时较长，在只读快照上完成；只把结果写入交给单写线程
+        with self.db_manager.read_snapshot() as conn:
+            rows, summary = demand_forecast.compute_forecast(conn, **options)
+        self.db_manager.write(lambda conn: demand_forecast.save_forecast(conn, rows))
+        return summary
+    
+    def get_reorder_suggestions(self, only_needed=True):
+        with self.db_manager.read_snapshot() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT r.product_id, p.name, p.quantity, r.forecast_daily, r.moving_average,
+                       r.days_of_cover, r.suggested_quantity, r.generated_at
+                FROM reorder_suggestions r
+                JOIN products p ON r.product_id = p.product_id
+                {"WHERE r.suggested_quantity > 0" if only_needed else ""}
+                ORDER BY r.days_of_cover IS NULL, r.days_of_cover, r.suggested_quantity DESC
+            ''')
+            return cursor.fetchall()
+    
+    def stock_as_of(self, product_id, timestamp):
+        """查询某一时刻的库存：product_id 为 None 时返回 {商品ID: 库存}，否则返回该商品的库存；
+        早于首个库存快照的时刻返回 None。timestamp 为 datetime 或 "YYYY-MM-DD HH:MM:SS" 字符串"""
+        if isinstance(timestamp, datetime):
+            timestamp = timestamp.strftime("%Y-%m-%d %H:%M:%S")
+        # 快照与流水在同一读事务内读取，中途写入的流水不会被重复或遗漏计入
+        with self.db_manager.read_snapshot() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT run_id, ledger_id FROM stock_snapshot_runs
+                WHERE taken_at <= ? ORDER BY taken_at DESC, run_id DESC LIMIT 1
+            ''', (timestamp,))
+            run = cursor.fetchone()
+            if run is None:
+                return None
+            run_id, ledger_id = run
+            if product_id is not None:
+                cursor.execute('''
+                    SELECT COALESCE((SELECT balance FROM stock_snapshots WHERE run_id = ? AND product_id = ?), 0)
+                         + COALESCE((SELECT SUM(delta) FROM stock_ledger
+                                     WHERE product_id = ? AND ledger_id > ? AND changed_at <= ?), 0)
+                ''', (run_id, product_id, product_id, ledger_id, timestamp))
+                return cursor.fetchone()[0]
+            cursor.execute("SELECT product_id, balance FROM stock_snapshots WHERE run_id = ?", (run_id,))
+            balances = dict(cursor.fetchall())
+            cursor.execute('''
+                SELECT product_id, SUM(delta) FROM stock_ledger
+                WHERE ledger_id > ? AND changed_at <= ? GROUP BY product_id
+            ''', (ledger_id, timestamp))
+            for pid, delta in cursor.fetchall():
+                balances[pid] = balances.get(pid, 0) + delta
+        return {pid: balance for pid, balance in balances.items() if balance}
+    
+    def get_category_thresholds(self):
+        with self.db_manager.read_snapshot() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT category, reorder_point, warning_level FROM category_thresholds ORDER BY category")
+            return cursor.fetchall()
+    
+    def set_category_threshold(self, category, reorder_point, warning_level):
+        def work(conn):
+            conn.execute('''
+                INSERT INTO category_thresholds (category, reorder_point, warning_level) VALUES (?, ?, ?)
+                ON CONFLICT(category) DO UPDATE SET reorder_point = excluded.reorder_point, warning_level = excluded.warning_level
+            ''', (category, reorder_point, warning_level))
+            return True
+        return self.db_manager.write(work)
+    
+    def delete_category_threshold(self, category):
+        def work(conn):
+            return conn.execute("DELETE FROM category_thresholds WHERE category = ?", (category,)).rowcount > 0
+        return self.db_manager.write(work)
+
+class StaffDAO:
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+    
+    def get_all_staff(self):
+        with self.db_manager.read_snapshot() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM staff")
+            return cursor.fetchall()
+    
+    def iter_staff(self, batch_size=ITER_BATCH_SIZE, batches=False):
+        """逐行（batches=True 时逐批）产出全部员工，列同 get_all_staff"""
+        return _iter_rows(self.db_manager, lambda conn: conn.execute("SELECT * FROM staff"), batch_size, batches)
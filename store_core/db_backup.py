@@ -0,0 +1,281 @@
+# 在线备份与恢复
+# 使用 SQLite 备份 API 分步复制数据库（每步复制有限页数并在步骤之间让出时间），收银写入不会被长时间阻塞；
+# 每次备份都执行 integrity_check 校验，按代数轮换保留，压缩与商品图片打包在后台线程完成。
+import gzip
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# 程序目录（store_core 包的上一级）
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_FILE = os.path.join(BASE_DIR, "store_management.db")
+PHOTO_DIR = os.path.join(BASE_DIR, "product_photos")
+BACKUP_DIR = os.path.join(BASE_DIR, "backups")
+
+PAGES_PER_STEP = 256    # 每步复制的页数
+STEP_SLEEP = 0.05       # 每步之后的休眠时间（秒），让出写锁给收银
+KEEP_GENERATIONS = 7    # 保留的备份代数
+MAX_RESTARTS = 3        # 分步复制因源库被写入而从头重来的次数上限，超过后改为单步复制
+STAMP_FORMAT = "%Y%m%d-%H%M%S-%f"  # 精确到微秒，同一秒内的两次备份不会互相覆盖
+# 备份文件名中的时间戳（含旧版只精确到秒的格式），按此精确匹配，不会把 east-2 门店的备份当作 east 的
+STAMP_PATTERN = r"\d{8}-\d{6}(?:-\d{6})?"
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _background():
+    """压缩 / 打包用的进程级后台线程（单线程，按提交顺序执行）"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-backup")
+        return _executor
+
+
+class BackupError(Exception):
+    pass
+
+
+class _BackupRestarted(Exception):
+    pass
+
+
+def integrity_check(db_path):
+    """对数据库文件执行 PRAGMA integrity_check，返回问题列表（为空表示通过）"""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        rows = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+    finally:
+        conn.close()
+    return [] if rows == ["ok"] else rows
+
+
+def copy_database(db_path, target, pages=PAGES_PER_STEP, sleep=STEP_SLEEP, progress=None, max_restarts=MAX_RESTARTS):
+    """用备份 API 分步把 db_path 复制为 target（单个文件，不依赖 -wal/-shm）。
+    progress(remaining, total) 在每步复制后调用。
+    备份在两步之间如被其他连接写入会从头重来，持续有写入时可能永远完成不了：重来超过 max_restarts 次后
+    改为单步复制（一次读事务内复制全部页；WAL 模式下不阻塞收银写入）"""
+    restarts = 0
+    last_remaining = None
+
+    def step(status, remaining, total):
+        nonlocal restarts, last_remaining
+        # 重来时剩余页数回到（或停留在）总页数，不再减少
+        if last_remaining is not None and remaining and remaining >= last_remaining:
+            restarts += 1
+            if restarts > max_restarts:
+                raise _BackupRestarted()
+        last_remaining = remaining
+        if progress:
+            progress(remaining, total)
+        # 每步之后休眠，把写锁让给收银
+        if remaining and sleep:
+            time.sleep(sleep)
+
+    source = sqlite3.connect(db_path)
+    destination = sqlite3.connect(target)
+    try:
+        try:
+            source.backup(destination, pages=pages, progress=step)
+        except _BackupRestarted:
+            source.backup(destination, pages=-1)
+            if progress:
+                progress(0, destination.execute("PRAGMA page_count").fetchone()[0])
+        # 备份文件改为回滚日志模式，成为不依赖 -wal/-shm 的单个文件
+        destination.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        destination.close()
+        source.close()
+
+
+def backup(db_path=DB_FILE, backup_dir=BACKUP_DIR, pages=PAGES_PER_STEP, sleep=STEP_SLEEP,
+           keep=KEEP_GENERATIONS, compress=True, photo_dir=PHOTO_DIR, progress=None):
+    """在线备份一代：返回 {"stamp", "database", "photos", "pending"}，pending 为后台压缩/打包任务的 Future 列表。
+    progress(remaining, total) 在每步复制后调用"""
+    os.makedirs(backup_dir, exist_ok=True)
+    stamp = datetime.now().strftime(STAMP_FORMAT)
+    name = os.path.splitext(os.path.basename(db_path))[0]
+    target = os.path.join(backup_dir, f"{name}-{stamp}.db")
+    partial = target + ".part"
+    copy_database(db_path, partial, pages, sleep, progress)
+
+    problems = integrity_check(partial)
+    if problems:
+        os.remove(partial)
+        raise BackupError(f"备份校验失败：{'; '.join(problems[:5])}")
+    os.replace(partial, target)
+
+    result = {"stamp": stamp, "database": target, "photos": None, "pending": []}
+    if compress:
+        result["database"] = target + ".gz"
+        result["pending"].append(_background().submit(_gzip_file, target))
+    if photo_dir and os.path.isdir(photo_dir):
+        result["photos"] = os.path.join(backup_dir, f"{name}-photos-{stamp}.zip")
+        result["pending"].append(_background().submit(_zip_photos, photo_dir, result["photos"]))
+    # 轮换在压缩/打包之后执行，保证不会删除正在写入的文件
+    result["pending"].append(_background().submit(rotate, backup_dir, keep, name))
+    return result
+
+
+def _gzip_file(path):
+    with open(path, "rb") as src, gzip.open(path + ".gz.part", "wb", compresslevel=6) as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    os.replace(path + ".gz.part", path + ".gz")
+    os.remove(path)
+    return path + ".gz"
+
+
+def _zip_photos(photo_dir, target):
+    # 图片本身已压缩，直接存储即可
+    with zipfile.ZipFile(target + ".part", "w", compression=zipfile.ZIP_STORED) as archive:
+        for filename in sorted(os.listdir(photo_dir)):
+            path = os.path.join(photo_dir, filename)
+            if os.path.isfile(path):
+                archive.write(path, filename)
+    os.replace(target + ".part", target)
+    return target
+
+
+def list_backups(backup_dir=BACKUP_DIR, name="store_management"):
+    """按时间从新到旧列出备份代：[(时间戳, 数据库文件, 图片压缩包或None), ...]"""
+    if not os.path.isdir(backup_dir):
+        return []
+    files = os.listdir(backup_dir)
+    pattern = re.compile(rf"{re.escape(name)}-({STAMP_PATTERN})\.db(?:\.gz)?")
+    generations = []
+    for filename in files:
+        match = pattern.fullmatch(filename)
+        if match:
+            stamp = match.group(1)
+            # 图片包按数据库名区分（多门店共用备份目录）；photos-<时间戳>.zip 为旧版命名
+            photos = next((photos for photos in (f"{name}-photos-{stamp}.zip", f"photos-{stamp}.zip")
+                           if photos in files), None)
+            generations.append((stamp, os.path.join(backup_dir, filename),
+                                os.path.join(backup_dir, photos) if photos else None))
+    return sorted(generations, reverse=True)
+
+
+def rotate(backup_dir=BACKUP_DIR, keep=KEEP_GENERATIONS, name="store_management"):
+    """只保留最新的 keep 代备份，返回删除的文件列表"""
+    removed = []
+    for stamp, database, photos in list_backups(backup_dir, name)[keep:]:
+        for path in (database, photos):
+            if path and os.path.exists(path):
+                os.remove(path)
+                removed.append(path)
+    return removed
+
+
+def _decompressed(backup_file, workdir):
+    """.gz 备份先解压到临时目录，返回可直接打开的数据库文件路径"""
+    if not backup_file.endswith(".gz"):
+        return backup_file
+    path = os.path.join(workdir, os.path.basename(backup_file)[:-3])
+    with gzip.open(backup_file, "rb") as src, open(path, "wb") as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    return path
+
+
+def restore(backup_file, db_path=DB_FILE, photos_zip=None, photo_dir=PHOTO_DIR, pages=PAGES_PER_STEP):
+    """校验备份后通过备份 API 覆盖写入 db_path（应在停止收银时执行），可同时解压商品图片"""
+    with tempfile.TemporaryDirectory() as workdir:
+        source_path = _decompressed(backup_file, workdir)
+        problems = integrity_check(source_path)
+        if problems:
+            raise BackupError(f"备份文件已损坏，未执行恢复：{'; '.join(problems[:5])}")
+        source = sqlite3.connect(source_path)
+        destination = sqlite3.connect(db_path, timeout=30)
+        try:
+            source.backup(destination, pages=pages)
+        finally:
+            destination.close()
+            source.close()
+    if photos_zip:
+        os.makedirs(photo_dir, exist_ok=True)
+        with zipfile.ZipFile(photos_zip) as archive:
+            archive.extractall(photo_dir)
+
+
+def main(argv=None):
+    import argparse
+
+    from . import store_registry
+
+    parser = argparse.ArgumentParser(description="小商店进销存数据库在线备份与恢复")
+    parser.add_argument("--store", help="门店编号（见 stores.json），默认第一家门店；数据库与商品图片目录取自门店登记")
+    parser.add_argument("--db", help="数据库文件路径（优先于 --store；已登记的门店仍使用其图片目录）")
+    parser.add_argument("--dir", default=BACKUP_DIR, help="备份目录")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    backup_parser = commands.add_parser("backup", help="执行一次在线备份")
+    backup_parser.add_argument("--pages", type=int, default=PAGES_PER_STEP, help="每步复制的页数")
+    backup_parser.add_argument("--sleep", type=float, default=STEP_SLEEP, help="每步之后的休眠秒数")
+    backup_parser.add_argument("--keep", type=int, default=KEEP_GENERATIONS, help="保留的备份代数")
+    backup_parser.add_argument("--no-compress", action="store_true", help="不压缩数据库备份")
+    backup_parser.add_argument("--no-photos", action="store_true", help="不打包商品图片")
+
+    commands.add_parser("list", help="列出已有备份")
+
+    verify_parser = commands.add_parser("verify", help="校验备份文件")
+    verify_parser.add_argument("file")
+
+    restore_parser = commands.add_parser("restore", help="从备份恢复（请先停止收银）")
+    restore_parser.add_argument("file", nargs="?", help="备份文件，默认使用最新一代")
+    restore_parser.add_argument("--photos", action="store_true", help="同时恢复该代的商品图片")
+
+    args = parser.parse_args(argv)
+    if args.db:
+        store = next((store for store in store_registry.load_stores()
+                      if os.path.abspath(store.db_path) == os.path.abspath(args.db)), None)
+        db_path, photo_dir = args.db, store.photo_dir if store else PHOTO_DIR
+    else:
+        try:
+            store = store_registry.get_store(args.store)
+        except ValueError as e:
+            parser.error(str(e))
+        db_path, photo_dir = store.db_path, store.photo_dir
+    name = os.path.splitext(os.path.basename(db_path))[0]
+
+    if args.command == "backup":
+        def show(remaining, total):
+            print(f"\r已复制 {total - remaining}/{total} 页", end="", flush=True)
+        result = backup(db_path, args.dir, pages=args.pages, sleep=args.sleep, keep=args.keep,
+                        compress=not args.no_compress, photo_dir=None if args.no_photos else photo_dir,
+                        progress=show)
+        for future in result["pending"]:
+            future.result()
+        print(f"\n备份完成：{result['database']}" + (f"，图片：{result['photos']}" if result["photos"] else ""))
+    elif args.command == "list":
+        for stamp, database, photos in list_backups(args.dir, name):
+            print(stamp, os.path.basename(database), os.path.basename(photos) if photos else "")
+    elif args.command == "verify":
+        with tempfile.TemporaryDirectory() as workdir:
+            problems = integrity_check(_decompressed(args.file, workdir))
+        print("校验通过" if not problems else "\n".join(problems))
+        return 1 if problems else 0
+    elif args.command == "restore":
+        generations = list_backups(args.dir, name)
+        if args.file:
+            database = args.file
+            photos = next((p for s, d, p in generations if os.path.abspath(d) == os.path.abspath(database)), None)
+        elif generations:
+            _, database, photos = generations[0]
+        else:
+            print("没有可用的备份")
+            return 1
+        restore(database, db_path, photos_zip=photos if args.photos else None, photo_dir=photo_dir)
+        print(f"已从 {database} 恢复" + ("（含商品图片）" if args.photos and photos else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,309 @@
+# 数据库定期维护
+# 裁剪 change_log、保存库存快照、PRAGMA optimize、对变化较大的表重新 ANALYZE、分步 incremental_vacuum 回收空闲页、WAL 检查点。
+# 除检查点外每一步都作为单独成批的写任务交给单写线程执行（超时中断回滚的只是该步骤本身，不会连累同批的收银写入），
+# 并用进度回调限制单步耗时，收银等写操作最多只需等待一个步骤；进程内由空闲定时器触发，也可以通过命令行手动执行。
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from . import db_writer
+
+logger = logging.getLogger(__name__)
+
+STEP_BUDGET = 0.2           # 单个写任务的最长执行时间（秒）
+MIN_STEP_BUDGET = 0.05      # 剩余预算不足该值时不再开始新步骤（来不及完成，只会被中断）
+RUN_BUDGET = 5.0            # 一次维护的总时间预算（秒）
+VACUUM_STEP_PAGES = 256     # 每个 incremental_vacuum 步骤最多回收的页数
+CHANGE_LOG_KEEP = 10000     # change_log 至少保留的最近记录数，超过两倍时裁剪
+TRIM_STEP_ROWS = 5000       # 每个裁剪步骤最多删除的 change_log 记录数
+STOCK_SNAPSHOT_EVERY = 10000  # 库存流水自上次快照累计该数量的记录（或跨天）时，保存一次全部商品的库存快照
+ANALYSIS_LIMIT = 1000       # ANALYZE 每个索引最多采样的行数
+ANALYZE_CHANGE_RATIO = 0.1  # 行数相对上次统计变化超过该比例的表才重新 ANALYZE
+IDLE_SECONDS = 120          # 写线程空闲超过该时长才开始维护
+RUN_INTERVAL = 3600         # 两次自动维护之间的最短间隔（秒）
+CHECK_INTERVAL = 30         # 调度线程检查空闲状态的间隔（秒）
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+def _with_budget(conn, seconds, func):
+    """在 seconds 秒内执行 func(conn)，超时由 SQLite 进度回调中断并抛出 BudgetExceeded"""
+    deadline = time.monotonic() + seconds
+    conn.set_progress_handler(lambda: time.monotonic() > deadline, 1000)
+    try:
+        return func(conn)
+    except sqlite3.OperationalError as e:
+        if "interrupt" in str(e):
+            raise BudgetExceeded() from e
+        raise
+    finally:
+        conn.set_progress_handler(None, 0)
+
+
+def collect_stats(db_path):
+    """数据库文件、WAL 与页统计，用于维护前后对比"""
+    conn = sqlite3.connect(db_path)
+    try:
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        has_stats = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone()
+        analyzed = conn.execute("SELECT COUNT(DISTINCT tbl) FROM sqlite_stat1").fetchone()[0] if has_stats else 0
+    finally:
+        conn.close()
+    wal_path = db_path + "-wal"
+    return {
+        "file_bytes": os.path.getsize(db_path),
+        "wal_bytes": os.path.getsize(wal_path) if os.path.exists(wal_path) else 0,
+        "page_size": page_size,
+        "page_count": page_count,
+        "freelist_pages": freelist,
+        "auto_vacuum": {0: "none", 1: "full", 2: "incremental"}.get(auto_vacuum, auto_vacuum),
+        "analyzed_tables": analyzed,
+    }
+
+
+def changed_tables(conn, ratio=ANALYZE_CHANGE_RATIO):
+    """行数与 sqlite_stat1 中记录相比变化超过 ratio 的表（含从未统计过的表）"""
+    # 只统计普通表（跳过虚拟表及全文索引的影子表）
+    tables = [row[0] for row in conn.execute(
+        "SELECT name FROM pragma_table_list WHERE schema = 'main' AND type = 'table' AND name NOT LIKE 'sqlite_%'")]
+    recorded = {}
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone():
+        # stat 的第一个数为统计时的行数
+        recorded = dict(conn.execute("SELECT tbl, MAX(CAST(stat AS INTEGER)) FROM sqlite_stat1 GROUP BY tbl"))
+    changed = []
+    for table in tables:
+        rows = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+        before = recorded.get(table)
+        if before is None:
+            if rows:
+                changed.append(table)
+        elif abs(rows - before) > max(before, 1) * ratio:
+            changed.append(table)
+    return changed
+
+
+def run_maintenance(db_path, budget=RUN_BUDGET, step_budget=STEP_BUDGET, vacuum_pages=VACUUM_STEP_PAGES,
+                    checkpoint="PASSIVE", writer=None):
+    """执行一次维护，返回包含前后统计与各步骤结果的字典，并写入日志与 maintenance_runs 表"""
+    writer = writer or db_writer.get_writer(db_path)
+    started = time.monotonic()
+    report = {"started_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "before": collect_stats(db_path),
+              "steps": []}
+
+    def remaining():
+        return budget - (time.monotonic() - started)
+
+    def step(name, func):
+        seconds = min(step_budget, remaining())
+        if seconds < MIN_STEP_BUDGET:
+            report["steps"].append({"step": name, "skipped": "超出时间预算"})
+            return None
+        step_started = time.monotonic()
+        try:
+            result = writer.execute(lambda conn: _with_budget(conn, seconds, func), exclusive=True)
+            report["steps"].append({"step": name, "seconds": round(time.monotonic() - step_started, 3),
+                                    "result": result})
+            return result
+        except BudgetExceeded:
+            report["steps"].append({"step": name, "interrupted": True})
+            return None
+
+    # 找出需要重新统计的表只读数据，使用单独的读连接，不占用写线程
+    conn = sqlite3.connect(db_path)
+    try:
+        tables = _with_budget(conn, max(remaining(), 0), changed_tables)
+    except BudgetExceeded:
+        tables = []
+    finally:
+        conn.close()
+    report["changed_tables"] = tables
+
+    def analyze(table):
+        def work(conn):
+            conn.execute(f"PRAGMA analysis_limit={ANALYSIS_LIMIT}")
+            conn.execute(f'ANALYZE "{table}"')
+            return table
+        return work
+
+    def optimize(conn):
+        conn.execute("PRAGMA optimize")
+        return "ok"
+
+    def trim(threshold):
+        # 商品列表、条码索引与目录快照按 seq 增量读取 change_log；落后于裁剪位置的读者会自动全量重载
+        def work(conn):
+            if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'change_log'").fetchone():
+                return 0
+            first_seq, last_seq = conn.execute("SELECT MIN(seq), MAX(seq) FROM change_log").fetchone()
+            if not first_seq or last_seq - first_seq < threshold:
+                return 0
+            upto = min(last_seq - CHANGE_LOG_KEEP, first_seq + TRIM_STEP_ROWS - 1)
+            return conn.execute("DELETE FROM change_log WHERE seq <= ?", (upto,)).rowcount
+        return work
+
+    # 超过两倍保留量时开始裁剪，分步删除到只剩保留量
+    threshold = 2 * CHANGE_LOG_KEEP
+    while remaining() >= MIN_STEP_BUDGET:
+        if not step("trim change_log", trim(threshold)):
+            break
+        threshold = CHANGE_LOG_KEEP + 1
+
+    step("stock snapshot", take_stock_snapshot)
+
+    for table in tables:
+        step(f"ANALYZE {table}", analyze(table))
+    step("PRAGMA optimize", optimize)
+
+    if report["before"]["auto_vacuum"] == "incremental":
+        def vacuum_step(conn):
+            free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            pages = min(free, vacuum_pages)
+            # 该 PRAGMA 每执行一步回收一页
+            for _ in range(pages):
+                conn.execute("PRAGMA incremental_vacuum(1)")
+            return pages
+        while remaining() >= MIN_STEP_BUDGET:
+            freed = step("incremental_vacuum", vacuum_step)
+            if not freed:
+                break
+    else:
+        report["steps"].append({"step": "incremental_vacuum", "skipped": "未启用 auto_vacuum=INCREMENTAL"})
+
+    # 检查点不能在事务中执行，使用单独连接；PASSIVE 模式不等待读写连接
+    conn = sqlite3.connect(db_path)
+    try:
+        busy, log_frames, checkpointed = conn.execute(f"PRAGMA wal_checkpoint({checkpoint})").fetchone()
+        report["steps"].append({"step": f"wal_checkpoint({checkpoint})",
+                                "result": {"busy": busy, "log_frames": log_frames, "checkpointed": checkpointed}})
+    finally:
+        conn.close()
+
+    report["after"] = collect_stats(db_path)
+    report["seconds"] = round(time.monotonic() - started, 3)
+    writer.execute(lambda conn: _save_report(conn, report))
+    logger.info("数据库维护完成 %s：%s", db_path, json.dumps(report, ensure_ascii=False))
+    return report
+
+
+def take_stock_snapshot(conn, every=STOCK_SNAPSHOT_EVERY):
+    """上次快照之后已跨天或流水累计满 every 条时，保存全部商品的当前库存，返回快照的商品数（无需保存时返回 0）。
+    快照记录本事务内最新的流水编号，恰好等于该流水之后的库存；快照晚些保存也无妨，历史库存查询会从上一快照补算流水"""
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'stock_snapshot_runs'").fetchone():
+        return 0
+    ledger_id = conn.execute("SELECT COALESCE(MAX(ledger_id), 0) FROM stock_ledger").fetchone()[0]
+    last = conn.execute("SELECT taken_at, ledger_id FROM stock_snapshot_runs ORDER BY run_id DESC LIMIT 1").fetchone()
+    if last and ledger_id == last[1]:
+        return 0
+    if last and ledger_id - last[1] < every and last[0] >= datetime.now().strftime("%Y-%m-%d"):
+        return 0
+    run_id = conn.execute("INSERT INTO stock_snapshot_runs (taken_at, ledger_id) VALUES (datetime('now', 'localtime'), ?)",
+                          (ledger_id,)).lastrowid
+    return conn.execute("INSERT INTO stock_snapshots (run_id, product_id, balance) SELECT ?, product_id, quantity FROM products",
+                        (run_id,)).rowcount
+
+
+def _save_report(conn, report):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS maintenance_runs (
+            run_id INTEGER PRIMARY KEY,
+            started_at TEXT NOT NULL,
+            seconds REAL NOT NULL,
+            report TEXT NOT NULL
+        )
+    ''')
+    conn.execute("INSERT INTO maintenance_runs (started_at, seconds, report) VALUES (?, ?, ?)",
+                 (report["started_at"], report["seconds"], json.dumps(report, ensure_ascii=False)))
+
+
+def enable_incremental_vacuum(db_path):
+    """切换为 auto_vacuum=INCREMENTAL（需要一次完整 VACUUM，只应在停业时通过命令行执行）。
+    VACUUM 可能重排商品表的 rowid，之后重建依赖 rowid 的全文索引"""
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=30)
+    try:
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'products_fts'").fetchone():
+            conn.execute("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+        return conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    finally:
+        conn.close()
+
+
+class MaintenanceScheduler:
+    """后台线程：写线程空闲超过 idle_seconds 且距上次维护超过 interval 时执行一次维护"""
+
+    def __init__(self, db_path, idle_seconds=IDLE_SECONDS, interval=RUN_INTERVAL, check_interval=CHECK_INTERVAL):
+        self.db_path = db_path
+        self.idle_seconds = idle_seconds
+        self.interval = interval
+        self.check_interval = check_interval
+        self.last_run = time.monotonic()
+        self.last_report = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"db-maintenance:{db_path}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        writer = db_writer.get_writer(self.db_path)
+        while not self._stop.wait(self.check_interval):
+            if time.monotonic() - self.last_run < self.interval or writer.idle_seconds < self.idle_seconds:
+                continue
+            try:
+                self.last_report = run_maintenance(self.db_path, writer=writer)
+            except Exception:
+                logger.exception("数据库维护失败：%s", self.db_path)
+            self.last_run = time.monotonic()
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def start_scheduler(db_path, **options):
+    """为该数据库启动进程级唯一的维护调度线程（已启动则直接返回）"""
+    with _schedulers_lock:
+        scheduler = _schedulers.get(db_path)
+        if scheduler is None:
+            scheduler = _schedulers[db_path] = MaintenanceScheduler(db_path, **options)
+        return scheduler
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="小商店进销存数据库维护")
+    parser.add_argument("db_path", help="数据库文件路径")
+    parser.add_argument("--budget", type=float, default=RUN_BUDGET, help="总时间预算（秒）")
+    parser.add_argument("--step-budget", type=float, default=STEP_BUDGET, help="单步时间预算（秒）")
+    parser.add_argument("--vacuum-pages", type=int, default=VACUUM_STEP_PAGES, help="每步回收的页数")
+    parser.add_argument("--checkpoint", choices=["PASSIVE", "FULL", "RESTART", "TRUNCATE"], default="PASSIVE")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                        help="先执行一次完整 VACUUM 并切换为增量回收模式（需停止收银）")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if args.enable_incremental_vacuum:
+        enabled = enable_incremental_vacuum(args.db_path)
+        logger.info("auto_vacuum=INCREMENTAL %s", "已启用" if enabled else "启用失败")
+    report = run_maintenance(args.db_path, budget=args.budget, step_budget=args.step_budget,
+                             vacuum_pages=args.vacuum_pages, checkpoint=args.checkpoint)
+    for key in ("file_bytes", "wal_bytes", "page_count", "freelist_pages", "analyzed_tables"):
+        print(f"{key}: {report['before'][key]} -> {report['after'][key]}")
+    db_writer.get_writer(args.db_path).close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+# 单写线程
+# 每个数据库文件在进程内只有一个写线程、一条写连接；各会话的写操作以「写任务」形式入队，
+# 写线程把队列中已到达的任务合并到同一个事务里提交（组提交），调用方通过 Future 等待结果。
+# 设置组提交窗口后，写线程取到一批的第一个任务时再最多等待 window 秒收集并发写入（批满即提前提交），
+# 用少量延迟换取更少的提交与 fsync 次数。
+# 任务出错使 SQLite 回滚了整个事务时（如中断、磁盘已满），同批任务全部以该错误失败，写线程继续运行；
+# 写线程一旦停止，排队中与之后提交的任务立即以 WriterUnavailable 失败，调用方不会无限等待。
+# 读操作使用只读连接池（read_pool）中的常驻连接，在 WAL 模式下与写线程并行。
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+
+MAX_BATCH = 64              # 单次组提交最多合并的写任务数
+GROUP_COMMIT_WINDOW = 0.0   # 组提交窗口（秒）；0 表示只合并已到达的任务，不额外等待
+
+
+class RollbackWork(Exception):
+    """写任务内抛出：回滚该任务已做的修改，并把 result 作为正常返回值交给调用方"""
+
+    def __init__(self, result=None):
+        super().__init__(result)
+        self.result = result
+
+
+class WriterUnavailable(sqlite3.OperationalError):
+    """写线程已停止（close() 之后或异常退出），写任务无法再执行；继承 sqlite3.OperationalError，
+    按数据库不可用处理的调用方（如收银日志兜底）无需区分"""
+
+
+class _Exclusive:
+    """单独成批的写任务（submit(exclusive=True)）：在自己的事务中执行，不与其他写任务合并"""
+
+    def __init__(self, work):
+        self.work = work
+
+    def __call__(self, conn):
+        return self.work(conn)
+
+
+def _fail(future, error):
+    """把 future 置为失败（已完成或已取消的跳过）"""
+    if not future.done():
+        try:
+            future.set_exception(error)
+        except InvalidStateError:
+            pass
+
+
+class DatabaseWriter:
+    def __init__(self, db_path, max_batch=MAX_BATCH, window=GROUP_COMMIT_WINDOW):
+        self.db_path = db_path
+        self.max_batch = max_batch
+        self.window = window
+        self.batches = 0    # 已提交的批次数与任务数，平均批量 = tasks / batches
+        self.tasks = 0
+        self._queue = queue.Queue()
+        self._state_lock = threading.Lock()
+        self.error = None   # 写线程停止的原因（WriterUnavailable）；为 None 表示仍在运行
+        self.last_write = time.monotonic()  # 最近一次提交批次的时间，供维护任务判断是否空闲
+        self._thread = threading.Thread(target=self._run, name=f"db-writer:{db_path}", daemon=True)
+        self._thread.start()
+
+    def submit(self, work, exclusive=False):
+        """提交写任务 work(conn)，返回 Future；work 内不要自行 commit/rollback。写线程已停止时抛出 WriterUnavailable。
+        exclusive=True 时该任务单独成批：可能被中断而使整个事务回滚的任务（如限时的维护步骤）不会连累其他写入"""
+        future = Future()
+        with self._state_lock:
+            if self.error is not None:
+                raise self.error
+            self._queue.put((_Exclusive(work) if exclusive else work, future))
+        return future
+
+    def execute(self, work, timeout=None, exclusive=False):
+        """提交写任务并等待其所在批次提交完成，返回 work 的返回值（或抛出其异常）；
+        超过 timeout 秒仍未完成时抛出 TimeoutError（任务仍可能稍后执行）"""
+        return self.submit(work, exclusive).result(timeout)
+
+    @property
+    def idle_seconds(self):
+        """队列为空时距最近一次写入的秒数；仍有待处理任务时为 0"""
+        if not self._queue.empty():
+            return 0.0
+        return time.monotonic() - self.last_write
+
+    def close(self):
+        """处理完已入队的任务后停止写线程"""
+        with self._state_lock:
+            if self.error is None:
+                self._queue.put(None)
+        self._thread.join()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _run(self):
+        error = WriterUnavailable(f"写线程已停止：{self.db_path}")
+        try:
+            conn = self._connect()
+        except BaseException as e:
+            error = WriterUnavailable(f"写线程无法打开数据库：{self.db_path}：{e}")
+            self._stop(error)
+            raise
+        batch = []
+        held = None     # 收集批次时遇到的单独成批任务，留作下一批
+        try:
+            while True:
+                item, held = held or self._queue.get(), None
+                if item is None:
+                    break
+                batch = [item]
+                stop = False
+                deadline = time.monotonic() + self.window
+                while len(batch) < self.max_batch and not isinstance(batch[0][0], _Exclusive):
+                    remaining = deadline - time.monotonic()
+                    try:
+                        item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stop = True
+                        break
+                    if isinstance(item[0], _Exclusive):
+                        held = item
+                        break
+                    batch.append(item)
+                try:
+                    self._commit_batch(conn, batch)
+                except Exception as e:
+                    # 提交批次时的意外错误：该批任务全部失败，回滚残留事务，写线程继续服务后续任务
+                    for _, future in batch:
+                        _fail(future, e)
+                    self._rollback(conn)
+                self.last_write = time.monotonic()
+                self.batches += 1
+                self.tasks += len(batch)
+                if stop:
+                    break
+        except BaseException as e:
+            error = WriterUnavailable(f"写线程异常退出：{self.db_path}：{e!r}")
+            for _, future in batch + ([held] if held else []):
+                _fail(future, error)
+            raise
+        finally:
+            self._stop(error)
+            conn.close()
+
+    def _stop(self, error):
+        """标记写线程已停止：此后 submit 直接抛出 error，队列中尚未执行的任务全部以 error 失败"""
+        with self._state_lock:
+            self.error = error
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                _fail(item[1], error)
+
+    @staticmethod
+    def _rollback(conn):
+        if conn.in_transaction:
+            try:
+                conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+
+    def _commit_batch(self, conn, batch):
+        outcomes = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.Error as e:
+            for _, future in batch:
+                if future.set_running_or_notify_cancel():
+                    future.set_exception(e)
+            return
+        for work, future in batch:
+            if not future.set_running_or_notify_cancel():
+                continue
+            # 每个任务一个保存点：单个任务失败只回滚它自己，不影响同批其他任务
+            conn.execute("SAVEPOINT write_task")
+            try:
+                outcome, rollback = (future, work(conn), None), False
+            except RollbackWork as e:
+                outcome, rollback = (future, e.result, None), True
+            except Exception as e:
+                outcome, rollback = (future, None, e), True
+            if not conn.in_transaction:
+                # 任务的错误（如 SQLITE_INTERRUPT、SQLITE_FULL）已让 SQLite 回滚了整个事务：
+                # 同批已执行的任务随之撤销，本批全部失败
+                error = outcome[2] or sqlite3.OperationalError("写任务执行期间事务已被回滚")
+                for _, pending in batch:
+                    _fail(pending, error)
+                return
+            if rollback:
+                conn.execute("ROLLBACK TO write_task")
+            conn.execute("RELEASE write_task")
+            outcomes.append(outcome)
+        try:
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            self._rollback(conn)
+            outcomes = [(future, None, e) for future, _, _ in outcomes]
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(db_path, **options):
+    """返回该数据库文件的进程级唯一写线程（首次调用时按 options 启动：max_batch / window）"""
+    with _writers_lock:
+        writer = _writers.get(db_path)
+        if writer is None:
+            writer = _writers[db_path] = DatabaseWriter(db_path, **options)
+        return writer
@@ -0,0 +1,138 @@
+# 销售需求预测与补货建议
+# 从销售明细（sales_data，整数商品键与 Unix 秒时间）构建「商品 × 日期」需求矩阵（NumPy），对所有商品一次性向量化计算
+# 指数平滑 / 移动平均预测、可售天数与建议补货量，结果写入 reorder_suggestions 表。
+# 计算（compute_forecast，只读）与写入（save_forecast）分开，耗时的计算不占用写连接。
+import math
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+DEFAULT_HISTORY_DAYS = 730   # 使用最近两年的销售数据
+DEFAULT_ALPHA = 0.3          # 指数平滑系数
+DEFAULT_WINDOW = 28          # 移动平均 / 波动统计窗口（天）
+DEFAULT_LEAD_TIME = 3        # 补货提前期（天）
+DEFAULT_REVIEW_PERIOD = 7    # 补货周期（天）
+DEFAULT_SERVICE_Z = 1.65     # 安全库存系数（约95%服务水平）
+CHUNK_SIZE = 8192            # 每批处理的商品数，控制需求矩阵内存占用
+FETCH_SIZE = 65536           # 每次从数据库读取的销售明细行数
+MIN_DAILY_DEMAND = 0.01      # 低于该值的日需求视为无需求（可售天数记为空）
+
+
+def build_demand_matrix(product_index, day_index, quantities, n_products, n_days):
+    """由 (商品下标, 日期下标, 数量) 三元组构建 float32 需求矩阵，形状为 [商品数, 天数]"""
+    matrix = np.zeros((n_products, n_days), dtype=np.float32)
+    np.add.at(matrix, (product_index, day_index), quantities)
+    return matrix
+
+
+def smoothing_weights(n_days, alpha):
+    """简单指数平滑的等价权重：level = matrix @ weights（以首日需求为初始水平）"""
+    ages = np.arange(n_days - 1, -1, -1, dtype=np.float64)
+    weights = alpha * (1.0 - alpha) ** ages
+    weights[0] = (1.0 - alpha) ** (n_days - 1)
+    return weights.astype(np.float32)
+
+
+def forecast_matrix(matrix, alpha=DEFAULT_ALPHA, window=DEFAULT_WINDOW):
+    """对需求矩阵的每一行计算 (指数平滑预测, 移动平均, 窗口内日需求标准差)"""
+    n_days = matrix.shape[1]
+    window = min(window, n_days)
+    ses = matrix @ smoothing_weights(n_days, alpha)
+    recent = matrix[:, -window:]
+    return ses, recent.mean(axis=1), recent.std(axis=1)
+
+
+def reorder_plan(quantity, daily_forecast, daily_std, lead_time=DEFAULT_LEAD_TIME,
+                 review_period=DEFAULT_REVIEW_PERIOD, service_z=DEFAULT_SERVICE_Z):
+    """根据当前库存与日需求预测计算 (可售天数, 建议补货量)；无需求的商品可售天数为 NaN"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        days_of_cover = np.where(daily_forecast >= MIN_DAILY_DEMAND, quantity / daily_forecast, np.nan)
+    safety_stock = service_z * daily_std * math.sqrt(lead_time)
+    target = daily_forecast * (lead_time + review_period) + safety_stock
+    suggested = np.ceil(np.maximum(target - quantity, 0.0)).astype(np.int64)
+    return days_of_cover, suggested
+
+
+def compute_forecast(conn, history_days=DEFAULT_HISTORY_DAYS, alpha=DEFAULT_ALPHA, window=DEFAULT_WINDOW,
+                     lead_time=DEFAULT_LEAD_TIME, review_period=DEFAULT_REVIEW_PERIOD,
+                     service_z=DEFAULT_SERVICE_Z, today=None, chunk_size=CHUNK_SIZE):
+    """只读计算全部商品的需求预测，返回 (reorder_suggestions 行列表, 统计信息)"""
+    started = time.perf_counter()
+    today = today or date.today()
+    start_day = today - timedelta(days=history_days - 1)
+    cursor = conn.cursor()
+
+    products = cursor.execute('''
+        SELECT p.product_id, p.quantity, COALESCE(k.product_key, -1)
+        FROM products p LEFT JOIN product_keys k ON k.product_id = p.product_id
+        ORDER BY p.product_id
+    ''').fetchall()
+    if not products:
+        return [], {"products": 0, "days": history_days, "seconds": time.perf_counter() - started}
+    product_ids = np.array([str(p[0]) for p in products])
+    stock = np.array([p[1] for p in products], dtype=np.float64)
+    # 商品键 -> 商品下标的查找表，销售明细全程只做整数运算
+    keys = np.array([p[2] for p in products], dtype=np.int64)
+    lookup = np.full(max(int(keys.max()), 0) + 1, -1, dtype=np.int64)
+    lookup[keys[keys >= 0]] = np.flatnonzero(keys >= 0)
+
+    # 分批读取销售明细，转换为 (商品下标, 日期下标, 数量) 数组；不在 SQL 中分组，避免对全表排序
+    origin = int(time.mktime(start_day.timetuple()))  # 起始日本地零点的 Unix 秒
+    cursor.execute("SELECT product_key, sold_at, quantity FROM sales_data WHERE sold_at >= ?", (origin,))
+    parts = []
+    while True:
+        batch = cursor.fetchmany(FETCH_SIZE)
+        if not batch:
+            break
+        rows = np.array(batch, dtype=np.int64)
+        sale_keys = rows[:, 0]
+        index = np.where(sale_keys < len(lookup), lookup[np.minimum(sale_keys, len(lookup) - 1)], -1)
+        days = (rows[:, 1] - origin) // 86400
+        valid = (index >= 0) & (days < history_days)
+        parts.append((index[valid], days[valid], rows[:, 2][valid].astype(np.float32)))
+    if parts:
+        product_index, day_index, sale_quantities = (np.concatenate(column) for column in zip(*parts))
+    else:
+        product_index = day_index = np.zeros(0, dtype=np.int64)
+        sale_quantities = np.zeros(0, dtype=np.float32)
+
+    # 按商品分块构建需求矩阵，100k 商品 × 730 天时单块约 24MB
+    order = np.argsort(product_index, kind="stable")
+    product_index, day_index, sale_quantities = product_index[order], day_index[order], sale_quantities[order]
+    ses = np.empty(len(product_ids), dtype=np.float64)
+    moving_average = np.empty_like(ses)
+    daily_std = np.empty_like(ses)
+    for chunk_start in range(0, len(product_ids), chunk_size):
+        chunk_end = min(chunk_start + chunk_size, len(product_ids))
+        lo, hi = np.searchsorted(product_index, [chunk_start, chunk_end])
+        matrix = build_demand_matrix(product_index[lo:hi] - chunk_start, day_index[lo:hi],
+                                     sale_quantities[lo:hi], chunk_end - chunk_start, history_days)
+        ses[chunk_start:chunk_end], moving_average[chunk_start:chunk_end], daily_std[chunk_start:chunk_end] = \
+            forecast_matrix(matrix, alpha, window)
+
+    days_of_cover, suggested = reorder_plan(stock, ses, daily_std, lead_time, review_period, service_z)
+    generated_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    cover = [None if math.isnan(v) else round(v, 1) for v in days_of_cover.tolist()]
+    rows = list(zip(product_ids.tolist(), np.round(ses, 3).tolist(), np.round(moving_average, 3).tolist(),
+                    cover, suggested.tolist(), [generated_at] * len(product_ids)))
+    return rows, {"products": len(product_ids), "days": history_days, "seconds": time.perf_counter() - started}
+
+
+def save_forecast(conn, rows):
+    """用 compute_forecast 的结果覆盖 reorder_suggestions（调用方负责提交事务）"""
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM reorder_suggestions")
+    cursor.executemany('''
+        INSERT INTO reorder_suggestions
+            (product_id, forecast_daily, moving_average, days_of_cover, suggested_quantity, generated_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', rows)
+    return len(rows)
+
+
+def run_forecast(conn, **options):
+    """在同一连接上计算并写入预测结果（调用方负责提交事务），返回统计信息"""
+    rows, summary = compute_forecast(conn, **options)
+    save_forecast(conn, rows)
+    return summary
@@ -0,0 +1,102 @@
+# 后台任务执行器
+# 报表生成等耗时任务提交到进程内共享的线程池执行，界面只保存任务ID并轮询状态，
+# 不再占用 Streamlit 脚本线程；相同 key 的任务在运行期间只执行一次（重复提交复用同一任务）。
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class Job:
+    """一个后台任务：状态、进度、结果或错误信息，由执行线程更新、界面线程读取"""
+
+    def __init__(self, job_id, key, title=""):
+        self.job_id = job_id
+        self.key = key
+        self.title = title
+        self.status = PENDING
+        self.progress = 0.0
+        self.message = "排队中"
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED)
+
+    def update(self, progress, message=""):
+        """由任务函数调用，汇报进度（0~1）与当前步骤"""
+        self.progress = max(0.0, min(1.0, progress))
+        if message:
+            self.message = message
+
+
+class JobRunner:
+    def __init__(self, max_workers=2, keep_results=50):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job-runner")
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._active = {}
+        self.keep_results = keep_results
+
+    def submit(self, key, func, *args, title="", **kwargs):
+        """提交任务 func(job, *args, **kwargs)；若相同 key 的任务仍未完成则直接返回该任务"""
+        with self._lock:
+            active_id = self._active.get(key)
+            if active_id is not None and not self._jobs[active_id].finished:
+                return self._jobs[active_id]
+            job = Job(uuid.uuid4().hex, key, title)
+            self._jobs[job.job_id] = job
+            self._active[key] = job.job_id
+            self._evict()
+        self._executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job, func, args, kwargs):
+        job.status = RUNNING
+        job.message = "执行中"
+        try:
+            job.result = func(job, *args, **kwargs)
+            job.progress = 1.0
+            job.message = "已完成"
+            job.status = DONE
+        except Exception as e:
+            job.error = str(e)
+            job.message = "执行失败"
+            job.status = FAILED
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                if self._active.get(job.key) == job.job_id:
+                    del self._active[job.key]
+
+    def _evict(self):
+        # 只淘汰已完成的旧任务，保留最近 keep_results 个结果供界面取回
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(self._jobs) - self.keep_results)]:
+            del self._jobs[job_id]
+
+
+_default_runner = None
+_default_runner_lock = threading.Lock()
+
+
+def get_runner():
+    """进程级共享的任务执行器（所有会话共用，才能对相同请求去重）"""
+    global _default_runner
+    with _default_runner_lock:
+        if _default_runner is None:
+            _default_runner = JobRunner()
+        return _default_runner
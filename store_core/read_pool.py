@@ -0,0 +1,188 @@
+# 只读连接池
+# 报表与大列表查询使用单独的只读连接（mode=ro URI + PRAGMA query_only），与单写线程互不争用；
+# read_snapshot() 在一个读事务内固定 WAL 快照，报表的多次查询看到的是同一时刻的数据。
+# stream() 为逐批读取的生成器提供独占连接的快照，生成器关闭时归还连接。
+# 可选地改为读取定期刷新的副本文件（用备份 API 分步复制），长时间的统计扫描不再拖住主库的 WAL 检查点；
+# 副本过期后在后台线程中刷新，刷新完成前继续读取旧副本（还没有副本时读取主库），报表不等待复制。
+import glob
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from . import db_backup
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE = 4               # 同时打开的只读连接上限
+REPLICA_INTERVAL = 300      # 副本文件超过该时长（秒）后，下次使用时在后台刷新
+ACQUIRE_TIMEOUT = 30        # 等待空闲只读连接的最长时间（秒）
+
+
+class ReadPool:
+    def __init__(self, db_path, size=POOL_SIZE, replica_path=None, replica_interval=REPLICA_INTERVAL,
+                 acquire_timeout=ACQUIRE_TIMEOUT):
+        self.db_path = db_path
+        self.replica_path = replica_path
+        self.replica_interval = replica_interval
+        self.acquire_timeout = acquire_timeout
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._idle = []             # [(连接, 副本文件或None), ...]
+        self._local = threading.local()
+        self.replica_file = None    # 当前副本文件（每次刷新生成新文件，旧文件在连接归还后删除）
+        self.replica_refreshed = None
+        self._refreshing = False    # 后台刷新线程是否在运行
+        if replica_path:
+            existing = sorted(self._replica_files())
+            if existing:
+                self.replica_file = existing[-1]
+                self.replica_refreshed = os.path.getmtime(self.replica_file)
+
+    # ---------- 副本 ----------
+    def _replica_files(self):
+        base, ext = os.path.splitext(self.replica_path)
+        # 文件名中的时间戳固定为19位数字，精确匹配，不会误删同目录下其他门店的副本
+        return glob.glob(f"{glob.escape(base)}-{'[0-9]' * 19}{ext}")
+
+    def refresh_replica(self):
+        """把主库分步复制为新的副本文件并切换过去，返回副本文件路径"""
+        with self._refresh_lock:
+            base, ext = os.path.splitext(self.replica_path)
+            target = f"{base}-{time.time_ns()}{ext}"
+            os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+            db_backup.copy_database(self.db_path, target + ".part")
+            os.replace(target + ".part", target)
+            with self._lock:
+                self.replica_file = target
+                self.replica_refreshed = time.time()
+                stale = [conn for conn, source in self._idle if source not in (None, target)]
+                self._idle = [(conn, source) for conn, source in self._idle if source in (None, target)]
+            for conn in stale:
+                conn.close()
+            self._remove_stale_replicas()
+            return target
+
+    def _remove_stale_replicas(self):
+        for path in self._replica_files():
+            if path != self.replica_file:
+                try:
+                    os.remove(path)
+                except OSError:
+                    # 仍有连接在读（Windows 下文件被占用），下次刷新时再删
+                    pass
+
+    def _current_replica(self):
+        """当前可读的副本文件（还没有副本时为 None，改读主库）；副本缺失或过期时启动后台刷新，不在此等待"""
+        with self._lock:
+            stale = self.replica_file is None or time.time() - self.replica_refreshed > self.replica_interval
+            if stale and not self._refreshing:
+                self._refreshing = True
+                threading.Thread(target=self._refresh_in_background, name=f"read-replica:{self.db_path}",
+                                 daemon=True).start()
+            return self.replica_file
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh_replica()
+        except Exception:
+            logger.exception("刷新报表副本失败：%s", self.db_path)
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    # ---------- 连接 ----------
+    def _connect(self, source):
+        if source is None:
+            uri = f"file:{self.db_path}?mode=ro"
+        else:
+            # 副本文件生成后不再修改，immutable 免去加锁与变更检测
+            uri = f"file:{source}?mode=ro&immutable=1"
+        conn = sqlite3.connect(uri, uri=True, isolation_level=None, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA query_only=1")
+        return conn
+
+    def _acquire(self, source):
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise sqlite3.OperationalError(f"等待只读连接超时（{self.acquire_timeout} 秒）：{self.db_path}")
+        try:
+            with self._lock:
+                for i, (conn, idle_source) in enumerate(self._idle):
+                    if idle_source == source:
+                        del self._idle[i]
+                        return conn
+            return self._connect(source)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _release(self, conn, source):
+        try:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            with self._lock:
+                if source is None or source == self.replica_file:
+                    self._idle.append((conn, source))
+                    conn = None
+            if conn is not None:
+                conn.close()
+                self._remove_stale_replicas()
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def snapshot(self, replica=False):
+        """在只读连接上开启读事务并固定快照，yield 该连接；退出时结束事务并归还连接。
+        同一线程内嵌套调用直接复用外层连接（外层 DAO 调用因此共享同一快照）。
+        replica=True 且配置了副本文件时读取副本，否则读取主库"""
+        current = getattr(self._local, "conn", None)
+        if current is not None:
+            yield current
+            return
+        with self._transaction(replica) as conn:
+            self._local.conn = conn
+            try:
+                yield conn
+            finally:
+                self._local.conn = None
+
+    @contextmanager
+    def stream(self, replica=False):
+        """独占一条只读连接的快照，不登记为本线程的当前连接，也不复用外层快照：
+        供生成器等逐批读取使用（生成器可能在调用方代码之间暂停，或在别的线程中被关闭）"""
+        with self._transaction(replica) as conn:
+            yield conn
+
+    @contextmanager
+    def _transaction(self, replica):
+        source = self._current_replica() if replica and self.replica_path else None
+        conn = self._acquire(source)
+        try:
+            conn.execute("BEGIN")
+            # BEGIN 为延迟事务，第一次读取时才建立快照；先读一次把快照固定在此刻
+            conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+            yield conn
+        finally:
+            self._release(conn, source)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            conn.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path, **options):
+    """返回该数据库的进程级只读连接池（首次调用时按 options 创建）"""
+    with _pools_lock:
+        pool = _pools.get(db_path)
+        if pool is None:
+            pool = _pools[db_path] = ReadPool(db_path, **options)
+        return pool
@@ -0,0 +1,333 @@
+# 收银日志（离线销售）
+# 每台收银终端按天一个只追加的 JSON Lines 文件：结算时写入本机日志即可返回，fsync 由后台线程按批合并
+# （有调用方等待落盘时立即 fsync，fsync 期间到达的记录合并到下一次；不等待落盘的记录每 FSYNC_INTERVAL 秒
+# 或累计 FSYNC_BATCH 笔 fsync 一次）。
+# 同步线程把日志中的销售批量补录进数据库，每个写事务处理 SYNC_BATCH 笔：每笔销售带去重键（终端编号:启动编号:序号，
+# 启动编号为打开日志时的纳秒时间戳，旧日志文件删除后重启、序号从头计数也不会与已补录的键重复），
+# 已补录的键记在 journal_applied 表，读取位置记在 journal_offsets 表并与补录在同一事务中提交，
+# 重复同步、日志文件被复制重放都不会重复入账。
+# 界面与收银接口可能同时同步同一日志目录：补录与删除文件前都在写事务内重新读取 journal_offsets，
+# 读取位置只前进不后退，已被另一进程删除的文件直接跳过。
+import glob
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+
+from . import db_writer
+
+logger = logging.getLogger(__name__)
+
+FSYNC_INTERVAL = 0.05   # 不等待落盘的记录最迟多久 fsync（秒）
+FSYNC_BATCH = 32        # 累计该笔数未落盘时立即 fsync
+SYNC_INTERVAL = 5       # 同步线程检查日志的间隔（秒）
+SYNC_BATCH = 500        # 每个补录事务处理的销售笔数
+
+
+def journal_dir_for(db_path):
+    """数据库对应的收银日志目录（与数据库文件同目录，多门店时互不混用）"""
+    return os.path.splitext(db_path)[0] + "_journal"
+
+
+def ensure_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS journal_applied (
+            dedup_key TEXT PRIMARY KEY,
+            applied_at INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS journal_offsets (
+            file_name TEXT PRIMARY KEY,
+            offset INTEGER NOT NULL
+        )
+    ''')
+
+
+class SalesJournal:
+    def __init__(self, terminal_id, journal_dir, fsync_interval=FSYNC_INTERVAL, fsync_batch=FSYNC_BATCH):
+        if not re.fullmatch(r"[\w.-]+", terminal_id):
+            raise ValueError(f"终端编号只能包含字母、数字、下划线、点和横线：{terminal_id}")
+        self.terminal_id = terminal_id
+        self.journal_dir = journal_dir
+        self.fsync_interval = fsync_interval
+        self.fsync_batch = fsync_batch
+        os.makedirs(journal_dir, exist_ok=True)
+        self._cond = threading.Condition()
+        self._file = None
+        self._day = None
+        self._seq = self._recover_seq()
+        # 本次启动的编号：序号只在同一次启动内唯一（已补录的旧日志文件会被删除，重启后无法据此恢复序号）
+        self._boot = time.time_ns()
+        self._durable_seq = self._seq
+        self._waiters = 0
+        self._thread = threading.Thread(target=self._flush_loop, name=f"sales-journal:{terminal_id}", daemon=True)
+        self._thread.start()
+
+    def _segment(self, day):
+        return os.path.join(self.journal_dir, f"{self.terminal_id}-{day}.jsonl")
+
+    def _recover_seq(self):
+        """从最新的日志文件末尾恢复序号；末尾若有写了一半的行（写入时崩溃）先截掉"""
+        segments = sorted(glob.glob(os.path.join(glob.escape(self.journal_dir), f"{self.terminal_id}-*.jsonl")))
+        if not segments:
+            return 0
+        with open(segments[-1], "rb+") as f:
+            data = f.read()
+            end = data.rfind(b"\n") + 1
+            if end < len(data):
+                f.truncate(end)
+        lines = data[:end].splitlines()
+        return json.loads(lines[-1])["seq"] if lines else 0
+
+    def _open_segment(self, now):
+        day = now.strftime("%Y%m%d")
+        if day != self._day:
+            if self._file is not None:
+                self._sync_file()
+                self._file.close()
+            self._file = open(self._segment(day), "ab")
+            self._day = day
+
+    def append(self, items, durable=True):
+        """记录一笔销售 items=[(商品ID, 商品名称, 数量, 单价), ...]，返回去重键；
+        durable=True 时等到该记录 fsync 落盘后返回"""
+        now = datetime.now()
+        with self._cond:
+            self._open_segment(now)
+            self._seq += 1
+            seq = self._seq
+            record = {"key": f"{self.terminal_id}:{self._boot}:{seq}", "seq": seq, "sold_at": now.strftime("%Y-%m-%d %H:%M:%S"),
+                      "items": [list(item) for item in items]}
+            self._file.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+            # 写入操作系统缓冲区：进程崩溃不丢，断电保护由批量 fsync 提供
+            self._file.flush()
+            if durable or seq - self._durable_seq >= self.fsync_batch:
+                # 有调用方等待落盘时立即 fsync；fsync 进行期间到达的记录合并到下一次
+                self._cond.notify_all()
+            if durable:
+                self._waiters += 1
+                while self._durable_seq < seq:
+                    self._cond.wait()
+                self._waiters -= 1
+        return record["key"]
+
+    def _sync_file(self):
+        os.fsync(self._file.fileno())
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                pending = self._seq - self._durable_seq
+                if not pending or (not self._waiters and pending < self.fsync_batch):
+                    self._cond.wait(self.fsync_interval)
+                if self._durable_seq >= self._seq:
+                    continue
+                seq = self._seq
+                fileno = self._file.fileno()
+            # fsync 期间不持有锁，其他收银仍可继续追加
+            try:
+                os.fsync(fileno)
+            except OSError:
+                pass    # 换日时旧文件已落盘并关闭
+            with self._cond:
+                self._durable_seq = max(self._durable_seq, seq)
+                self._cond.notify_all()
+
+
+def _read_records(path, offset):
+    """从 offset 起读取完整的日志行，返回 [(记录, 该行结束位置), ...]（末尾未写完的行留待下次；文件已删除时返回空列表）"""
+    try:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+    except FileNotFoundError:
+        return []
+    records = []
+    position = offset
+    for line in data.splitlines(keepends=True):
+        if not line.endswith(b"\n"):
+            break
+        position += len(line)
+        if line.strip():
+            records.append((json.loads(line), position))
+    return records
+
+
+def _stored_offset(conn, file_name):
+    row = conn.execute("SELECT offset FROM journal_offsets WHERE file_name = ?", (file_name,)).fetchone()
+    return row[0] if row else 0
+
+
+def _apply(records, path):
+    """一个写任务：补录一批销售并推进读取位置；返回 (补录笔数, 重复笔数, 超卖商品集合)"""
+    file_name = os.path.basename(path)
+
+    def work(conn):
+        applied = duplicates = 0
+        oversold = set()
+        # 另一进程可能已补录这些记录，甚至已补录完并删除了文件：以事务内的读取位置为准
+        if not os.path.exists(path):
+            return applied, duplicates, oversold
+        done = _stored_offset(conn, file_name)
+        pending = [(record, position) for record, position in records if position > done]
+        if not pending:
+            return applied, duplicates, oversold
+        now = int(time.time())
+        for record, _ in pending:
+            cursor = conn.execute("INSERT OR IGNORE INTO journal_applied (dedup_key, applied_at) VALUES (?, ?)",
+                                  (record["key"], now))
+            if cursor.rowcount == 0:
+                duplicates += 1
+                continue
+            for product_id, product_name, quantity, unit_price in record["items"]:
+                # 离线期间商品已经卖出，库存照扣；扣成负数说明账实不符，记入结果供核对
+                conn.execute("UPDATE products SET quantity = quantity - ? WHERE product_id = ?", (quantity, product_id))
+                row = conn.execute("SELECT quantity FROM products WHERE product_id = ?", (product_id,)).fetchone()
+                if row and row[0] < 0:
+                    oversold.add(product_id)
+                conn.execute('''
+                    INSERT INTO sales (product_id, product_name, quantity, unit_price, total_price, sale_date)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (product_id, product_name, quantity, unit_price, round(unit_price * quantity, 2), record["sold_at"]))
+            applied += 1
+        conn.execute('''
+            INSERT INTO journal_offsets (file_name, offset) VALUES (?, ?)
+            ON CONFLICT(file_name) DO UPDATE SET offset = MAX(offset, excluded.offset)
+        ''', (file_name, pending[-1][1]))
+        return applied, duplicates, oversold
+
+    return work
+
+
+def _remove_if_applied(path):
+    """一个写任务：日志文件已全部补录时删除文件及其读取位置，返回是否删除"""
+    file_name = os.path.basename(path)
+
+    def work(conn):
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            return False
+        if _stored_offset(conn, file_name) != size:
+            return False
+        os.remove(path)
+        conn.execute("DELETE FROM journal_offsets WHERE file_name = ?", (file_name,))
+        return True
+
+    return work
+
+
+def sync_journals(db_path, journal_dir=None, batch=SYNC_BATCH, writer=None):
+    """把日志目录中尚未补录的销售写入数据库，返回统计；已补录完且早于昨天的日志文件随后删除"""
+    journal_dir = journal_dir or journal_dir_for(db_path)
+    result = {"applied": 0, "duplicates": 0, "oversold": [], "files": 0, "removed": 0}
+    if not os.path.isdir(journal_dir):
+        return result
+    writer = writer or db_writer.get_writer(db_path)
+    oversold = set()
+    offsets = writer.execute(lambda conn: (ensure_tables(conn.cursor()),
+                                           dict(conn.execute("SELECT file_name, offset FROM journal_offsets")))[1])
+    cutoff = (datetime.now() - timedelta(days=1)).strftime("%Y%m%d")
+    for path in sorted(glob.glob(os.path.join(glob.escape(journal_dir), "*.jsonl"))):
+        file_name = os.path.basename(path)
+        offset = offsets.get(file_name, 0)
+        records = _read_records(path, offset)
+        result["files"] += 1
+        for start in range(0, len(records), batch):
+            chunk = records[start:start + batch]
+            applied, duplicates, chunk_oversold = writer.execute(_apply(chunk, path))
+            result["applied"] += applied
+            result["duplicates"] += duplicates
+            oversold |= chunk_oversold
+        day = file_name.rsplit("-", 1)[-1][:-len(".jsonl")]
+        if day < cutoff and writer.execute(_remove_if_applied(path)):
+            result["removed"] += 1
+    result["oversold"] = sorted(oversold)
+    if result["applied"] or result["oversold"]:
+        logger.info("收银日志同步 %s：%s", db_path, result)
+    return result
+
+
+class JournalSync:
+    """后台线程：每 interval 秒把收银日志补录进数据库（数据库暂不可用时下次重试）"""
+
+    def __init__(self, db_path, journal_dir=None, interval=SYNC_INTERVAL):
+        self.db_path = db_path
+        self.journal_dir = journal_dir or journal_dir_for(db_path)
+        self.interval = interval
+        self.last_result = None
+        self.last_error = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"journal-sync:{db_path}", daemon=True)
+        self._thread.start()
+
+    def trigger(self):
+        """有新记录时立即同步一次，不必等到下个周期"""
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self.last_result = sync_journals(self.db_path, self.journal_dir)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                logger.warning("收银日志同步失败，稍后重试：%s", e)
+
+
+_journals = {}
+_syncs = {}
+_registry_lock = threading.Lock()
+
+
+def get_journal(terminal_id, journal_dir):
+    """进程级唯一的终端日志（同一终端的日志文件只能由一个进程追加）"""
+    with _registry_lock:
+        key = (terminal_id, journal_dir)
+        journal = _journals.get(key)
+        if journal is None:
+            journal = _journals[key] = SalesJournal(terminal_id, journal_dir)
+        return journal
+
+
+def start_sync(db_path, **options):
+    """为该数据库启动进程级唯一的日志同步线程（已启动则直接返回）"""
+    with _registry_lock:
+        sync = _syncs.get(db_path)
+        if sync is None:
+            sync = _syncs[db_path] = JournalSync(db_path, **options)
+        return sync
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="收银日志补录")
+    parser.add_argument("db_path", help="数据库文件路径")
+    parser.add_argument("--dir", help="日志目录，默认为 <数据库名>_journal")
+    parser.add_argument("--batch", type=int, default=SYNC_BATCH, help="每个事务补录的销售笔数")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    result = sync_journals(args.db_path, args.dir, batch=args.batch)
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    print(json.dumps(result, ensure_ascii=False))
+    db_writer.get_writer(args.db_path).close()
+
+
+if __name__ == "__main__":
+    main()
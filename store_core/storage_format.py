@@ -0,0 +1,228 @@
+# 销售 / 库存操作的紧凑存储格式
+# 明细行以整数代理键（product_keys.product_key）引用商品、以 Unix 秒存储时间，商品名称通过维表关联得到；
+# 原来的 sales / inventory_operations 改为同名兼容视图（含 INSTEAD OF INSERT 触发器），已有的读写代码不受影响；
+# 视图列顺序与建表语句一致（早期库中 quantity 由 ALTER TABLE 补在 inventory_operations 末尾，读写代码均按列名访问）。
+# 商品改名时由触发器先把改名前的销售补记原名称，再更新维表名称，之后的销售仍无需单独保存名称。
+# 旧库首次打开时自动迁移，并把迁移前后的存储大小与扫描耗时记录到 schema_migrations 表。
+import json
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+MIGRATION_NAME = "compact_sales_inventory"
+
+# 视图中的时间列：把 Unix 秒还原为本地时间字符串（与原 TEXT 列格式一致）
+LOCAL_TIME = "datetime({column}, 'unixepoch', 'localtime')"
+# 本地时间字符串转 Unix 秒
+EPOCH = "CAST(strftime('%s', {column}, 'utc') AS INTEGER)"
+
+
+def ensure(conn):
+    """创建紧凑存储表与兼容视图；若 sales / inventory_operations 仍为旧表则迁移数据，返回迁移统计（无需迁移时为 None）"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS product_keys (
+            product_key INTEGER PRIMARY KEY,
+            product_id TEXT NOT NULL UNIQUE,
+            name TEXT
+        )
+    ''')
+    # product_name 只在与维表名称不同（商品改名前的历史销售）时保存，其余为 NULL
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sales_data (
+            sale_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_key INTEGER NOT NULL REFERENCES product_keys(product_key),
+            quantity INTEGER NOT NULL,
+            unit_price REAL NOT NULL,
+            total_price REAL NOT NULL,
+            sold_at INTEGER NOT NULL,
+            product_name TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS inventory_operations_data (
+            operation_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_key INTEGER NOT NULL REFERENCES product_keys(product_key),
+            operation_type TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            operated_at INTEGER NOT NULL,
+            staff_id TEXT NOT NULL,
+            notes TEXT
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sales_data_time ON sales_data(sold_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_inventory_operations_data_product "
+                 "ON inventory_operations_data(product_key, operated_at)")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            name TEXT PRIMARY KEY,
+            applied_at TEXT NOT NULL,
+            stats TEXT
+        )
+    ''')
+
+    legacy = {name for (name,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ('sales', 'inventory_operations')")}
+    stats = _migrate(conn, legacy) if legacy else None
+    _create_views(conn)
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products'").fetchone():
+        _create_rename_trigger(conn)
+        _sync_names(conn)
+    return stats
+
+
+def _create_views(conn):
+    conn.execute(f'''
+        CREATE VIEW IF NOT EXISTS sales AS
+        SELECT s.sale_id, k.product_id, COALESCE(s.product_name, k.name) AS product_name, s.quantity,
+               s.unit_price, s.total_price, {LOCAL_TIME.format(column="s.sold_at")} AS sale_date
+        FROM sales_data s JOIN product_keys k ON k.product_key = s.product_key
+    ''')
+    conn.execute(f'''
+        CREATE VIEW IF NOT EXISTS inventory_operations AS
+        SELECT o.operation_id, k.product_id, o.operation_type, o.quantity,
+               {LOCAL_TIME.format(column="o.operated_at")} AS operation_date, o.staff_id, o.notes
+        FROM inventory_operations_data o JOIN product_keys k ON k.product_key = o.product_key
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS sales_insert INSTEAD OF INSERT ON sales BEGIN
+            INSERT OR IGNORE INTO product_keys (product_id, name) VALUES (new.product_id, new.product_name);
+            INSERT INTO sales_data (sale_id, product_key, quantity, unit_price, total_price, sold_at, product_name)
+            SELECT new.sale_id, k.product_key, new.quantity, new.unit_price, new.total_price,
+                   {EPOCH.format(column="new.sale_date")}, NULLIF(new.product_name, k.name)
+            FROM product_keys k WHERE k.product_id = new.product_id;
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS inventory_operations_insert INSTEAD OF INSERT ON inventory_operations BEGIN
+            INSERT OR IGNORE INTO product_keys (product_id, name)
+            VALUES (new.product_id, (SELECT name FROM products WHERE product_id = new.product_id));
+            INSERT INTO inventory_operations_data (operation_id, product_key, operation_type, quantity, operated_at, staff_id, notes)
+            SELECT new.operation_id, k.product_key, new.operation_type, new.quantity,
+                   {EPOCH.format(column="new.operation_date")}, new.staff_id, new.notes
+            FROM product_keys k WHERE k.product_id = new.product_id;
+        END
+    ''')
+
+
+def _create_rename_trigger(conn):
+    # 维表名称为 NULL 的销售按维表显示，改名前先补记原名称，历史销售名称不变
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS product_keys_rename AFTER UPDATE OF name ON products
+        WHEN old.name IS NOT new.name BEGIN
+            UPDATE sales_data SET product_name = (SELECT name FROM product_keys WHERE product_id = new.product_id)
+            WHERE product_name IS NULL
+              AND product_key = (SELECT product_key FROM product_keys WHERE product_id = new.product_id);
+            UPDATE product_keys SET name = new.name WHERE product_id = new.product_id;
+        END
+    ''')
+
+
+def _sync_names(conn):
+    """维表名称与商品表不一致（改名触发器建立之前改过名）时更新维表，并把已与新名称相同的销售名称改回 NULL"""
+    stale = conn.execute('''
+        SELECT k.product_key, k.name, p.name FROM product_keys k JOIN products p ON p.product_id = k.product_id
+        WHERE k.name IS NOT p.name
+    ''').fetchall()
+    for product_key, old_name, new_name in stale:
+        conn.execute("UPDATE sales_data SET product_name = ? WHERE product_key = ? AND product_name IS NULL",
+                     (old_name, product_key))
+        conn.execute("UPDATE sales_data SET product_name = NULL WHERE product_key = ? AND product_name = ?",
+                     (product_key, new_name))
+        conn.execute("UPDATE product_keys SET name = ? WHERE product_key = ?", (new_name, product_key))
+    return len(stale)
+
+
+def _table_bytes(conn, *names):
+    """表及其索引占用的字节数（SQLite 未编译 dbstat 时返回 None）"""
+    try:
+        placeholders = ",".join("?" * len(names))
+        return conn.execute(f'''
+            SELECT SUM(pgsize) FROM dbstat WHERE name IN ({placeholders})
+               OR name IN (SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name IN ({placeholders}))
+        ''', names + names).fetchone()[0] or 0
+    except sqlite3.OperationalError:
+        return None
+
+
+def _timed(conn, sql, params=()):
+    started = time.perf_counter()
+    conn.execute(sql, params).fetchall()
+    return round((time.perf_counter() - started) * 1000, 3)
+
+
+def _migrate(conn, legacy):
+    # 基准查询：最近30天按商品汇总销量（预测与报表的典型扫描）
+    since = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d %H:%M:%S")
+    stats = {"bytes_before": _table_bytes(conn, *sorted(legacy))}
+    if "sales" in legacy:
+        stats["sales_rows"] = conn.execute("SELECT COUNT(*) FROM sales").fetchone()[0]
+        stats["scan_ms_before"] = _timed(
+            conn, "SELECT product_id, SUM(quantity) FROM sales WHERE sale_date >= ? GROUP BY product_id", (since,))
+    if "inventory_operations" in legacy:
+        stats["inventory_rows"] = conn.execute("SELECT COUNT(*) FROM inventory_operations").fetchone()[0]
+
+    conn.execute("SAVEPOINT storage_migration")
+    try:
+        conn.execute("INSERT OR IGNORE INTO product_keys (product_id, name) SELECT product_id, name FROM products")
+        if "sales" in legacy:
+            conn.execute('''
+                INSERT OR IGNORE INTO product_keys (product_id, name)
+                SELECT product_id, product_name FROM sales GROUP BY product_id
+            ''')
+            conn.execute(f'''
+                INSERT INTO sales_data (sale_id, product_key, quantity, unit_price, total_price, sold_at, product_name)
+                SELECT s.sale_id, k.product_key, s.quantity, s.unit_price, s.total_price,
+                       {EPOCH.format(column="s.sale_date")}, NULLIF(s.product_name, k.name)
+                FROM sales s JOIN product_keys k ON k.product_id = s.product_id
+            ''')
+            conn.execute("DROP TABLE sales")
+        if "inventory_operations" in legacy:
+            conn.execute('''
+                INSERT OR IGNORE INTO product_keys (product_id)
+                SELECT DISTINCT product_id FROM inventory_operations
+            ''')
+            conn.execute(f'''
+                INSERT INTO inventory_operations_data
+                    (operation_id, product_key, operation_type, quantity, operated_at, staff_id, notes)
+                SELECT o.operation_id, k.product_key, o.operation_type, o.quantity,
+                       {EPOCH.format(column="o.operation_date")}, o.staff_id, o.notes
+                FROM inventory_operations o JOIN product_keys k ON k.product_id = o.product_id
+            ''')
+            conn.execute("DROP TABLE inventory_operations")
+        conn.execute("RELEASE storage_migration")
+    except Exception:
+        conn.execute("ROLLBACK TO storage_migration")
+        conn.execute("RELEASE storage_migration")
+        raise
+
+    data_tables = tuple(f"{name}_data" for name in sorted(legacy)) + ("product_keys",)
+    stats["bytes_after"] = _table_bytes(conn, *data_tables)
+    if "sales" in legacy:
+        stats["scan_ms_after"] = _timed(
+            conn, "SELECT product_key, SUM(quantity) FROM sales_data WHERE sold_at >= ? GROUP BY product_key",
+            (int(datetime.strptime(since, "%Y-%m-%d %H:%M:%S").timestamp()),))
+    conn.execute("INSERT OR REPLACE INTO schema_migrations (name, applied_at, stats) VALUES (?, ?, ?)",
+                 (MIGRATION_NAME, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), json.dumps(stats)))
+    return stats
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="迁移为紧凑存储格式")
+    parser.add_argument("db_path", help="数据库文件路径")
+    args = parser.parse_args(argv)
+    connection = sqlite3.connect(args.db_path)
+    result = ensure(connection)
+    connection.commit()
+    if result is None:
+        row = connection.execute("SELECT applied_at, stats FROM schema_migrations WHERE name = ?",
+                                 (MIGRATION_NAME,)).fetchone()
+        print(f"已是紧凑存储格式（迁移时间：{row[0]}）：{row[1]}" if row else "已是紧凑存储格式")
+    else:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    connection.close()
+
+
+if __name__ == "__main__":
+    main()
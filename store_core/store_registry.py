@@ -0,0 +1,67 @@
+# 门店登记
+# 一个进程可同时服务多家门店：每家门店有自己的数据库文件与商品图片目录，登记在程序目录下的 stores.json：
+#   {"stores": [{"store_id": "main", "name": "总店", "db": "store_management.db", "photos": "product_photos"},
+#               {"store_id": "east", "name": "东区店", "db": "stores/east.db", "photos": "stores/east_photos"}]}
+# 相对路径以 stores.json 所在目录为基准；没有 stores.json 时只有一家默认门店（即原来的单店部署）。
+import json
+import os
+import threading
+from collections import namedtuple
+
+# 程序目录（store_core 包的上一级）
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REGISTRY_FILE = os.path.join(BASE_DIR, "stores.json")
+DEFAULT_STORE_ID = "main"
+
+Store = namedtuple("Store", ["store_id", "name", "db_path", "photo_dir"])
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def default_store(base_dir=BASE_DIR):
+    return Store(DEFAULT_STORE_ID, "本店", os.path.join(base_dir, "store_management.db"),
+                 os.path.join(base_dir, "product_photos"))
+
+
+def load_stores(registry_file=REGISTRY_FILE):
+    """读取门店登记，返回 [Store, ...]（按登记顺序）；文件修改后下次调用自动重新读取"""
+    if not os.path.exists(registry_file):
+        return [default_store(os.path.dirname(registry_file))]
+    mtime = os.path.getmtime(registry_file)
+    with _cache_lock:
+        cached = _cache.get(registry_file)
+        if cached and cached[0] == mtime:
+            return cached[1]
+    base_dir = os.path.dirname(os.path.abspath(registry_file))
+    with open(registry_file, encoding="utf-8") as f:
+        entries = json.load(f)["stores"]
+    stores = []
+    seen = set()
+    for entry in entries:
+        store_id = str(entry["store_id"])
+        if store_id in seen:
+            raise ValueError(f"门店编号重复：{store_id}")
+        seen.add(store_id)
+        stores.append(Store(
+            store_id,
+            entry.get("name", store_id),
+            os.path.join(base_dir, entry.get("db", f"{store_id}.db")),
+            os.path.join(base_dir, entry.get("photos", f"{store_id}_photos")),
+        ))
+    if not stores:
+        raise ValueError(f"{registry_file} 中没有登记任何门店")
+    with _cache_lock:
+        _cache[registry_file] = (mtime, stores)
+    return stores
+
+
+def get_store(store_id=None, registry_file=REGISTRY_FILE):
+    """按编号查找门店；store_id 为空时返回第一家门店，未登记的编号抛出 ValueError（不会误用其他门店的数据库）"""
+    stores = load_stores(registry_file)
+    if not store_id:
+        return stores[0]
+    store = next((store for store in stores if store.store_id == store_id), None)
+    if store is None:
+        raise ValueError(f"未登记的门店编号：{store_id}（已登记：{', '.join(s.store_id for s in stores)}）")
+    return store
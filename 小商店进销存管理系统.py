@@ -1,16 +1,15 @@
-# 优先设置Matplotlib后端（必须在导入pyplot前执行）
-import matplotlib
-matplotlib.use('Agg')
-
-import matplotlib.font_manager as fm
+# pandas / Matplotlib 在表格、报表用到时才导入（见各页面函数），登录页与收银台首屏不等待它们加载
 import streamlit as st
-import sqlite3
 import os
 from datetime import datetime
-import pandas as pd
-import matplotlib.pyplot as plt
-from PIL import Image
 import io
+import re
+import socket
+import threading
+from store_core import consolidated_report, job_runner, store_registry
+from store_core.data_access import (DEFAULT_REORDER_POINT, DEFAULT_WARNING_LEVEL, REPORT_REPLICA_FILE,
+                                    UPDATE_CONFLICT, UPDATE_DUPLICATE, UPDATE_OK, DatabaseManager, InventoryDAO,
+                                    ProductDAO, SalesDAO, StaffDAO, UserDAO)
 
 # ===================== 工具函数 =====================
 def confirm_dialog(message, key_suffix="", target_state=None):
@@ -29,16 +28,99 @@ def confirm_dialog(message, key_suffix="", target_state=None):
                 st.session_state[target_state] = False
             st.rerun()
 
+def reset_form_state(defaults):
+    """将表单控件恢复为默认值（用于按钮 on_click 回调或控件创建之前）"""
+    for key, value in defaults.items():
+        st.session_state[key] = value
+
+def show_flash_message(state_key):
+    """显示并清除上一次提交留下的提示信息"""
+    message = st.session_state.pop(state_key, None)
+    if message:
+        st.success(message)
+
+def product_picker(key, label="搜索商品"):
+    """商品搜索选择器：按名称/类别/ID前缀检索，返回选中的商品记录（未选中时返回None）"""
+    query = st.text_input(label, key=key, placeholder="输入商品名称、类别或ID后回车")
+    if not query:
+        return None
+    matches = product_dao.search(query, limit=20)
+    exact = product_dao.get_product(query.strip())
+    if exact:
+        matches = [exact] + [p for p in matches if p[0] != exact[0]]
+    if not matches:
+        st.error("未找到该商品！")
+        return None
+    options = {f"{p[0]} - {p[1]}（{p[4]}，库存：{p[3]}）": p for p in matches}
+    choice = st.selectbox("匹配商品", list(options), key=f"{key}_choice")
+    return options[choice]
+
+STOCK_STATUS_LABELS = ("🔴 需补货", "🟡 偏低", "🟢 正常")
+PAGE_SIZE = 500  # 大列表每页显示的行数
+CHANGE_FEED_INTERVAL = 5  # 商品列表检查其他会话改动（变更日志）的间隔（秒）
+
+def stock_status(quantities, reorder_levels, warning_levels):
+    """按补货阈值/预警线整列计算库存状态（与库存预警使用同一套阈值），作为普通文本列显示，表格保持虚拟滚动"""
+    import numpy as np
+    quantities = np.asarray(quantities)
+    return np.select([quantities <= np.asarray(reorder_levels), quantities <= np.asarray(warning_levels)],
+                     STOCK_STATUS_LABELS[:2], STOCK_STATUS_LABELS[2])
+
+def page_of(frame, key):
+    """大列表分页：只返回当前页的行，超过一页时显示页码输入框"""
+    pages = max(1, -(-len(frame) // PAGE_SIZE))
+    if pages == 1:
+        return frame
+    if st.session_state.get(key, 1) > pages:
+        st.session_state[key] = pages
+    page = st.number_input(f"页码（共 {pages} 页，{len(frame)} 条）", min_value=1, max_value=pages, step=1, key=key)
+    start = (page - 1) * PAGE_SIZE
+    return frame.iloc[start:start + PAGE_SIZE]
+
+# 列表的列标题与显示格式（DAO 返回的 DataFrame 保持数值/时间类型，格式化交给前端表格）
+PRODUCT_COLUMN_CONFIG = {
+    "product_id": "商品ID",
+    "name": "商品名称",
+    "price": st.column_config.NumberColumn("单价(¥)", format="%.2f"),
+    "quantity": "库存数量",
+    "stock_status": "库存状态",
+    "category": "商品类别",
+    "staff_name": "录入人员",
+    "barcode": "条码",
+    "reorder_point": "补货阈值",
+}
+SALE_COLUMN_CONFIG = {
+    "sale_id": "销售ID",
+    "product_id": "商品ID",
+    "product_name": "商品名称",
+    "quantity": "销售数量",
+    "unit_price": st.column_config.NumberColumn("单价(¥)", format="%.2f"),
+    "total_price": st.column_config.NumberColumn("总价(¥)", format="%.2f"),
+    "sale_date": st.column_config.DatetimeColumn("销售时间", format="YYYY-MM-DD HH:mm:ss"),
+}
+OPERATION_TYPE_LABELS = {"in": "入库", "out": "出库"}
+OPERATION_COLUMN_CONFIG = {
+    "operation_id": "操作ID",
+    "product_id": "商品ID",
+    "product_name": "商品名称",
+    "operation_type": "操作类型",
+    "quantity": "操作数量",
+    "balance": "操作后库存",
+    "stock_status": "库存状态",
+    "operation_date": st.column_config.DatetimeColumn("操作时间", format="YYYY-MM-DD HH:mm:ss"),
+    "staff_name": "操作人员",
+    "notes": "备注",
+}
+
 def rebuild_font_cache():
     """重建字体缓存"""
+    import matplotlib.font_manager as fm
     try:
         fm._load_fontmanager(try_read_cache=False)
     except AttributeError:
         if hasattr(fm, '_rebuild'):
             fm._rebuild()
 
-rebuild_font_cache()
-
 # ===================== 全局配置 =====================
 st.set_page_config(
     page_title="小商店进销存管理系统",
@@ -54,13 +136,9 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-# 路径配置
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-PHOTO_DIR = os.path.join(BASE_DIR, "product_photos")
-DB_FILE = os.path.join(BASE_DIR, "store_management.db")
-
 # Matplotlib中文配置
 def get_chinese_font():
+    import matplotlib.font_manager as fm
     font_candidates = ['SimHei', 'Microsoft YaHei', 'WenQuanYi Micro Hei', 'PingFang SC']
     font_files = fm.findSystemFonts()
     font_names = [fm.FontProperties(fname=f).get_name() for f in font_files]
@@ -70,9 +148,16 @@ def get_chinese_font():
             return font
     return 'DejaVu Sans'
 
-chinese_font = get_chinese_font()
-plt.rcParams["font.family"] = chinese_font
-plt.rcParams["axes.unicode_minus"] = False
+@st.cache_resource
+def setup_matplotlib_font():
+    """重建字体缓存并配置中文字体（每个进程只执行一次，避免每次重跑都扫描系统字体）；在首次生成报表时调用"""
+    import matplotlib
+    matplotlib.use('Agg')
+    rebuild_font_cache()
+    font = get_chinese_font()
+    matplotlib.rcParams["font.family"] = font
+    matplotlib.rcParams["axes.unicode_minus"] = False
+    return font
 
 # 颜色常量
 PRIMARY_COLOR = "#2c3e50"
@@ -186,322 +271,28 @@ st.markdown(f"""
     </style>
 """, unsafe_allow_html=True)
 
-# ===================== 数据库管理类 =====================
-class DatabaseManager:
-    def __init__(self, db_name=DB_FILE):
-        self.db_name = db_name
-        self.photo_dir = PHOTO_DIR
-        if not os.path.exists(self.photo_dir):
-            os.makedirs(self.photo_dir)
-        self.init_database()
-    
-    def get_connection(self):
-        return sqlite3.connect(self.db_name)
-    
-    def init_database(self):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # 员工表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS staff (
-                staff_id TEXT PRIMARY KEY,
-                name TEXT NOT NULL,
-                position TEXT NOT NULL
-            )
-        ''')
-        
-        if cursor.execute("SELECT COUNT(*) FROM staff").fetchone()[0] == 0:
-            staff_members = [
-                ("staff001", "张三", "管理员"),
-                ("staff002", "李四", "收银员"),
-                ("staff003", "王五", "仓库管理员"),
-                ("staff004", "赵六", "采购员")
-            ]
-            cursor.executemany('INSERT INTO staff VALUES (?, ?, ?)', staff_members)
-        
-        # 用户表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                username TEXT PRIMARY KEY,
-                password TEXT NOT NULL,
-                staff_id TEXT,
-                role TEXT DEFAULT 'user',
-                FOREIGN KEY (staff_id) REFERENCES staff(staff_id)
-            )
-        ''')
-        
-        if cursor.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 0:
-            cursor.execute('INSERT INTO users VALUES (?, ?, ?, ?)', ("user", "123456", "staff001", "admin"))
-            cursor.execute('INSERT INTO users VALUES (?, ?, ?, ?)', ("test", "123456", "staff002", "user"))
-        
-        # 商品表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS products (
-                product_id TEXT PRIMARY KEY,
-                name TEXT NOT NULL,
-                price REAL NOT NULL,
-                quantity INTEGER NOT NULL,
-                category TEXT NOT NULL,
-                staff_id TEXT NOT NULL,
-                photo_path TEXT,
-                FOREIGN KEY (staff_id) REFERENCES staff(staff_id)
-            )
-        ''')
-        
-        if cursor.execute("SELECT COUNT(*) FROM products").fetchone()[0] == 0:
-            product_list = [
-                ("p001", "土豆", 2.5, 100, "蔬菜", "staff001", ""),
-                ("p002", "鸡肉", 15.8, 50, "肉类", "staff001", ""),
-                ("p003", "牛肉", 38.6, 30, "肉类", "staff001", ""),
-                ("p004", "辣椒", 3.2, 80, "蔬菜", "staff001", ""),
-                ("p005", "面包", 4.5, 60, "食品", "staff001", ""),
-                ("p006", "胡萝卜", 2.8, 70, "蔬菜", "staff001", ""),
-                ("p007", "快餐面", 5.0, 120, "食品", "staff001", ""),
-                ("p008", "牙膏", 9.9, 90, "日用品", "staff001", ""),
-                ("p009", "洗发水", 25.8, 40, "日用品", "staff001", ""),
-                ("p010", "笔记本", 8.5, 75, "文具", "staff001", "")
-            ]
-            cursor.executemany('INSERT INTO products VALUES (?, ?, ?, ?, ?, ?, ?)', product_list)
-        
-        # 销售表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS sales (
-                sale_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                product_id TEXT NOT NULL,
-                product_name TEXT NOT NULL,
-                quantity INTEGER NOT NULL,
-                unit_price REAL NOT NULL,
-                total_price REAL NOT NULL,
-                sale_date TEXT NOT NULL,
-                FOREIGN KEY (product_id) REFERENCES products(product_id)
-            )
-        ''')
-        
-        # 库存操作表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS inventory_operations (
-                operation_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                product_id TEXT NOT NULL,
-                operation_type TEXT NOT NULL,
-                quantity INTEGER NOT NULL,
-                operation_date TEXT NOT NULL,
-                staff_id TEXT NOT NULL,
-                notes TEXT,
-                FOREIGN KEY (product_id) REFERENCES products(product_id),
-                FOREIGN KEY (staff_id) REFERENCES staff(staff_id)
-            )
-        ''')
-        
-        self._update_table_structure(cursor, "users")
-        conn.commit()
-        conn.close()
-    
-    def _update_table_structure(self, cursor, table_name):
-        if table_name == "users":
-            cursor.execute(f"PRAGMA table_info({table_name})")
-            columns = [col[1] for col in cursor.fetchall()]
-            if "staff_id" not in columns:
-                cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN staff_id TEXT")
-            if "role" not in columns:
-                cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN role TEXT DEFAULT 'user'")
-
-# ===================== 数据访问对象 =====================
-class UserDAO:
-    def __init__(self, db_manager):
-        self.db_manager = db_manager
-    
-    def get_user(self, username):
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT u.username, u.password, u.role, u.staff_id, s.name, s.position 
-            FROM users u 
-            LEFT JOIN staff s ON u.staff_id = s.staff_id 
-            WHERE u.username = ?
-        ''', (username,))
-        user = cursor.fetchone()
-        conn.close()
-        return user
-    
-    def add_user_with_staff(self, username, password, staff_id, role="user"):
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        try:
-            if not cursor.execute("SELECT staff_id FROM staff WHERE staff_id = ?", (staff_id,)).fetchone():
-                return False, "员工ID不存在"
-            cursor.execute('INSERT INTO users VALUES (?, ?, ?, ?)', (username, password, staff_id, role))
-            conn.commit()
-            return True, "注册成功"
-        except sqlite3.IntegrityError:
-            return False, "用户名已存在"
-        finally:
-            conn.close()
-
-class ProductDAO:
-    def __init__(self, db_manager):
-        self.db_manager = db_manager
-    
-    def get_all_products(self):
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT p.product_id, p.name, p.price, p.quantity, p.category, 
-                   p.staff_id, s.name, p.photo_path
-            FROM products p
-            LEFT JOIN staff s ON p.staff_id = s.staff_id
-        ''')
-        products = cursor.fetchall()
-        conn.close()
-        return products
-    
-    def get_product(self, product_id):
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT p.product_id, p.name, p.price, p.quantity, p.category, 
-                   p.staff_id, s.name, p.photo_path
-            FROM products p
-            LEFT JOIN staff s ON p.staff_id = s.staff_id
-            WHERE p.product_id = ?
-        ''', (product_id,))
-        product = cursor.fetchone()
-        conn.close()
-        return product
-    
-    def add_product(self, product_id, name, price, quantity, category, staff_id, photo_path=""):
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        try:
-            cursor.execute('INSERT INTO products VALUES (?, ?, ?, ?, ?, ?, ?)', 
-                          (product_id, name, price, quantity, category, staff_id, photo_path))
-            conn.commit()
-            return True
-        except sqlite3.IntegrityError:
-            return False
-        finally:
-            conn.close()
-    
-    def update_product(self, product_id, name, price, quantity, category, staff_id, photo_path=""):
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE products 
-            SET name = ?, price = ?, quantity = ?, category = ?, staff_id = ?, photo_path = ?
-            WHERE product_id = ?
-        ''', (name, price, quantity, category, staff_id, photo_path, product_id))
-        conn.commit()
-        row_count = cursor.rowcount
-        conn.close()
-        return row_count > 0
-    
-    def delete_product(self, product_id):
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM products WHERE product_id = ?", (product_id,))
-        conn.commit()
-        row_count = cursor.rowcount
-        conn.close()
-        return row_count > 0
-    
-    def update_product_quantity(self, product_id, quantity_change):
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("UPDATE products SET quantity = quantity + ? WHERE product_id = ?", 
-                      (quantity_change, product_id))
-        conn.commit()
-        row_count = cursor.rowcount
-        conn.close()
-        return row_count > 0
-    
-    def get_products_below_warning_threshold(self, threshold):
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT product_id, name, quantity FROM products WHERE quantity <= ?', (threshold,))
-        products = cursor.fetchall()
-        conn.close()
-        return products
-
-class SalesDAO:
-    def __init__(self, db_manager):
-        self.db_manager = db_manager
-    
-    def get_all_sales(self):
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM sales ORDER BY sale_date DESC")
-        sales = cursor.fetchall()
-        conn.close()
-        return sales
-    
-    def add_sale(self, product_id, product_name, quantity, unit_price, total_price):
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        sale_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        cursor.execute('INSERT INTO sales VALUES (NULL, ?, ?, ?, ?, ?, ?)', 
-                      (product_id, product_name, quantity, unit_price, total_price, sale_date))
-        conn.commit()
-        conn.close()
-        return True
-
-class InventoryDAO:
-    def __init__(self, db_manager):
-        self.db_manager = db_manager
-    
-    def add_operation(self, product_id, operation_type, quantity, staff_id, notes=""):
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        operation_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        cursor.execute('INSERT INTO inventory_operations VALUES (NULL, ?, ?, ?, ?, ?, ?)', 
-                      (product_id, operation_type, quantity, operation_date, staff_id, notes))
-        conn.commit()
-        conn.close()
-        return True
-    
-    def get_all_operations(self):
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT 
-                io.operation_id, 
-                io.product_id, 
-                p.name, 
-                io.operation_type, 
-                io.quantity,
-                io.operation_date, 
-                s.name, 
-                io.notes,
-                (SELECT SUM(CASE WHEN io2.operation_type = 'in' THEN io2.quantity ELSE -io2.quantity END) 
-                 FROM inventory_operations io2 
-                 WHERE io2.product_id = io.product_id AND io2.operation_date <= io.operation_date)
-            FROM inventory_operations io
-            LEFT JOIN products p ON io.product_id = p.product_id
-            LEFT JOIN staff s ON io.staff_id = s.staff_id
-            ORDER BY io.operation_date DESC
-        ''')
-        operations = cursor.fetchall()
-        conn.close()
-        return operations
-
-class StaffDAO:
-    def __init__(self, db_manager):
-        self.db_manager = db_manager
-    
-    def get_all_staff(self):
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM staff")
-        staff = cursor.fetchall()
-        conn.close()
-        return staff
-
 # ===================== 全局初始化 =====================
-db_manager = DatabaseManager()
+# 当前会话的门店：登录后固定为登录时所选门店，登录前取地址参数 store 或登录页的选择（默认第一家）
+stores = store_registry.load_stores()
+try:
+    current_store = store_registry.get_store(st.session_state.get("store_id") or st.query_params.get("store")
+                                             or st.session_state.get("login_store"))
+except ValueError as e:
+    st.error(str(e))
+    st.stop()
+if REPORT_REPLICA_FILE:
+    replica_base, replica_ext = os.path.splitext(REPORT_REPLICA_FILE)
+    store_replica_file = f"{replica_base}-{current_store.store_id}{replica_ext}" if len(stores) > 1 else REPORT_REPLICA_FILE
+else:
+    store_replica_file = None
+db_manager = DatabaseManager(current_store.db_path, current_store.photo_dir, store_replica_file)
 user_dao = UserDAO(db_manager)
 product_dao = ProductDAO(db_manager)
 sales_dao = SalesDAO(db_manager)
 inventory_dao = InventoryDAO(db_manager)
 staff_dao = StaffDAO(db_manager)
+# 收银终端编号（区分各终端的收银日志）：地址参数 terminal，默认为本机名
+TERMINAL_ID = re.sub(r"[^\w.-]", "_", st.query_params.get("terminal") or socket.gethostname())
 
 # 会话状态初始化
 if "logged_in" not in st.session_state:
@@ -522,6 +313,7 @@ def auto_login_from_url():
         user = user_dao.get_user(username)
         if user:
             st.session_state.logged_in = True
+            st.session_state.store_id = current_store.store_id
             st.session_state.user_info = {
                 "username": user[0],
                 "role": user[2],
@@ -543,6 +335,9 @@ def login_page():
         col1, col2, col3 = st.columns([1, 2, 1])
         with col2:
             st.subheader("用户登录")
+            if len(stores) > 1:
+                st.selectbox("门店", [store.store_id for store in stores], key="login_store",
+                             format_func=lambda store_id: store_registry.get_store(store_id).name)
             username = st.text_input("用户名", placeholder="请输入用户名")
             password = st.text_input("密码", placeholder="请输入密码", type="password")
             
@@ -555,6 +350,7 @@ def login_page():
                         user = user_dao.get_user(username)
                         if user and user[1] == password:
                             st.session_state.logged_in = True
+                            st.session_state.store_id = current_store.store_id
                             st.session_state.user_info = {
                                 "username": user[0],
                                 "role": user[2],
@@ -605,465 +401,832 @@ def login_page():
                         st.rerun()
 
 # ===================== 主系统页面 =====================
-def main_system():
-    st.markdown(f"""
-        <div style="background-color: {PRIMARY_COLOR}; padding: 1rem 2rem; border-radius: 12px; margin-bottom: 2rem; box-shadow: 0 2px 10px rgba(0,0,0,0.1);">
-            <div style="display: flex; justify-content: space-between; align-items: center;">
-                <h1 style="color: white; margin: 0; font-size: 24px;">小商店进销存管理系统</h1>
-                <div style="color: white; font-size: 14px; background-color: rgba(255,255,255,0.1); padding: 0.5rem 1rem; border-radius: 6px;">
-                    当前用户：{st.session_state.user_info['staff_name']}（{st.session_state.user_info['position']}）
-                </div>
-            </div>
-        </div>
-    """, unsafe_allow_html=True)
-    
-    tab1, tab2, tab3, tab4 = st.tabs(["📦 商品管理", "💵 销售管理", "📊 库存管理", "📈 报表统计"])
+# 商品管理
+def load_product_form():
+    """把商品当前信息与版本号载入维护表单（按钮回调，在控件重新创建之前修改其状态）"""
+    snapshot = product_dao.get_product_snapshot(st.session_state["product_id"].strip())
+    st.session_state["product_snapshot"] = snapshot
+    if not snapshot:
+        st.session_state["product_form_error"] = "商品不存在！"
+        return
+    st.session_state.update({
+        "product_name": snapshot["name"],
+        "product_price": snapshot["price"],
+        "product_quantity": snapshot["quantity"],
+        "product_category": snapshot["category"],
+        "product_barcode": snapshot["barcode"] or "",
+        "product_reorder_point": snapshot["reorder_point"] or 0,
+    })
+    staff_option = next((f"{s[0]} - {s[1]}" for s in staff_dao.get_all_staff() if s[0] == snapshot["staff_id"]), None)
+    if staff_option:
+        st.session_state["product_staff_select"] = staff_option
+
+def refresh_product_feed():
+    """按变更日志增量更新本会话缓存的商品列表：其他收银台与会话的改动只重新读取变化的行，返回最新的 DataFrame"""
+    import pandas as pd
+    key = f"product_feed:{current_store.store_id}"
+    feed = st.session_state.get(key)
+    changes = product_dao.get_product_changes(feed["seq"] if feed else None)
+    if changes.full:
+        frame = changes.frame
+    elif changes.frame is None:
+        return feed["frame"]
+    else:
+        frame = feed["frame"].set_index("product_id").drop(index=changes.deleted, errors="ignore")
+        changed = changes.frame.set_index("product_id")
+        existing = changed.index.isin(frame.index)
+        frame.loc[changed.index[existing]] = changed[existing]
+        frame = pd.concat([frame, changed[~existing]]).reset_index()
+    st.session_state[key] = {"seq": changes.seq, "frame": frame}
+    return frame
+
+@st.fragment(run_every=CHANGE_FEED_INTERVAL)
+def product_list():
+    """商品列表：定时只刷新本片段，库存等改动无需整页重新运行即可显示"""
+    products = refresh_product_feed()
+    if products.empty:
+        st.info("暂无商品数据，请添加商品！")
+        return
+    page = page_of(products, "product_list_page")
+    product_df = page.assign(
+        stock_status=stock_status(page["quantity"], page["reorder_point"], page["warning_level"]),
+        barcode=page["barcode"].fillna(""),
+    )[["product_id", "name", "price", "quantity", "stock_status", "category", "staff_name", "barcode", "reorder_point"]]
     
-    # 商品管理
-    with tab1:
-        st.markdown('<div class="main-title">商品管理</div>', unsafe_allow_html=True)
-        col_form, col_list = st.columns([1, 2], gap="large")
-        
-        with col_form:
-            with st.container(border=True):
-                st.subheader("商品信息维护")
-                product_id = st.text_input("商品ID", key="product_id")
-                product_name = st.text_input("商品名称", key="product_name")
-                product_price = st.number_input("商品价格", min_value=0.01, step=0.01, format="%.2f", key="product_price")
-                product_quantity = st.number_input("商品数量", min_value=1, step=1, key="product_quantity")
-                product_category = st.text_input("商品类别", key="product_category")
-                
-                staff_list = staff_dao.get_all_staff()
-                staff_options = [f"{s[0]} - {s[1]}" for s in staff_list]
-                selected_staff = st.selectbox("录入人员", staff_options, key="product_staff_select") if staff_options else None
-                staff_id = selected_staff.split(" - ")[0] if selected_staff else ""
-                
-                st.subheader("商品图片配置")
-                uploaded_photo = st.file_uploader("上传新商品照片", key="product_photo_upload")
-                existing_photos = [f for f in os.listdir(PHOTO_DIR) if f.endswith((".jpg", ".jpeg", ".png", ".bmp"))] if os.path.exists(PHOTO_DIR) else []
-                selected_photo = st.selectbox("选择已有图片", [""] + existing_photos, key="select_existing_photo")
+    st.dataframe(
+        product_df,
+        column_config=PRODUCT_COLUMN_CONFIG,
+        use_container_width=True,
+        hide_index=True
+    )
 
-                photo_path = ""
-                if selected_photo and product_id:
-                    photo_path = os.path.join(PHOTO_DIR, selected_photo)
-                    st.success(f"已选择图片：{selected_photo}")
-                elif uploaded_photo and product_id:
-                    photo_filename = f"{product_id}_{uploaded_photo.name}"
-                    photo_path = os.path.join(PHOTO_DIR, photo_filename)
-                    with open(photo_path, "wb") as f:
-                        f.write(uploaded_photo.getbuffer())
-                    st.success(f"图片上传成功：{photo_filename}")
-                
-                st.markdown('<div class="btn-group">', unsafe_allow_html=True)
-                col_btn1, col_btn2, col_btn3, col_btn4 = st.columns(4, gap="small")
+def product_management_page():
+    st.markdown('<div class="main-title">商品管理</div>', unsafe_allow_html=True)
+    col_form, col_list = st.columns([1, 2], gap="large")
+    
+    with col_form:
+        with st.container(border=True):
+            st.subheader("商品信息维护")
+            form_error = st.session_state.pop("product_form_error", None)
+            if form_error:
+                st.error(form_error)
+            product_id = st.text_input("商品ID", key="product_id")
+            st.button("加载商品", key="load_product_btn", on_click=load_product_form,
+                      help="读取商品当前信息后再修改，保存时会检查期间是否有他人修改")
+            snapshot = st.session_state.get("product_snapshot")
+            if snapshot and snapshot["product_id"] == product_id.strip():
+                st.caption(f"已加载商品 {snapshot['product_id']}（版本 {snapshot['version']}）")
+            product_name = st.text_input("商品名称", key="product_name")
+            product_price = st.number_input("商品价格", min_value=0.01, step=0.01, format="%.2f", key="product_price")
+            product_quantity = st.number_input("商品数量", min_value=0, step=1, key="product_quantity")
+            product_category = st.text_input("商品类别", key="product_category")
+            product_barcode = st.text_input("商品条码", key="product_barcode", placeholder="可选，扫码枪录入")
+            product_reorder_point = st.number_input("补货阈值", min_value=0, step=1, key="product_reorder_point",
+                                                    help="库存低于等于该值时进入库存预警，0 表示使用类别默认值")
+            
+            staff_list = staff_dao.get_all_staff()
+            staff_options = [f"{s[0]} - {s[1]}" for s in staff_list]
+            selected_staff = st.selectbox("录入人员", staff_options, key="product_staff_select") if staff_options else None
+            staff_id = selected_staff.split(" - ")[0] if selected_staff else ""
+            
+            st.subheader("商品图片配置")
+            uploaded_photo = st.file_uploader("上传新商品照片", key="product_photo_upload")
+            existing_photos = [f for f in os.listdir(db_manager.photo_dir) if f.endswith((".jpg", ".jpeg", ".png", ".bmp"))] if os.path.exists(db_manager.photo_dir) else []
+            selected_photo = st.selectbox("选择已有图片", [""] + existing_photos, key="select_existing_photo")
 
-                with col_btn1:
-                    if st.button("添加商品", use_container_width=True, key="add_product_btn"):
-                        if all([product_id, product_name, product_category, staff_id]):
-                            if product_dao.add_product(product_id, product_name, product_price, product_quantity, product_category, staff_id, photo_path):
-                                st.success("商品添加成功！")
-                                st.rerun()
-                            else:
-                                st.error("商品ID已存在！")
-                        else:
-                            st.error("请填写完整信息！")
+            photo_path = ""
+            if selected_photo and product_id:
+                photo_path = os.path.join(db_manager.photo_dir, selected_photo)
+                st.success(f"已选择图片：{selected_photo}")
+            elif uploaded_photo and product_id:
+                photo_filename = f"{product_id}_{uploaded_photo.name}"
+                photo_path = os.path.join(db_manager.photo_dir, photo_filename)
+                with open(photo_path, "wb") as f:
+                    f.write(uploaded_photo.getbuffer())
+                st.success(f"图片上传成功：{photo_filename}")
+            
+            st.markdown('<div class="btn-group">', unsafe_allow_html=True)
+            col_btn1, col_btn2, col_btn3, col_btn4 = st.columns(4, gap="small")
 
-                with col_btn2:
-                    if st.button("更新商品", use_container_width=True, key="update_product_btn"):
-                        if all([product_id, product_name, product_category, staff_id]):
-                            if product_dao.update_product(product_id, product_name, product_price, product_quantity, product_category, staff_id, photo_path):
-                                st.success("商品更新成功！")
-                                st.rerun()
-                            else:
-                                st.error("商品不存在！")
+            with col_btn1:
+                if st.button("添加商品", use_container_width=True, key="add_product_btn"):
+                    if all([product_id, product_name, product_category, staff_id]):
+                        if product_dao.add_product(product_id, product_name, product_price, product_quantity, product_category, staff_id, photo_path, product_barcode.strip(), product_reorder_point or None):
+                            st.success("商品添加成功！")
+                            st.rerun()
                         else:
-                            st.error("请填写完整信息！")
+                            st.error("商品ID或条码已存在！")
+                    else:
+                        st.error("请填写完整信息！")
 
-                with col_btn3:
-                    if st.button("删除商品", use_container_width=True, key="delete_product_btn"):
-                        if product_id:
-                            st.session_state["delete_product_id"] = product_id
-                            st.session_state["delete_confirmed"] = False
+            with col_btn2:
+                if st.button("更新商品", use_container_width=True, key="update_product_btn"):
+                    if not all([product_id, product_name, product_category, staff_id]):
+                        st.error("请填写完整信息！")
+                    elif not snapshot or snapshot["product_id"] != product_id.strip():
+                        st.error("请先点击「加载商品」读取当前信息再修改！")
+                    else:
+                        # 只提交与加载时不同的字段；库存按差值调整，不会覆盖期间发生的销售扣减
+                        edited = {
+                            "name": product_name,
+                            "price": round(product_price, 2),
+                            "category": product_category,
+                            "staff_id": staff_id,
+                            "barcode": product_barcode.strip() or None,
+                            "reorder_point": product_reorder_point or None,
+                        }
+                        if photo_path:
+                            edited["photo_path"] = photo_path
+                        changes = {k: v for k, v in edited.items() if v != snapshot[k]}
+                        status, _ = product_dao.update_product(snapshot["product_id"], snapshot["version"], changes,
+                                                               product_quantity - snapshot["quantity"])
+                        if status == UPDATE_OK:
+                            st.session_state["product_snapshot"] = product_dao.get_product_snapshot(snapshot["product_id"])
+                            st.success("商品更新成功！")
                             st.rerun()
+                        elif status == UPDATE_CONFLICT:
+                            st.error("该商品在加载后已被他人修改（或库存已不足以扣减），未保存任何修改。请重新加载最新信息后再保存。")
+                            st.button("重新加载", key="reload_product_btn", on_click=load_product_form)
+                        elif status == UPDATE_DUPLICATE:
+                            st.error("条码已被其他商品使用！")
                         else:
-                            st.error("请输入商品ID！")
+                            st.error("商品不存在！")
 
-                with col_btn4:
-                    if st.button("清空表单", use_container_width=True, key="clear_product_form_btn"):
-                        st.session_state["delete_product_id"] = None
+            with col_btn3:
+                if st.button("删除商品", use_container_width=True, key="delete_product_btn"):
+                    if product_id:
+                        st.session_state["delete_product_id"] = product_id
                         st.session_state["delete_confirmed"] = False
                         st.rerun()
-                st.markdown('</div>', unsafe_allow_html=True)
+                    else:
+                        st.error("请输入商品ID！")
 
-                # 删除确认逻辑
-                if st.session_state["delete_product_id"]:
-                    confirm_dialog(
-                        "确定要删除该商品吗？此操作不可恢复！",
-                        key_suffix=f"delete_{st.session_state['delete_product_id']}",
-                        target_state="delete_confirmed"
-                    )
+            with col_btn4:
+                if st.button("清空表单", use_container_width=True, key="clear_product_form_btn"):
+                    st.session_state["delete_product_id"] = None
+                    st.session_state["delete_confirmed"] = False
+                    st.rerun()
+            st.markdown('</div>', unsafe_allow_html=True)
 
-                if st.session_state["delete_confirmed"] and st.session_state["delete_product_id"]:
-                    product_id_to_delete = st.session_state["delete_product_id"]
-                    try:
-                        product_info = product_dao.get_product(product_id_to_delete)
-                        if product_info and product_info[7] and os.path.exists(product_info[7]):
-                            os.remove(product_info[7])
-                        if product_dao.delete_product(product_id_to_delete):
-                            st.success("商品删除成功！")
-                        else:
-                            st.error("商品不存在！")
-                    except Exception as e:
-                        st.error(f"删除失败：{str(e)}")
-                    finally:
-                        st.session_state["delete_product_id"] = None
-                        st.session_state["delete_confirmed"] = False
-                        st.rerun()
-        
-        with col_list:
-            with st.container(border=True):
-                st.subheader("商品列表")
-                products = product_dao.get_all_products()
-                if products:
-                    product_data = []
-                    for p in products:
-                        product_data.append({
-                            "商品ID": p[0],
-                            "商品名称": p[1],
-                            "单价(¥)": f"{p[2]:.2f}",
-                            "库存数量": p[3],
-                            "商品类别": p[4],
-                            "录入人员": p[6]
-                        })
-                    product_df = pd.DataFrame(product_data)
-                    
-                    def highlight_low_stock(val):
-                        if val <= 5:
-                            return f'background-color: #f8d7da; color: #721c24; font-weight: 500;'
-                        elif val <= 30:
-                            return f'background-color: #fff3cd; color: #856404; font-weight: 500;'
-                        else:
-                            return f'background-color: #d4edda; color: #155724; font-weight: 500;'
-                    
-                    st.dataframe(
-                        product_df.style.applymap(highlight_low_stock, subset=["库存数量"]),
-                        use_container_width=True,
-                        hide_index=True
-                    )
-                    
-                    st.subheader("所有商品图片展示")
-                    products_with_photo = [p for p in products if p[7] and os.path.exists(p[7])]
-                    if products_with_photo:
-                        with st.container(height=350, border=True):
-                            cols_per_row = 3
-                            rows = (len(products_with_photo) + cols_per_row - 1) // cols_per_row
-                            
-                            for row in range(rows):
-                                start_idx = row * cols_per_row
-                                end_idx = min(start_idx + cols_per_row, len(products_with_photo))
-                                row_products = products_with_photo[start_idx:end_idx]
-                                
-                                cols = st.columns(len(row_products))
-                                for col, product in zip(cols, row_products):
-                                    with col:
-                                        st.markdown('<div class="product-photo-card">', unsafe_allow_html=True)
-                                        st.image(product[7], caption=product[1], width=120)
-                                        st.write(f"商品ID：{product[0]}")
-                                        st.write(f"价格：¥{product[2]:.2f}")
-                                        st.markdown('</div>', unsafe_allow_html=True)
+            # 删除确认逻辑
+            if st.session_state["delete_product_id"]:
+                confirm_dialog(
+                    "确定要删除该商品吗？此操作不可恢复！",
+                    key_suffix=f"delete_{st.session_state['delete_product_id']}",
+                    target_state="delete_confirmed"
+                )
+
+            if st.session_state["delete_confirmed"] and st.session_state["delete_product_id"]:
+                product_id_to_delete = st.session_state["delete_product_id"]
+                try:
+                    product_info = product_dao.get_product(product_id_to_delete)
+                    if product_info and product_info[7] and os.path.exists(product_info[7]):
+                        os.remove(product_info[7])
+                    if product_dao.delete_product(product_id_to_delete):
+                        st.success("商品删除成功！")
                     else:
-                        st.info("暂无商品上传图片，请先为商品添加照片！")
+                        st.error("商品不存在！")
+                except Exception as e:
+                    st.error(f"删除失败：{str(e)}")
+                finally:
+                    st.session_state["delete_product_id"] = None
+                    st.session_state["delete_confirmed"] = False
+                    st.rerun()
+    
+    with col_list:
+        with st.container(border=True):
+            st.subheader("商品列表")
+            product_list()
+            products = st.session_state[f"product_feed:{current_store.store_id}"]["frame"]  # 沿用片段刚刷新的列表
+            if not products.empty:
+                st.subheader("所有商品图片展示")
+                products_with_photo = [p for p in products.itertuples(index=False) if p.photo_path and os.path.exists(p.photo_path)]
+                if products_with_photo:
+                    with st.container(height=350, border=True):
+                        cols_per_row = 3
+                        rows = (len(products_with_photo) + cols_per_row - 1) // cols_per_row
+                        
+                        for row in range(rows):
+                            start_idx = row * cols_per_row
+                            end_idx = min(start_idx + cols_per_row, len(products_with_photo))
+                            row_products = products_with_photo[start_idx:end_idx]
+                            
+                            cols = st.columns(len(row_products))
+                            for col, product in zip(cols, row_products):
+                                with col:
+                                    st.markdown('<div class="product-photo-card">', unsafe_allow_html=True)
+                                    st.image(product[7], caption=product[1], width=120)
+                                    st.write(f"商品ID：{product[0]}")
+                                    st.write(f"价格：¥{product[2]:.2f}")
+                                    st.markdown('</div>', unsafe_allow_html=True)
                 else:
-                    st.info("暂无商品数据，请添加商品！")
+                    st.info("暂无商品上传图片，请先为商品添加照片！")
+
+
+# 销售管理
+SALE_FORM_DEFAULTS = {"sale_product_id": "", "sale_quantity": 1}
+
+@st.fragment
+def sale_entry_form():
+    """销售录入表单：输入只重跑本片段，完成销售后再刷新整页以更新销售记录"""
+    if st.session_state.pop("sale_form_reset", False):
+        reset_form_state(SALE_FORM_DEFAULTS)
     
-    # 销售管理
-    with tab2:
-        st.markdown('<div class="main-title">销售管理</div>', unsafe_allow_html=True)
-        col_form, col_list = st.columns([1, 2], gap="large")
+    with st.container(border=True):
+        st.subheader("销售录入")
+        show_flash_message("sale_flash")
+        product_info = product_picker("sale_product_id")
+        if product_info:
+            st.success(f"找到商品：{product_info[1]}")
+            st.write(f"单价：¥{product_info[2]:.2f}")
+            st.write(f"当前库存：{product_info[3]}")
         
-        with col_form:
-            with st.container(border=True):
-                st.subheader("销售录入")
-                sale_product_id = st.text_input("商品ID", key="sale_product_id")
-                
-                product_info = None
-                if sale_product_id:
-                    product_info = product_dao.get_product(sale_product_id)
-                    if product_info:
-                        st.success(f"找到商品：{product_info[1]}")
-                        st.write(f"单价：¥{product_info[2]:.2f}")
-                        st.write(f"当前库存：{product_info[3]}")
+        sale_quantity = st.number_input("销售数量", min_value=1, step=1, key="sale_quantity")
+        total_price = product_info[2] * sale_quantity if product_info else 0.0
+        if product_info:
+            st.write(f"总价：¥{total_price:.2f}")
+        
+        st.markdown('<div class="btn-group">', unsafe_allow_html=True)
+        col_btn1, col_btn2 = st.columns(2, gap="small")
+        with col_btn1:
+            if st.button("完成销售", use_container_width=True, key="complete_sale_btn"):
+                if not product_info:
+                    st.error("请先选择有效商品！")
+                elif sale_quantity > product_info[3]:
+                    st.error(f"库存不足！当前库存：{product_info[3]}")
+                else:
+                    success, msg = sales_dao.checkout_or_journal([(product_info[0], product_info[1], sale_quantity, product_info[2])],
+                                                                  TERMINAL_ID)
+                    if success:
+                        st.session_state["sale_flash"] = f"{msg}！总价：¥{total_price:.2f}"
+                        st.session_state["sale_form_reset"] = True
+                        st.rerun(scope="app")
                     else:
-                        st.error("未找到该商品！")
-                
-                sale_quantity = st.number_input("销售数量", min_value=1, step=1, key="sale_quantity")
-                total_price = product_info[2] * sale_quantity if product_info else 0.0
-                if product_info:
-                    st.write(f"总价：¥{total_price:.2f}")
-                
-                st.markdown('<div class="btn-group">', unsafe_allow_html=True)
-                col_btn1, col_btn2 = st.columns(2, gap="small")
-                with col_btn1:
-                    if st.button("完成销售", use_container_width=True, key="complete_sale_btn"):
-                        if not sale_product_id or not product_info:
-                            st.error("请先选择有效商品！")
-                        elif sale_quantity > product_info[3]:
-                            st.error(f"库存不足！当前库存：{product_info[3]}")
-                        else:
-                            sales_dao.add_sale(sale_product_id, product_info[1], sale_quantity, product_info[2], total_price)
-                            product_dao.update_product_quantity(sale_product_id, -sale_quantity)
-                            st.success(f"销售成功！总价：¥{total_price:.2f}")
-                            st.rerun()
-                
-                with col_btn2:
-                    if st.button("清空表单", use_container_width=True, key="clear_sale_form_btn"):
-                        st.rerun()
-                st.markdown('</div>', unsafe_allow_html=True)
+                        st.error(msg)
+        
+        with col_btn2:
+            st.button("清空表单", use_container_width=True, key="clear_sale_form_btn",
+                      on_click=reset_form_state, args=(SALE_FORM_DEFAULTS,))
+        st.markdown('</div>', unsafe_allow_html=True)
+
+def sales_management_page():
+    st.markdown('<div class="main-title">销售管理</div>', unsafe_allow_html=True)
+    col_form, col_list = st.columns([1, 2], gap="large")
+    
+    with col_form:
+        sale_entry_form()
+    
+    with col_list:
+        with st.container(border=True):
+            st.subheader("销售记录")
+            sales = sales_dao.get_sales_frame()
+            if not sales.empty:
+                st.dataframe(sales, column_config=SALE_COLUMN_CONFIG, use_container_width=True, hide_index=True)
+            else:
+                st.info("暂无销售记录，请完成首次销售！")
+
+
+# 库存管理
+INVENTORY_FORM_DEFAULTS = {"inv_product_id": "", "inv_quantity": 1, "inv_notes": ""}
+
+@st.fragment
+def inventory_operation_form():
+    """库存操作表单：输入只重跑本片段，操作提交后再刷新整页以更新预警与操作记录"""
+    if st.session_state.pop("inv_form_reset", False):
+        reset_form_state(INVENTORY_FORM_DEFAULTS)
+    
+    with st.container(border=True):
+        st.subheader("库存操作")
+        show_flash_message("inv_flash")
+        inv_product_info = product_picker("inv_product_id")
+        if inv_product_info:
+            st.success(f"找到商品：{inv_product_info[1]}")
+            st.write(f"当前库存：{inv_product_info[3]}")
+        
+        operation_type = st.radio("操作类型", ["入库", "出库"], horizontal=True, key="inventory_op_type")
+        inv_quantity = st.number_input("操作数量", min_value=1, step=1, key="inv_quantity")
+        
+        staff_list = staff_dao.get_all_staff()
+        staff_options = [f"{s[0]} - {s[1]}" for s in staff_list]
+        selected_inv_staff = st.selectbox("操作人员", staff_options, key="inv_staff_select") if staff_options else None
+        inv_staff_id = selected_inv_staff.split(" - ")[0] if selected_inv_staff else ""
         
-        with col_list:
-            with st.container(border=True):
-                st.subheader("销售记录")
-                sales = sales_dao.get_all_sales()
-                if sales:
-                    sale_data = []
-                    for s in sales:
-                        sale_data.append({
-                            "销售ID": s[0],
-                            "商品ID": s[1],
-                            "商品名称": s[2],
-                            "销售数量": s[3],
-                            "单价(¥)": f"{s[4]:.2f}",
-                            "总价(¥)": f"{s[5]:.2f}",
-                            "销售时间": s[6]
-                        })
-                    sale_df = pd.DataFrame(sale_data)
-                    st.dataframe(sale_df, use_container_width=True, hide_index=True)
+        inv_notes = st.text_input("备注", key="inv_notes")
+        
+        st.markdown('<div class="btn-group">', unsafe_allow_html=True)
+        col_btn1, col_btn2 = st.columns(2, gap="small")
+        with col_btn1:
+            if st.button("执行操作", use_container_width=True, key="execute_inv_op_btn"):
+                if not inv_product_info or not inv_staff_id:
+                    st.error("请填写完整信息！")
+                elif operation_type == "出库" and inv_quantity > inv_product_info[3]:
+                    st.error(f"库存不足！当前库存：{inv_product_info[3]}")
                 else:
-                    st.info("暂无销售记录，请完成首次销售！")
+                    success, msg = inventory_dao.execute_operation(inv_product_info[0], "in" if operation_type == "入库" else "out",
+                                                                   inv_quantity, inv_staff_id, inv_notes)
+                    if success:
+                        st.session_state["inv_flash"] = f"{operation_type}操作成功！"
+                        st.session_state["inv_form_reset"] = True
+                        st.rerun(scope="app")
+                    else:
+                        st.error(msg)
+        
+        with col_btn2:
+            st.button("清空表单", use_container_width=True, key="clear_inv_form_btn",
+                      on_click=reset_form_state, args=(INVENTORY_FORM_DEFAULTS,))
+        st.markdown('</div>', unsafe_allow_html=True)
+
+def inventory_management_page():
+    import pandas as pd
+    from store_core import demand_forecast  # 依赖 numpy
+    st.markdown('<div class="main-title">库存管理</div>', unsafe_allow_html=True)
+    snapshot = product_dao.get_catalog_snapshot()
+    col_m1, col_m2, col_m3 = st.columns(3)
+    col_m1.metric("商品种类", f"{len(snapshot)}")
+    col_m2.metric("库存总价值", f"¥{snapshot.valuation():,.2f}")
+    col_m3.metric("有库存类别", f"{len(snapshot.category_totals())}")
+    
+    col_form, col_list = st.columns([1, 2], gap="large")
     
-    # 库存管理
-    with tab3:
-        st.markdown('<div class="main-title">库存管理</div>', unsafe_allow_html=True)
-        col_form, col_list = st.columns([1, 2], gap="large")
+    with col_form:
+        inventory_operation_form()
         
-        with col_form:
-            with st.container(border=True):
-                st.subheader("库存操作")
-                inv_product_id = st.text_input("商品ID", key="inv_product_id")
-                
-                inv_product_info = None
-                if inv_product_id:
-                    inv_product_info = product_dao.get_product(inv_product_id)
-                    if inv_product_info:
-                        st.success(f"找到商品：{inv_product_info[1]}")
-                        st.write(f"当前库存：{inv_product_info[3]}")
+        with st.container(border=True):
+            st.subheader("库存预警")
+            warning_products = product_dao.get_stock_alerts()
+            if warning_products:
+                st.warning("⚠️ 以下商品库存已低于补货阈值，请及时补货：")
+                for p in warning_products:
+                    st.write(f"• {p[0]} - {p[1]}（当前库存：{p[2]}，补货阈值：{p[3]}）")
+            else:
+                st.success("✅ 所有商品库存充足，无需补货")
+        
+        with st.container(border=True):
+            st.subheader("类别补货阈值")
+            thresholds = inventory_dao.get_category_thresholds()
+            if thresholds:
+                st.dataframe(pd.DataFrame(thresholds, columns=["商品类别", "补货阈值", "预警线"]), use_container_width=True, hide_index=True)
+            else:
+                st.caption(f"未设置类别阈值，默认补货阈值 {DEFAULT_REORDER_POINT}，预警线 {DEFAULT_WARNING_LEVEL}")
+            threshold_category = st.text_input("商品类别", key="threshold_category")
+            col_t1, col_t2 = st.columns(2, gap="small")
+            with col_t1:
+                threshold_reorder = st.number_input("补货阈值", min_value=0, step=1, value=DEFAULT_REORDER_POINT, key="threshold_reorder")
+            with col_t2:
+                threshold_warning = st.number_input("预警线", min_value=0, step=1, value=DEFAULT_WARNING_LEVEL, key="threshold_warning")
+            col_btn1, col_btn2 = st.columns(2, gap="small")
+            with col_btn1:
+                if st.button("保存阈值", use_container_width=True, key="save_threshold_btn"):
+                    if not threshold_category:
+                        st.error("请输入商品类别！")
                     else:
-                        st.error("未找到该商品！")
-                
-                operation_type = st.radio("操作类型", ["入库", "出库"], horizontal=True, key="inventory_op_type")
-                inv_quantity = st.number_input("操作数量", min_value=1, step=1, key="inv_quantity")
-                
-                staff_list = staff_dao.get_all_staff()
-                staff_options = [f"{s[0]} - {s[1]}" for s in staff_list]
-                selected_inv_staff = st.selectbox("操作人员", staff_options, key="inv_staff_select") if staff_options else None
-                inv_staff_id = selected_inv_staff.split(" - ")[0] if selected_inv_staff else ""
-                
-                inv_notes = st.text_input("备注", key="inv_notes")
-                
-                st.markdown('<div class="btn-group">', unsafe_allow_html=True)
-                col_btn1, col_btn2 = st.columns(2, gap="small")
-                with col_btn1:
-                    if st.button("执行操作", use_container_width=True, key="execute_inv_op_btn"):
-                        if not inv_product_id or not inv_product_info or not inv_staff_id:
-                            st.error("请填写完整信息！")
-                        elif operation_type == "出库" and inv_quantity > inv_product_info[3]:
-                            st.error(f"库存不足！当前库存：{inv_product_info[3]}")
-                        else:
-                            quantity_change = inv_quantity if operation_type == "入库" else -inv_quantity
-                            product_dao.update_product_quantity(inv_product_id, quantity_change)
-                            inventory_dao.add_operation(inv_product_id, "in" if operation_type == "入库" else "out", inv_quantity, inv_staff_id, inv_notes)
-                            st.success(f"{operation_type}操作成功！")
-                            st.rerun()
-                
-                with col_btn2:
-                    if st.button("清空表单", use_container_width=True, key="clear_inv_form_btn"):
+                        inventory_dao.set_category_threshold(threshold_category, threshold_reorder, threshold_warning)
                         st.rerun()
-                st.markdown('</div>', unsafe_allow_html=True)
-            
-            with st.container(border=True):
-                st.subheader("库存预警")
-                warning_products = product_dao.get_products_below_warning_threshold(5)
-                if warning_products:
-                    st.warning("⚠️ 以下商品库存严重不足（≤5件），请及时补货：")
-                    for p in warning_products:
-                        st.write(f"• {p[0]} - {p[1]}（当前库存：{p[2]}）")
-                else:
-                    st.success("✅ 所有商品库存充足，无需补货")
+            with col_btn2:
+                if st.button("恢复默认", use_container_width=True, key="delete_threshold_btn"):
+                    if threshold_category and inventory_dao.delete_category_threshold(threshold_category):
+                        st.rerun()
+                    else:
+                        st.error("该类别未设置阈值！")
         
-        with col_list:
-            with st.container(border=True):
-                st.subheader("库存操作记录")
-                operations = inventory_dao.get_all_operations()
-                if operations:
-                    op_data = []
-                    for op in operations:
-                        op_type = "入库" if op[3] == "in" else "出库"
-                        op_data.append({
-                            "操作ID": op[0],
-                            "商品ID": op[1],
-                            "商品名称": op[2],
-                            "操作类型": op_type,
-                            "操作数量": op[4],
-                            "操作后库存": op[8] if op[8] else 0,
-                            "操作时间": op[5],
-                            "操作人员": op[6],
-                            "备注": op[7] if op[7] else "无"
-                        })
-                    op_df = pd.DataFrame(op_data)
-                    
-                    def highlight_op_stock(val):
-                        if val <= 5:
-                            return f'background-color: #f8d7da; color: #721c24; font-weight: 500;'
-                        elif val <= 30:
-                            return f'background-color: #fff3cd; color: #856404; font-weight: 500;'
-                        else:
-                            return f'background-color: #d4edda; color: #155724; font-weight: 500;'
-                    
-                    st.dataframe(
-                        op_df.style.applymap(highlight_op_stock, subset=["操作后库存"]),
-                        use_container_width=True,
-                        hide_index=True
-                    )
+        with st.container(border=True):
+            st.subheader("历史库存查询")
+            col_d, col_t = st.columns(2, gap="small")
+            with col_d:
+                as_of_date = st.date_input("日期", key="stock_as_of_date")
+            with col_t:
+                as_of_time = st.time_input("时间", value=datetime.strptime("23:59", "%H:%M").time(), key="stock_as_of_time")
+            as_of_product = st.text_input("商品ID", key="stock_as_of_product", placeholder="留空查询全部商品")
+            if st.button("查询", use_container_width=True, key="stock_as_of_btn"):
+                as_of = datetime.combine(as_of_date, as_of_time)
+                result = inventory_dao.stock_as_of(as_of_product.strip() or None, as_of)
+                if result is None:
+                    st.info("该时刻早于库存流水的启用时间，暂无记录")
+                elif as_of_product.strip():
+                    st.metric(f"{as_of_product.strip()} 在 {as_of:%Y-%m-%d %H:%M} 的库存", result)
+                elif result:
+                    st.dataframe(pd.DataFrame(sorted(result.items()), columns=["商品ID", "库存数量"]),
+                                 use_container_width=True, hide_index=True)
                 else:
-                    st.info("暂无库存操作记录，请执行库存操作！")
+                    st.info("该时刻没有库存")
     
-    # 报表统计
-    with tab4:
-        st.markdown('<div class="main-title">报表统计</div>', unsafe_allow_html=True)
-        
-        report_type = st.radio("选择报表类型", ["销售报表", "库存报表"], horizontal=True, key="report_type_select")
+    with col_list:
+        with st.container(border=True):
+            st.subheader("补货建议")
+            if st.button("重新计算需求预测", use_container_width=True, key="run_forecast_btn"):
+                with st.spinner("正在根据销售历史计算需求预测..."):
+                    summary = inventory_dao.run_demand_forecast()
+                st.success(f"已完成 {summary['products']} 个商品的预测，用时 {summary['seconds']:.2f} 秒")
+            suggestions = inventory_dao.get_reorder_suggestions()
+            if suggestions:
+                suggestion_df = pd.DataFrame([
+                    {
+                        "商品ID": r[0],
+                        "商品名称": r[1],
+                        "当前库存": r[2],
+                        "日需求预测": round(r[3], 2),
+                        f"{demand_forecast.DEFAULT_WINDOW}日均销量": round(r[4], 2),
+                        "可售天数": r[5],
+                        "建议补货量": r[6]
+                    }
+                    for r in suggestions
+                ])
+                st.dataframe(suggestion_df, use_container_width=True, hide_index=True)
+                st.caption(f"预测时间：{suggestions[0][7]}")
+            else:
+                st.info("暂无补货建议，可点击上方按钮根据最新销售数据重新计算")
         
-        if st.button("生成报表", use_container_width=True, key="generate_report_btn"):
-            if report_type == "销售报表":
-                sales = sales_dao.get_all_sales()
-                if not sales:
-                    st.error("暂无销售数据，无法生成报表！")
-                else:
-                    sale_df = pd.DataFrame(sales, columns=['sale_id', 'product_id', 'product_name', 'quantity', 'unit_price', 'total_price', 'sale_date'])
-                    sale_df['sale_date'] = pd.to_datetime(sale_df['sale_date'])
-                    
-                    plt.close('all')
-                    fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(14, 10))
-                    fig.suptitle("销售数据统计报表", fontsize=16, fontweight=600, y=0.98)
-                    
-                    daily_sales = sale_df.groupby(sale_df['sale_date'].dt.date)['total_price'].sum()
-                    ax1.plot(daily_sales.index, daily_sales.values, marker='o', color=SECONDARY_COLOR, linewidth=2, markersize=6)
-                    ax1.set_title("每日销售额趋势", fontweight=600)
-                    ax1.set_xlabel("日期")
-                    ax1.set_ylabel("销售额（¥）")
-                    ax1.tick_params(axis='x', rotation=45)
-                    ax1.grid(alpha=0.3)
-                    
-                    product_sales = sale_df.groupby('product_name')['quantity'].sum().sort_values(ascending=False).head(10)
-                    bars = ax2.bar(product_sales.index, product_sales.values, color=SUCCESS_COLOR, alpha=0.8)
-                    ax2.set_title("商品销售数量排行（TOP10）", fontweight=600)
-                    ax2.set_xlabel("商品名称")
-                    ax2.set_ylabel("销售数量")
-                    ax2.tick_params(axis='x', rotation=45)
-                    ax2.grid(alpha=0.3, axis='y')
-                    for bar in bars:
-                        height = bar.get_height()
-                        ax2.text(bar.get_x() + bar.get_width()/2., height + 0.5, f'{int(height)}', ha='center', va='bottom', fontsize=9)
-                    
-                    product_revenue = sale_df.groupby('product_name')['total_price'].sum().sort_values(ascending=False).head(5)
-                    colors = ['#3498db', '#2ecc71', '#f39c12', '#e74c3c', '#9b59b6']
-                    ax3.pie(product_revenue.values, labels=product_revenue.index, autopct='%1.1f%%', colors=colors, startangle=90)
-                    ax3.set_title("商品销售额占比（TOP5）", fontweight=600)
-                    
-                    hourly_sales = sale_df.groupby(sale_df['sale_date'].dt.hour)['total_price'].sum()
-                    bars = ax4.bar(hourly_sales.index, hourly_sales.values, color=WARNING_COLOR, alpha=0.8)
-                    ax4.set_title("销售时间分布（按小时）", fontweight=600)
-                    ax4.set_xlabel("小时")
-                    ax4.set_ylabel("销售额（¥）")
-                    ax4.grid(alpha=0.3, axis='y')
-                    for bar in bars:
-                        height = bar.get_height()
-                        ax4.text(bar.get_x() + bar.get_width()/2., height + 5, f'{int(height)}', ha='center', va='bottom', fontsize=9)
-                    
-                    plt.tight_layout()
-                    st.pyplot(fig)
-                    plt.close(fig)
-                    
-                    st.subheader("报表导出")
-                    col_export1, col_export2 = st.columns(2, gap="small")
-                    with col_export1:
-                        csv_data = sale_df.to_csv(index=False, encoding='utf-8-sig')
-                        st.download_button("导出CSV格式", data=csv_data, file_name=f"销售报表_{datetime.now().strftime('%Y%m%d')}.csv", mime="text/csv", use_container_width=True)
-                    with col_export2:
-                        excel_buffer = io.BytesIO()
-                        sale_df.to_excel(excel_buffer, index=False, engine='openpyxl')
-                        excel_buffer.seek(0)
-                        st.download_button("导出Excel格式", data=excel_buffer, file_name=f"销售报表_{datetime.now().strftime('%Y%m%d')}.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", use_container_width=True)
-            
+        with st.container(border=True):
+            st.subheader("库存操作记录")
+            operations = inventory_dao.get_operations_frame()
+            if not operations.empty:
+                page = page_of(operations, "operation_list_page")
+                op_df = page.assign(
+                    operation_type=page["operation_type"].map(OPERATION_TYPE_LABELS),
+                    notes=page["notes"].fillna("").replace("", "无"),
+                    stock_status=stock_status(page["balance"], page["reorder_point"], page["warning_level"]),
+                )[["operation_id", "product_id", "product_name", "operation_type", "quantity", "balance", "stock_status",
+                   "operation_date", "staff_name", "notes"]]
+                
+                st.dataframe(
+                    op_df,
+                    column_config=OPERATION_COLUMN_CONFIG,
+                    use_container_width=True,
+                    hide_index=True
+                )
             else:
-                products = product_dao.get_all_products()
-                if not products:
-                    st.error("暂无库存数据，无法生成报表！")
-                else:
-                    product_df = pd.DataFrame(products, columns=['product_id', 'name', 'price', 'quantity', 'category', 'staff_id', 'staff_name', 'photo_path'])
-                    product_df['stock_value'] = product_df['price'] * product_df['quantity']
-                    
-                    plt.close('all')
-                    fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(14, 10))
-                    fig.suptitle("库存数据统计报表", fontsize=16, fontweight=600, y=0.98)
-                    
-                    category_stock = product_df.groupby('category')['quantity'].sum()
-                    colors = ['#3498db', '#2ecc71', '#f39c12', '#e74c3c', '#9b59b6']
-                    ax1.pie(category_stock.values, labels=category_stock.index, autopct='%1.1f%%', colors=colors[:len(category_stock)], startangle=90)
-                    ax1.set_title("库存类别分布（按数量）", fontweight=600)
-                    
-                    top_value = product_df.nlargest(5, 'stock_value')
-                    bars = ax2.bar(top_value['name'], top_value['stock_value'], color=SECONDARY_COLOR, alpha=0.8)
-                    ax2.set_title("商品库存价值排行（TOP5）", fontweight=600)
-                    ax2.set_xlabel("商品名称")
-                    ax2.set_ylabel("库存价值（¥）")
-                    ax2.tick_params(axis='x', rotation=45)
-                    ax2.grid(alpha=0.3, axis='y')
-                    for bar in bars:
-                        height = bar.get_height()
-                        ax2.text(bar.get_x() + bar.get_width()/2., height + 5, f'{int(height)}', ha='center', va='bottom', fontsize=9)
-                    
-                    top_quantity = product_df.nlargest(5, 'quantity')
-                    bars = ax3.bar(top_quantity['name'], top_quantity['quantity'], color=SUCCESS_COLOR, alpha=0.8)
-                    ax3.set_title("商品库存数量排行（TOP5）", fontweight=600)
-                    ax3.set_xlabel("商品名称")
-                    ax3.set_ylabel("库存数量")
-                    ax3.tick_params(axis='x', rotation=45)
-                    ax3.grid(alpha=0.3, axis='y')
-                    for bar in bars:
-                        height = bar.get_height()
-                        ax3.text(bar.get_x() + bar.get_width()/2., height + 2, f'{int(height)}', ha='center', va='bottom', fontsize=9)
-                    
-                    ax4.hist(product_df['price'], bins=10, edgecolor='black', color=WARNING_COLOR, alpha=0.8)
-                    ax4.set_title("商品价格分布", fontweight=600)
-                    ax4.set_xlabel("价格（¥）")
-                    ax4.set_ylabel("商品数量")
-                    ax4.grid(alpha=0.3, axis='y')
-                    
-                    plt.tight_layout()
-                    st.pyplot(fig)
-                    plt.close(fig)
-                    
-                    st.subheader("报表导出")
-                    col_export1, col_export2 = st.columns(2, gap="small")
-                    with col_export1:
-                        csv_data = product_df.to_csv(index=False, encoding='utf-8-sig')
-                        st.download_button("导出CSV格式", data=csv_data, file_name=f"库存报表_{datetime.now().strftime('%Y%m%d')}.csv", mime="text/csv", use_container_width=True)
-                    with col_export2:
-                        excel_buffer = io.BytesIO()
-                        product_df.to_excel(excel_buffer, index=False, engine='openpyxl')
-                        excel_buffer.seek(0)
-                        st.download_button("导出Excel格式", data=excel_buffer, file_name=f"库存报表_{datetime.now().strftime('%Y%m%d')}.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", use_container_width=True)
+                st.info("暂无库存操作记录，请执行库存操作！")
+
+
+# 收银台
+@st.cache_resource
+def load_barcode_index(db_path):
+    """进程级条码索引，以门店数据库路径为键分别缓存、各门店互不混用：
+    by_barcode 为 条码 -> (商品ID, 名称, 单价)，barcodes 为 商品ID -> 条码，seq 为已应用的变更日志序号"""
+    return {"seq": None, "by_barcode": {}, "barcodes": {}, "lock": threading.Lock()}
+
+def lookup_barcode(code):
+    """按条码查商品：先按变更日志把缓存的索引补到最新，POS 接口、批量导入或其他进程改动的商品与价格同样生效"""
+    index = load_barcode_index(db_manager.db_name)
+    with index["lock"]:
+        seq, rows, deleted, full = product_dao.get_barcode_changes(index["seq"])
+        if full:
+            index["by_barcode"].clear()
+            index["barcodes"].clear()
+        for product_id in deleted + [row[0] for row in rows]:
+            barcode = index["barcodes"].pop(product_id, None)
+            if barcode is not None:
+                index["by_barcode"].pop(barcode, None)
+        for product_id, barcode, name, price in rows:
+            if barcode:
+                index["barcodes"][product_id] = barcode
+                index["by_barcode"][barcode] = (product_id, name, price)
+        index["seq"] = seq
+        return index["by_barcode"].get(code)
+
+def handle_pos_scan():
+    """扫码枪输入回车后的回调：查条码索引并加入购物车，随后清空输入框等待下一次扫码"""
+    code = st.session_state.pos_scan.strip()
+    st.session_state.pos_scan = ""
+    if not code:
+        return
+    entry = lookup_barcode(code)
+    if entry is None:
+        # 条码未登记时允许直接输入商品ID
+        product = product_dao.get_product(code)
+        entry = (product[0], product[1], product[2]) if product else None
+    if entry is None:
+        st.session_state.pos_message = ("error", f"未识别的条码：{code}")
+        return
+    product_id, name, price = entry
+    basket = st.session_state.pos_basket
+    if product_id in basket:
+        basket[product_id]["quantity"] += 1
+    else:
+        basket[product_id] = {"name": name, "price": price, "quantity": 1}
+    st.session_state.pos_last_scan.append(product_id)
+    st.session_state.pos_message = ("success", f"已扫描：{name}  ¥{price:.2f}")
+
+def undo_pos_scan():
+    if st.session_state.pos_last_scan:
+        product_id = st.session_state.pos_last_scan.pop()
+        basket = st.session_state.pos_basket
+        basket[product_id]["quantity"] -= 1
+        if basket[product_id]["quantity"] <= 0:
+            del basket[product_id]
+
+def clear_pos_basket():
+    st.session_state.pos_basket = {}
+    st.session_state.pos_last_scan = []
+    st.session_state.pos_message = None
+
+def checkout_pos_basket():
+    basket = st.session_state.pos_basket
+    items = [(pid, item["name"], item["quantity"], item["price"]) for pid, item in basket.items()]
+    total = sum(item["price"] * item["quantity"] for item in basket.values())
+    success, msg = sales_dao.checkout_or_journal(items, TERMINAL_ID)
+    if success:
+        clear_pos_basket()
+        st.session_state.pos_message = ("success", f"{msg}！合计：¥{total:.2f}")
+    else:
+        st.session_state.pos_message = ("error", msg)
+
+@st.fragment
+def pos_terminal():
+    """收银台：扫码只重跑本片段，购物车保存在会话状态中，结算时一次性写入数据库"""
+    if "pos_basket" not in st.session_state:
+        clear_pos_basket()
+    
+    col_scan, col_basket = st.columns([1, 2], gap="large")
+    with col_scan:
+        with st.container(border=True):
+            st.subheader("扫码")
+            st.text_input("条码 / 商品ID", key="pos_scan", on_change=handle_pos_scan,
+                          placeholder="将光标置于此处后扫码（回车结束）")
+            if st.session_state.pos_message:
+                level, message = st.session_state.pos_message
+                (st.success if level == "success" else st.error)(message)
+    
+    with col_basket:
+        with st.container(border=True):
+            st.subheader("购物车")
+            basket = st.session_state.pos_basket
+            if basket:
+                # 购物车只有几行，直接渲染为 Markdown 表格，收银台不必加载 pandas
+                rows = "".join(f"| {pid} | {item['name']} | {item['quantity']} | {item['price']:.2f} | "
+                               f"{item['price'] * item['quantity']:.2f} |\n" for pid, item in basket.items())
+                st.markdown("| 商品ID | 商品名称 | 数量 | 单价(¥) | 小计(¥) |\n|---|---|--:|--:|--:|\n" + rows)
+                total = sum(item["price"] * item["quantity"] for item in basket.values())
+                st.markdown(f"### 合计：¥{total:.2f}")
+            else:
+                st.info("购物车为空，请扫码添加商品")
+            
+            col_btn1, col_btn2, col_btn3 = st.columns(3, gap="small")
+            with col_btn1:
+                st.button("结算", use_container_width=True, key="pos_checkout_btn", disabled=not basket,
+                          on_click=checkout_pos_basket)
+            with col_btn2:
+                st.button("撤销上一件", use_container_width=True, key="pos_undo_btn", on_click=undo_pos_scan)
+            with col_btn3:
+                st.button("清空购物车", use_container_width=True, key="pos_clear_btn", on_click=clear_pos_basket)
+
+def pos_page():
+    st.markdown('<div class="main-title">收银台</div>', unsafe_allow_html=True)
+    pos_terminal()
+
+
+# 报表统计
+def new_report_figure():
+    from matplotlib.figure import Figure
+    return Figure(figsize=(14, 10))
+
+def render_report_figure(fig):
+    fig.tight_layout()
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=100)
+    return buffer.getvalue()
+
+def export_report_tables(df):
+    excel_buffer = io.BytesIO()
+    df.to_excel(excel_buffer, index=False, engine='openpyxl')
+    return df.to_csv(index=False, encoding='utf-8-sig'), excel_buffer.getvalue()
+
+def build_sales_report(job):
+    """后台任务：生成销售报表（图表PNG + CSV/Excel），使用 Figure 接口以便在工作线程中安全绘图"""
+    job.update(0.1, "读取销售数据")
+    sale_df = sales_dao.get_sales_frame()
+    if sale_df.empty:
+        raise ValueError("暂无销售数据，无法生成报表！")
+    
+    job.update(0.3, "绘制图表")
+    fig = new_report_figure()
+    ((ax1, ax2), (ax3, ax4)) = fig.subplots(2, 2)
+    fig.suptitle("销售数据统计报表", fontsize=16, fontweight=600, y=0.98)
+    
+    daily_sales = sale_df.groupby(sale_df['sale_date'].dt.date)['total_price'].sum()
+    ax1.plot(daily_sales.index, daily_sales.values, marker='o', color=SECONDARY_COLOR, linewidth=2, markersize=6)
+    ax1.set_title("每日销售额趋势", fontweight=600)
+    ax1.set_xlabel("日期")
+    ax1.set_ylabel("销售额（¥）")
+    ax1.tick_params(axis='x', rotation=45)
+    ax1.grid(alpha=0.3)
+    
+    product_sales = sale_df.groupby('product_name')['quantity'].sum().sort_values(ascending=False).head(10)
+    bars = ax2.bar(product_sales.index, product_sales.values, color=SUCCESS_COLOR, alpha=0.8)
+    ax2.set_title("商品销售数量排行（TOP10）", fontweight=600)
+    ax2.set_xlabel("商品名称")
+    ax2.set_ylabel("销售数量")
+    ax2.tick_params(axis='x', rotation=45)
+    ax2.grid(alpha=0.3, axis='y')
+    for bar in bars:
+        height = bar.get_height()
+        ax2.text(bar.get_x() + bar.get_width()/2., height + 0.5, f'{int(height)}', ha='center', va='bottom', fontsize=9)
+    
+    product_revenue = sale_df.groupby('product_name')['total_price'].sum().sort_values(ascending=False).head(5)
+    colors = ['#3498db', '#2ecc71', '#f39c12', '#e74c3c', '#9b59b6']
+    ax3.pie(product_revenue.values, labels=product_revenue.index, autopct='%1.1f%%', colors=colors, startangle=90)
+    ax3.set_title("商品销售额占比（TOP5）", fontweight=600)
+    
+    hourly_sales = sale_df.groupby(sale_df['sale_date'].dt.hour)['total_price'].sum()
+    bars = ax4.bar(hourly_sales.index, hourly_sales.values, color=WARNING_COLOR, alpha=0.8)
+    ax4.set_title("销售时间分布（按小时）", fontweight=600)
+    ax4.set_xlabel("小时")
+    ax4.set_ylabel("销售额（¥）")
+    ax4.grid(alpha=0.3, axis='y')
+    for bar in bars:
+        height = bar.get_height()
+        ax4.text(bar.get_x() + bar.get_width()/2., height + 5, f'{int(height)}', ha='center', va='bottom', fontsize=9)
+    
+    job.update(0.7, "渲染图表")
+    image = render_report_figure(fig)
+    job.update(0.85, "生成导出文件")
+    csv_data, excel_data = export_report_tables(sale_df)
+    return {"title": "销售报表", "image": image, "csv": csv_data, "excel": excel_data}
+
+def build_inventory_report(job):
+    """后台任务：生成库存报表（图表PNG + CSV/Excel）；图表统计直接取自商品目录列式快照"""
+    job.update(0.1, "读取库存数据")
+    snapshot = product_dao.get_catalog_snapshot()
+    if not len(snapshot):
+        raise ValueError("暂无库存数据，无法生成报表！")
+    
+    job.update(0.3, "绘制图表")
+    fig = new_report_figure()
+    ((ax1, ax2), (ax3, ax4)) = fig.subplots(2, 2)
+    fig.suptitle("库存数据统计报表", fontsize=16, fontweight=600, y=0.98)
+    
+    category_stock = snapshot.category_totals("quantity")
+    colors = ['#3498db', '#2ecc71', '#f39c12', '#e74c3c', '#9b59b6']
+    ax1.pie(list(category_stock.values()), labels=list(category_stock.keys()), autopct='%1.1f%%', colors=colors[:len(category_stock)], startangle=90)
+    ax1.set_title("库存类别分布（按数量）", fontweight=600)
+    
+    top_value = snapshot.top_n(5, by="value")
+    bars = ax2.bar([t[1] for t in top_value], [t[2] for t in top_value], color=SECONDARY_COLOR, alpha=0.8)
+    ax2.set_title("商品库存价值排行（TOP5）", fontweight=600)
+    ax2.set_xlabel("商品名称")
+    ax2.set_ylabel("库存价值（¥）")
+    ax2.tick_params(axis='x', rotation=45)
+    ax2.grid(alpha=0.3, axis='y')
+    for bar in bars:
+        height = bar.get_height()
+        ax2.text(bar.get_x() + bar.get_width()/2., height + 5, f'{int(height)}', ha='center', va='bottom', fontsize=9)
+    
+    top_quantity = snapshot.top_n(5, by="quantity")
+    bars = ax3.bar([t[1] for t in top_quantity], [t[2] for t in top_quantity], color=SUCCESS_COLOR, alpha=0.8)
+    ax3.set_title("商品库存数量排行（TOP5）", fontweight=600)
+    ax3.set_xlabel("商品名称")
+    ax3.set_ylabel("库存数量")
+    ax3.tick_params(axis='x', rotation=45)
+    ax3.grid(alpha=0.3, axis='y')
+    for bar in bars:
+        height = bar.get_height()
+        ax3.text(bar.get_x() + bar.get_width()/2., height + 2, f'{int(height)}', ha='center', va='bottom', fontsize=9)
+    
+    ax4.hist(snapshot.prices(), bins=10, edgecolor='black', color=WARNING_COLOR, alpha=0.8)
+    ax4.set_title("商品价格分布", fontweight=600)
+    ax4.set_xlabel("价格（¥）")
+    ax4.set_ylabel("商品数量")
+    ax4.grid(alpha=0.3, axis='y')
+    
+    job.update(0.7, "渲染图表")
+    image = render_report_figure(fig)
+    job.update(0.85, "生成导出文件")
+    product_df = product_dao.get_products_frame()
+    product_df['stock_value'] = product_df['price'] * product_df['quantity']
+    csv_data, excel_data = export_report_tables(product_df)
+    return {"title": "库存报表", "image": image, "csv": csv_data, "excel": excel_data}
+
+def build_chain_report(job):
+    """后台任务：连锁汇总报表，各门店在进程池中并行汇总后合并"""
+    import pandas as pd
+    job.update(0.1, f"并行汇总 {len(stores)} 家门店")
+    sales = consolidated_report.consolidate(stores, "sales")
+    job.update(0.4, "汇总库存")
+    inventory = consolidated_report.consolidate(stores, "inventory", reorder_default=DEFAULT_REORDER_POINT)
+    if not sales["stores"] and not inventory["stores"]:
+        raise ValueError("；".join(f"{k}：{v}" for k, v in sales["errors"].items()) or "没有可汇总的门店")
+    
+    rows = []
+    for store in stores:
+        sale = sales["stores"].get(store.store_id, {})
+        stock = inventory["stores"].get(store.store_id, {})
+        rows.append({"store_id": store.store_id, "store_name": store.name,
+                     "orders": sale.get("orders"), "sold_quantity": sale.get("quantity"), "revenue": sale.get("revenue"),
+                     "products": stock.get("products"), "stock_value": stock.get("value"), "low_stock": stock.get("low_stock"),
+                     "error": sales["errors"].get(store.store_id) or inventory["errors"].get(store.store_id) or ""})
+    total_sales, total_stock = sales["total"], inventory["total"]
+    rows.append({"store_id": "", "store_name": "连锁合计", "orders": total_sales.get("orders", 0),
+                 "sold_quantity": total_sales.get("quantity", 0), "revenue": total_sales.get("revenue", 0),
+                 "products": total_stock.get("products", 0), "stock_value": total_stock.get("value", 0),
+                 "low_stock": total_stock.get("low_stock", 0), "error": ""})
+    chain_df = pd.DataFrame(rows)
+    
+    job.update(0.6, "绘制图表")
+    fig = new_report_figure()
+    ((ax1, ax2), (ax3, ax4)) = fig.subplots(2, 2)
+    fig.suptitle(f"连锁汇总报表（销售汇总耗时 {sales['seconds']} 秒）", fontsize=16, fontweight=600, y=0.98)
+    
+    store_df = chain_df.iloc[:-1].fillna(0)
+    ax1.bar(store_df["store_name"], store_df["revenue"], color=SECONDARY_COLOR, alpha=0.8)
+    ax1.set_title("各门店销售额", fontweight=600)
+    ax1.set_ylabel("销售额（¥）")
+    ax1.grid(alpha=0.3, axis='y')
+    
+    daily = sorted(total_sales.get("by_day", {}).items())[-30:]
+    ax2.plot([d for d, _ in daily], [v["revenue"] for _, v in daily], marker='o', color=SUCCESS_COLOR, linewidth=2, markersize=4)
+    ax2.set_title("连锁每日销售额（近30天）", fontweight=600)
+    ax2.tick_params(axis='x', rotation=45)
+    ax2.grid(alpha=0.3)
+    
+    categories = sorted(total_sales.get("by_category", {}).items(), key=lambda item: item[1]["revenue"], reverse=True)[:5]
+    colors = ['#3498db', '#2ecc71', '#f39c12', '#e74c3c', '#9b59b6']
+    ax3.pie([v["revenue"] for _, v in categories], labels=[c for c, _ in categories], autopct='%1.1f%%', colors=colors[:len(categories)], startangle=90)
+    ax3.set_title("类别销售额占比（TOP5）", fontweight=600)
+    
+    ax4.bar(store_df["store_name"], store_df["stock_value"], color=WARNING_COLOR, alpha=0.8)
+    ax4.set_title("各门店库存价值", fontweight=600)
+    ax4.set_ylabel("库存价值（¥）")
+    ax4.grid(alpha=0.3, axis='y')
+    
+    job.update(0.8, "渲染图表")
+    image = render_report_figure(fig)
+    job.update(0.9, "生成导出文件")
+    csv_data, excel_data = export_report_tables(chain_df)
+    return {"title": "连锁汇总报表", "image": image, "csv": csv_data, "excel": excel_data}
+
+def run_report(job, builder):
+    """报表的全部查询在同一只读快照（或副本文件）上执行，既看到一致的数据，也不占用收银的写入通道"""
+    with db_manager.read_snapshot(replica=True):
+        return builder(job)
+
+REPORT_BUILDERS = {"销售报表": build_sales_report, "库存报表": build_inventory_report}
+if len(stores) > 1:
+    REPORT_BUILDERS["连锁汇总"] = build_chain_report
+
+@st.fragment(run_every=1)
+def report_job_progress(job):
+    """每秒轮询一次后台任务状态，完成后整页刷新以展示结果"""
+    if job.finished:
+        st.rerun()
+    st.progress(job.progress, text=f"{job.title}：{job.message}")
+
+def show_report_result(job):
+    if job.status == job_runner.FAILED:
+        st.error(job.error)
+        return
+    report = job.result
+    st.image(report["image"], use_container_width=True)
+    
+    st.subheader("报表导出")
+    col_export1, col_export2 = st.columns(2, gap="small")
+    with col_export1:
+        st.download_button("导出CSV格式", data=report["csv"], file_name=f"{report['title']}_{datetime.now().strftime('%Y%m%d')}.csv", mime="text/csv", use_container_width=True)
+    with col_export2:
+        st.download_button("导出Excel格式", data=report["excel"], file_name=f"{report['title']}_{datetime.now().strftime('%Y%m%d')}.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", use_container_width=True)
+
+def report_statistics_page():
+    st.markdown('<div class="main-title">报表统计</div>', unsafe_allow_html=True)
+    
+    report_type = st.radio("选择报表类型", list(REPORT_BUILDERS), horizontal=True, key="report_type_select")
+    
+    if st.button("生成报表", use_container_width=True, key="generate_report_btn"):
+        setup_matplotlib_font()
+        # 同一数据库的同类报表在生成期间只执行一次，其他会话的相同请求复用该任务
+        job = job_runner.get_runner().submit(("report", report_type, db_manager.db_name),
+                                             run_report, REPORT_BUILDERS[report_type], title=report_type)
+        st.session_state.report_job_id = job.job_id
+    
+    job_id = st.session_state.get("report_job_id")
+    job = job_runner.get_runner().get(job_id) if job_id else None
+    if job is None:
+        return
+    if job.finished:
+        show_report_result(job)
+    else:
+        report_job_progress(job)
+
+
+def main_system():
+    st.markdown(f"""
+        <div style="background-color: {PRIMARY_COLOR}; padding: 1rem 2rem; border-radius: 12px; margin-bottom: 2rem; box-shadow: 0 2px 10px rgba(0,0,0,0.1);">
+            <div style="display: flex; justify-content: space-between; align-items: center;">
+                <h1 style="color: white; margin: 0; font-size: 24px;">小商店进销存管理系统</h1>
+                <div style="color: white; font-size: 14px; background-color: rgba(255,255,255,0.1); padding: 0.5rem 1rem; border-radius: 6px;">
+                    {current_store.name + "｜" if len(stores) > 1 else ""}当前用户：{st.session_state.user_info['staff_name']}（{st.session_state.user_info['position']}）
+                </div>
+            </div>
+        </div>
+    """, unsafe_allow_html=True)
+    
+    # 仅运行当前页面的查询与控件，切换页面前其余页面不会执行
+    pages = [
+        st.Page(product_management_page, title="商品管理", icon="📦", url_path="products", default=True),
+        st.Page(pos_page, title="收银台", icon="🧾", url_path="pos"),
+        st.Page(sales_management_page, title="销售管理", icon="💵", url_path="sales"),
+        st.Page(inventory_management_page, title="库存管理", icon="📊", url_path="inventory"),
+        st.Page(report_statistics_page, title="报表统计", icon="📈", url_path="reports"),
+    ]
+    st.navigation(pages, position="top").run()
     
     st.markdown("---")
     col_logout = st.columns([10, 1])
@@ -1073,6 +1236,7 @@ def main_system():
             st.query_params.clear()
             st.session_state.logged_in = False
             st.session_state.user_info = None
+            st.session_state.pop("store_id", None)
             st.rerun()
         st.markdown('</div>', unsafe_allow_html=True)
 